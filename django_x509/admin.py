@@ -1,11 +1,14 @@
+from django import forms
 from django.contrib import admin
 from django.contrib.admin import ModelAdmin as BaseAdmin
 from django.contrib.admin.templatetags.admin_static import static
+from django.contrib.admin.views.main import ChangeList
 from django.core.urlresolvers import reverse
 from django.utils.html import format_html
 from django.utils.translation import ugettext_lazy as _
 
-from .models import Ca, Cert
+from .models import Ca, Cert, CertProfile, Revocation
+from .routers import replica_view
 
 
 class AbstractAdmin(BaseAdmin):
@@ -15,6 +18,7 @@ class AbstractAdmin(BaseAdmin):
     list_display = ['name',
                     'key_length',
                     'digest',
+                    'status',
                     'created',
                     'modified']
     search_fields = ('name', 'serial_number', 'common_name')
@@ -35,13 +39,23 @@ class AbstractAdmin(BaseAdmin):
                      'certificate',
                      'private_key')
 
-    class Media:
-        css = {'all': (static('django-x509/css/admin.css'),)}
-
     def __init__(self, *args, **kwargs):
-        self.readonly_fields += ('created', 'modified')
+        self.readonly_fields += ('status', 'created', 'modified')
         super(AbstractAdmin, self).__init__(*args, **kwargs)
 
+    @property
+    def media(self):
+        # static() is resolved when the admin is rendered rather than at
+        # class definition time, keeping the staticfiles storage setup
+        # out of processes which import this module but never use it
+        css = {'all': (static('django-x509/css/admin.css'),)}
+        return super(AbstractAdmin, self).media + forms.Media(css=css)
+
+    def changelist_view(self, request, extra_context=None):
+        # changelists are read-only, actions are sent with POST requests
+        view = replica_view(super(AbstractAdmin, self).changelist_view)
+        return view(request, extra_context)
+
     def get_readonly_fields(self, request, obj=None):
         # edit
         if obj:
@@ -58,19 +72,45 @@ class AbstractAdmin(BaseAdmin):
         return fields
 
 
+class CaChangeList(ChangeList):
+    """
+    counts the revoked certificates of the CAs
+    of the page in the revocation ledger
+    """
+    def get_results(self, request):
+        super(CaChangeList, self).get_results(request)
+        cas = list(self.result_list)
+        counts = Revocation.objects.filter(ca__in=[ca.pk for ca in cas]).active().counts()
+        for ca in cas:
+            ca.revoked_count = counts.get(ca.pk, 0)
+
+
 class CaAdmin(AbstractAdmin):
-    list_filter = ('key_length', 'digest', 'created',)
+    list_filter = ('key_length', 'digest', 'status', 'created',)
+    list_select_related = ('parent',)
+    readonly_fields = ('predecessor',)
+
+    def get_changelist(self, request, **kwargs):
+        return CaChangeList
+
+    def revoked_count(self, obj):
+        return obj.revoked_count
+    revoked_count.short_description = _('revoked')
 
 
 class CertAdmin(AbstractAdmin):
-    list_filter = ('ca', 'revoked', 'key_length', 'digest', 'created',)
+    list_filter = ('ca', 'revoked', 'status', 'key_length', 'digest', 'created',)
     list_select_related = ('ca',)
-    readonly_fields = ('revoked', 'revoked_at',)
+    readonly_fields = ('profile', 'predecessor', 'idempotency_key', 'revoked', 'revoked_at',)
     fields = ['name',
               'ca',
+              'profile',
+              'predecessor',
+              'idempotency_key',
               'notes',
               'revoked',
               'revoked_at',
+              'status',
               'key_length',
               'digest',
               'validity_start',
@@ -98,7 +138,8 @@ class CertAdmin(AbstractAdmin):
 
     def revoke_action(self, request, queryset):
         rows = 0
-        for cert in queryset:
+        # pending and failed certificates can't be revoked
+        for cert in queryset.filter(status='issued'):
             cert.revoke()
             rows += 1
         if rows == 1:
@@ -111,6 +152,23 @@ class CertAdmin(AbstractAdmin):
     revoke_action.short_description = _('Revoke selected certificates')
 
 
+class CertProfileAdmin(BaseAdmin):
+    list_display = ['name',
+                    'key_length',
+                    'digest',
+                    'validity',
+                    'created',
+                    'modified']
+    search_fields = ('name',)
+    readonly_fields = ('created', 'modified')
+    save_on_top = True
+
+
+CaAdmin.list_display = AbstractAdmin.list_display[:]
+CaAdmin.list_display.insert(1, 'parent')
+CaAdmin.list_display.insert(4, 'revoked_count')
+CaAdmin.readonly_edit = AbstractAdmin.readonly_edit[:]
+CaAdmin.readonly_edit += ('parent',)
 CertAdmin.list_display = AbstractAdmin.list_display[:]
 CertAdmin.list_display.insert(1, 'ca_url')
 CertAdmin.list_display.insert(4, 'serial_number')
@@ -120,3 +178,4 @@ CertAdmin.readonly_edit += ('ca',)
 
 admin.site.register(Ca, CaAdmin)
 admin.site.register(Cert, CertAdmin)
+admin.site.register(CertProfile, CertProfileAdmin)
@@ -0,0 +1,159 @@
+"""
+Signature audit of stored certificates
+
+Verifies that every certificate has really been signed by its CA
+and that its private key matches the public key of the certificate
+(validity periods are not checked: expired certificates, and the
+certificates of expired CAs, pass the audit if their signatures do).
+Rows are read in chunks of constant size (keyset pagination on the
+primary key) and verified in a pool of worker processes, each of
+which keeps a cache of the CA verification stores.
+"""
+import multiprocessing
+from collections import OrderedDict
+from timeit import default_timer
+
+from .backends import get_backend
+from .backends.base import VerificationError
+from .models import Ca, Cert
+
+SIGNATURE_ERROR = 'signature'
+KEY_MISMATCH = 'key_mismatch'
+PARSE_ERROR = 'parse_error'
+MISSING_CA = 'missing_ca'
+
+# CA certificates (ca_id: (PEM, chain PEM)) available in worker processes
+_ca_certificates = {}
+_cas = {}
+
+
+def _init_worker(ca_certificates):
+    global _ca_certificates
+    _ca_certificates = ca_certificates
+    _cas.clear()
+
+
+def _get_ca(ca_id):
+    ca = _cas.get(ca_id)
+    if ca is None and ca_id in _ca_certificates:
+        certificate, chain = _ca_certificates[ca_id]
+        ca = _cas[ca_id] = Ca(pk=ca_id, certificate=certificate, chain=chain)
+    return ca
+
+
+def audit_chunk(rows):
+    """
+    audits a list of ``(id, ca_id, certificate, private_key)`` rows
+    and returns ``(audited, failures)``, where failures is a list of
+    ``(id, ca_id, problem, detail)`` tuples
+    """
+    backend = get_backend()
+    failures = []
+    for pk, ca_id, certificate, private_key in rows:
+        ca = _get_ca(ca_id)
+        if ca is None:
+            failures.append((pk, ca_id, MISSING_CA, 'CA not found'))
+            continue
+        cert = Cert(pk=pk, certificate=certificate, private_key=private_key)
+        try:
+            backend.verify(cert, ca, check_time=False)
+        except VerificationError as e:
+            failures.append((pk, ca_id, SIGNATURE_ERROR, str(e)))
+            continue
+        except Exception as e:
+            failures.append((pk, ca_id, PARSE_ERROR, str(e)))
+            continue
+        # certificates issued for signing requests have no private key
+        if not private_key:
+            continue
+        try:
+            if not backend.key_matches(cert):
+                failures.append((pk, ca_id, KEY_MISMATCH, 'private key does not match certificate'))
+        except Exception as e:
+            failures.append((pk, ca_id, PARSE_ERROR, str(e)))
+    return len(rows), failures
+
+
+def iter_chunks(queryset, chunk_size):
+    """
+    yields lists of ``(id, ca_id, certificate, private_key)``
+    rows of ``queryset`` using keyset pagination
+    """
+    last_pk = None
+    while True:
+        qs = queryset.order_by('pk')
+        if last_pk is not None:
+            qs = qs.filter(pk__gt=last_pk)
+        rows = list(qs.values_list('pk', 'ca_id', 'certificate', 'private_key')[:chunk_size])
+        if not rows:
+            break
+        yield rows
+        last_pk = rows[-1][0]
+
+
+def audit_certs(queryset=None, processes=None, chunk_size=500, progress=None):
+    """
+    audits the issued certificates in ``queryset`` (defaults to all
+    certificates) and returns a report dict; ``processes`` defaults
+    to the number of CPUs, ``progress`` is an optional callable which
+    receives the number of certificates audited so far
+    """
+    if queryset is None:
+        queryset = Cert.objects.all()
+    # pending and failed certificates have no certificate yet
+    queryset = queryset.filter(status='issued')
+    processes = processes or multiprocessing.cpu_count()
+    ca_ids = queryset.order_by().values_list('ca_id', flat=True).distinct()
+    ca_certificates = dict((pk, (certificate, chain)) for pk, certificate, chain in
+                           Ca.objects.filter(pk__in=list(ca_ids))
+                                     .values_list('pk', 'certificate', 'chain'))
+    start = default_timer()
+    audited = 0
+    failures = []
+
+    def collect(result):
+        count, chunk_failures = result
+        failures.extend(chunk_failures)
+        return count
+
+    if processes == 1:
+        _init_worker(ca_certificates)
+        for rows in iter_chunks(queryset, chunk_size):
+            audited += collect(audit_chunk(rows))
+            if progress:
+                progress(audited)
+    else:
+        # worker processes only receive PEM data and never use
+        # the database connections inherited from the parent
+        pool = multiprocessing.Pool(processes, _init_worker, (ca_certificates,))
+        try:
+            pending = []
+            for rows in iter_chunks(queryset, chunk_size):
+                pending.append(pool.apply_async(audit_chunk, (rows,)))
+                # keep a bounded amount of chunks in flight
+                while len(pending) >= processes * 2:
+                    audited += collect(pending.pop(0).get())
+                    if progress:
+                        progress(audited)
+            for result in pending:
+                audited += collect(result.get())
+                if progress:
+                    progress(audited)
+        finally:
+            pool.close()
+            pool.join()
+    elapsed = default_timer() - start
+    problems = (SIGNATURE_ERROR, KEY_MISMATCH, PARSE_ERROR, MISSING_CA)
+    counts = OrderedDict((problem, 0) for problem in problems)
+    for failure in failures:
+        counts[failure[2]] += 1
+    return OrderedDict((
+        ('audited', audited),
+        ('ok', audited - len(failures)),
+        ('failed', len(failures)),
+        ('problems', counts),
+        ('cas', len(ca_certificates)),
+        ('seconds', elapsed),
+        ('rate', audited / elapsed if elapsed else 0),
+        ('failures', sorted(failures)),
+    ))
@@ -0,0 +1,175 @@
+"""
+Authentication with client certificates issued by django-x509
+
+The TLS terminating proxy verifies the client certificate and
+forwards it in a request header (``DJANGO_X509_CLIENT_CERT_HEADER``);
+``get_client_cert`` maps it to the ``Cert`` row which has the
+same issuer, serial number and fingerprint.
+
+Results (including unknown certificates) and the users they
+authenticate are kept in in-process LRU caches with a TTL, which are
+invalidated when a certificate is revoked or deleted (and when a user
+is saved or deleted), hence requests made with known certificates
+don't cause database queries.
+"""
+import copy
+import hashlib
+from collections import namedtuple
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.x509.oid import NameOID
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.utils.six.moves.urllib.parse import unquote
+
+from . import settings as app_settings
+from .backends.cryptography import load_certificate
+from .models import Cert
+from .signals import cert_revoked
+from .utils import LRUCache
+
+
+class ClientCert(namedtuple('ClientCert', ['pk', 'ca_id', 'serial_number', 'common_name',
+                                           'fingerprint', 'revoked', 'validity_start',
+                                           'validity_end'])):
+    """
+    status of a client certificate, as stored in the cache
+    """
+    __slots__ = ()
+
+    def is_valid(self):
+        now = timezone.now()
+        return not self.revoked and \
+            (self.validity_start is None or self.validity_start <= now) and \
+            (self.validity_end is None or self.validity_end >= now)
+
+
+_cache = LRUCache(maxsize=app_settings.CLIENT_CERT_CACHE_SIZE,
+                  ttl=app_settings.CLIENT_CERT_CACHE_TTL)
+# pk: cache key of a certificate, bounded like the cache
+# (the status of an evicted key is kept at most until the TTL)
+_keys = LRUCache(maxsize=app_settings.CLIENT_CERT_CACHE_SIZE,
+                 ttl=app_settings.CLIENT_CERT_CACHE_TTL)
+# pk of a certificate: user authenticated by the certificate
+_users = LRUCache(maxsize=app_settings.CLIENT_CERT_CACHE_SIZE,
+                  ttl=app_settings.CLIENT_CERT_CACHE_TTL)
+_unknown = object()
+
+
+def normalize_pem(value):
+    """
+    converts the certificate forwarded by proxies to PEM
+    (nginx ``$ssl_client_escaped_cert`` is URL encoded,
+    ``$ssl_client_cert`` uses tabs as line separators)
+    """
+    if '%' in value:
+        value = unquote(value)
+    return value.replace('\t', '\n').strip()
+
+
+def fingerprint(certificate):
+    """
+    returns the SHA256 fingerprint of a ``cryptography`` certificate
+    """
+    return hashlib.sha256(certificate.public_bytes(serialization.Encoding.DER)).hexdigest()
+
+
+def _lookup(pem):
+    try:
+        presented = x509.load_pem_x509_certificate(pem.encode('ascii'), default_backend())
+    except (UnicodeError, ValueError):
+        return None
+    issuer_cn = presented.issuer.get_attributes_for_oid(NameOID.COMMON_NAME)
+    # pending and failed rows have no certificate
+    candidates = Cert.objects.filter(serial_number=presented.serial_number, status='issued')
+    if issuer_cn:
+        candidates = candidates.filter(ca__common_name=issuer_cn[0].value)
+    expected = fingerprint(presented)
+    for cert in candidates:
+        try:
+            certificate = load_certificate(cert.certificate)
+        except ValueError:
+            continue
+        if fingerprint(certificate) == expected:
+            return ClientCert(cert.pk, cert.ca_id, cert.serial_number, cert.common_name,
+                              expected, cert.revoked, cert.validity_start, cert.validity_end)
+    return None
+
+
+def get_client_cert(value):
+    """
+    returns a ``ClientCert`` for the PEM certificate ``value``
+    or ``None`` if the certificate is unknown
+    """
+    pem = normalize_pem(value)
+    client_cert = _cache.get(pem)
+    if client_cert is None:
+        client_cert = _lookup(pem)
+        _cache.set(pem, client_cert or _unknown)
+        if client_cert:
+            _keys.set(client_cert.pk, pem)
+    return None if client_cert is _unknown else client_cert
+
+
+def get_client_cert_user(client_cert):
+    """
+    returns the user authenticated by the valid ``ClientCert``
+    ``client_cert`` or ``None`` (cached)
+    """
+    user = _users.get(client_cert.pk)
+    if user is None:
+        user = authenticate(client_cert=client_cert)
+        _users.set(client_cert.pk, user or _unknown)
+    if user is _unknown:
+        return None
+    # cached users are shared by the requests of the process
+    return copy.copy(user)
+
+
+def invalidate(sender, instance, **kwargs):
+    """
+    removes the status of a certificate
+    and its user from the caches
+    """
+    _users.delete(instance.pk)
+    pem = _keys.get(instance.pk)
+    if pem is not None:
+        _keys.delete(instance.pk)
+        _cache.delete(pem)
+
+
+def invalidate_users(sender, **kwargs):
+    """
+    empties the cache of users when a user is saved or deleted
+    """
+    if sender._meta.label == settings.AUTH_USER_MODEL:
+        _users.clear()
+
+
+cert_revoked.connect(invalidate, dispatch_uid='django_x509_auth_revoked')
+post_delete.connect(invalidate, sender=Cert, dispatch_uid='django_x509_auth_deleted')
+post_save.connect(invalidate_users, dispatch_uid='django_x509_auth_user_saved')
+post_delete.connect(invalidate_users, dispatch_uid='django_x509_auth_user_deleted')
+
+
+class ClientCertificateBackend(ModelBackend):
+    """
+    authenticates the user whose username is the
+    common name of a valid client certificate
+    """
+    def authenticate(self, client_cert=None, **kwargs):
+        if client_cert is None or not client_cert.is_valid():
+            return None
+        User = get_user_model()
+        try:
+            user = User._default_manager.get_by_natural_key(client_cert.common_name)
+        except User.DoesNotExist:
+            return None
+        if getattr(user, 'is_active', True):
+            return user
+        return None
@@ -0,0 +1,18 @@
+from django.utils.module_loading import import_string
+
+from .. import settings as app_settings
+
+_backends = {}
+
+
+def get_backend(path=None):
+    """
+    returns an instance of the crypto backend specified
+    in ``path`` (defaults to ``DJANGO_X509_CRYPTO_BACKEND``);
+    instances are created once per process and reused
+    """
+    path = path or app_settings.CRYPTO_BACKEND
+    backend = _backends.get(path)
+    if backend is None:
+        backend = _backends[path] = import_string(path)()
+    return backend
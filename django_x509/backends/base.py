@@ -0,0 +1,117 @@
+class VerificationError(Exception):
+    """
+    raised by crypto backends when a certificate
+    is not signed by the expected CA
+    """
+    pass
+
+
+class BaseBackend(object):
+    """
+    Interface of crypto backends
+
+    Backends perform all the cryptographic operations needed by
+    ``AbstractX509`` and ``AbstractCa``; model instances are passed
+    to the methods which need to read their fields, PEM strings are
+    returned for anything that is stored in the database.
+    """
+    name = None
+
+    def generate_key(self, key_length):
+        """
+        generates and returns a new RSA private key
+        (in the native format of the backend)
+        """
+        raise NotImplementedError()
+
+    def dump_private_key(self, key):
+        """
+        returns ``key`` in PEM format
+        """
+        raise NotImplementedError()
+
+    def load_private_key(self, private_key):
+        """
+        parses the PEM private key ``private_key`` and returns
+        it in the native format of the backend
+        """
+        raise NotImplementedError()
+
+    def load_public_key(self, certificate):
+        """
+        returns the public key of the PEM certificate
+        ``certificate`` in the native format of the backend
+        """
+        raise NotImplementedError()
+
+    def load_csr(self, csr):
+        """
+        parses the PEM certificate signing request ``csr`` and returns
+        a ``(public_key, attrs)`` tuple in which ``public_key`` is in the
+        native format of the backend and ``attrs`` is a dict containing
+        the ``key_length`` and the subject fields of the request
+        (``country_code``, ``state``, ``city``, ``organization``,
+        ``email`` and ``common_name``); raises ``ValueError`` if the
+        request is not valid or if its signature is wrong
+        """
+        raise NotImplementedError()
+
+    def sign(self, instance, key, issuer=None):
+        """
+        builds the x509 certificate described by ``instance``
+        (subject, serial number, validity, digest and extensions)
+        for ``key`` (a private key, eg: returned by ``load_private_key``,
+        or the public key returned by ``load_csr``) and returns it in PEM format;
+        the certificate is signed by ``issuer`` (a CA model instance)
+        or self-signed with ``key`` if ``issuer`` is ``None``
+        """
+        raise NotImplementedError()
+
+    def compile_extensions(self, extensions):
+        """
+        converts ``extensions``, a list of ``(name, critical, value)``
+        tuples, to a list of objects which ``sign`` adds to certificates
+        as they are; the result is reused for many certificates
+        (see ``CertProfile``), hence it must not be modified by ``sign``
+        """
+        raise NotImplementedError()
+
+    def parse(self, instance):
+        """
+        parses ``instance.certificate`` and returns a dict containing
+        the values of the following model fields: ``key_length``,
+        ``digest``, ``validity_start``, ``validity_end``, ``country_code``,
+        ``state``, ``city``, ``organization``, ``email``, ``common_name``
+        and ``serial_number``
+        """
+        raise NotImplementedError()
+
+    def verify(self, instance, ca, check_time=True):
+        """
+        verifies ``instance.certificate`` has been signed by ``ca``,
+        raises ``VerificationError`` otherwise; the validity periods
+        of the certificate and of the chain of ``ca`` are checked
+        only if ``check_time`` is ``True``
+        """
+        raise NotImplementedError()
+
+    def key_matches(self, instance):
+        """
+        returns ``True`` if ``instance.private_key`` is the private
+        counterpart of the public key of ``instance.certificate``
+        """
+        raise NotImplementedError()
+
+    def build_crl(self, ca, revoked):
+        """
+        returns the CRL of ``ca`` in PEM format;
+        ``revoked`` is an iterable of
+        ``(serial_number, revocation_date, reason)`` tuples
+        """
+        raise NotImplementedError()
+
+    def dump_text(self, instance):
+        """
+        returns a text dump of ``instance.certificate``
+        """
+        raise NotImplementedError()
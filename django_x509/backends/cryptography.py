@@ -0,0 +1,344 @@
+from __future__ import absolute_import
+
+import ipaddress
+from datetime import timedelta
+
+import six
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+from django.utils import timezone
+from django.utils.lru_cache import lru_cache
+from OpenSSL import crypto
+
+from ..utils import bytes_compat
+from .base import BaseBackend, VerificationError
+from .pyopenssl import PEM_END, PyOpenSSLBackend
+
+# same order used by AbstractX509._fill_subject
+SUBJECT_OIDS = (
+    ('country_code', NameOID.COUNTRY_NAME),
+    ('state', NameOID.STATE_OR_PROVINCE_NAME),
+    ('city', NameOID.LOCALITY_NAME),
+    ('organization', NameOID.ORGANIZATION_NAME),
+    ('email', NameOID.EMAIL_ADDRESS),
+    ('common_name', NameOID.COMMON_NAME),
+)
+
+KEY_USAGE = {
+    'digitalSignature': 'digital_signature',
+    'nonRepudiation': 'content_commitment',
+    'keyEncipherment': 'key_encipherment',
+    'dataEncipherment': 'data_encipherment',
+    'keyAgreement': 'key_agreement',
+    'keyCertSign': 'key_cert_sign',
+    'cRLSign': 'crl_sign',
+    'encipherOnly': 'encipher_only',
+    'decipherOnly': 'decipher_only',
+}
+
+EXTENDED_KEY_USAGE = {
+    'serverAuth': ExtendedKeyUsageOID.SERVER_AUTH,
+    'clientAuth': ExtendedKeyUsageOID.CLIENT_AUTH,
+    'codeSigning': ExtendedKeyUsageOID.CODE_SIGNING,
+    'emailProtection': ExtendedKeyUsageOID.EMAIL_PROTECTION,
+    'timeStamping': ExtendedKeyUsageOID.TIME_STAMPING,
+    'OCSPSigning': ExtendedKeyUsageOID.OCSP_SIGNING,
+}
+
+CRL_REASONS = dict((flag.value, flag) for flag in x509.ReasonFlags)
+
+
+def _to_bytes(value):
+    if isinstance(value, six.text_type):
+        return value.encode('utf8')
+    return value
+
+
+def _naive_utc(value):
+    if timezone.is_aware(value):
+        value = timezone.make_naive(value, timezone.utc)
+    return value
+
+
+@lru_cache(maxsize=256)
+def load_certificate(pem):
+    """
+    parses a PEM certificate (cached)
+    """
+    return x509.load_pem_x509_certificate(_to_bytes(pem), default_backend())
+
+
+@lru_cache(maxsize=128)
+def load_chain(chain):
+    """
+    parses the PEM certificates of a chain (cached)
+    """
+    return [load_certificate(pem + PEM_END) for pem in chain.split(PEM_END) if pem.strip()]
+
+
+@lru_cache(maxsize=64)
+def load_private_key(pem):
+    """
+    parses a PEM private key (cached)
+    """
+    return serialization.load_pem_private_key(_to_bytes(pem), None, default_backend())
+
+
+def _hash(digest):
+    return getattr(hashes, str(digest).upper())()
+
+
+@lru_cache(maxsize=1)
+def _encoding_key():
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 1024)
+    return key
+
+
+def _openssl_extension(name, critical, value):
+    """
+    converts extensions which have no native equivalent in
+    ``cryptography`` by letting OpenSSL encode their value
+    (through a throwaway certificate signed with a cached key)
+    """
+    cert = crypto.X509()
+    cert.set_version(0x2)
+    cert.set_pubkey(_encoding_key())
+    cert.add_extensions([crypto.X509Extension(bytes_compat(name),
+                                              bool(critical),
+                                              bytes_compat(value))])
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(0)
+    cert.sign(_encoding_key(), 'sha256')
+    der = crypto.dump_certificate(crypto.FILETYPE_ASN1, cert)
+    return x509.load_der_x509_certificate(der, default_backend()).extensions[0].value
+
+
+def _general_name(value):
+    kind, value = value.split(':', 1)
+    kind = kind.strip().upper()
+    value = value.strip()
+    if kind == 'DNS':
+        return x509.DNSName(six.text_type(value))
+    if kind == 'IP':
+        return x509.IPAddress(ipaddress.ip_address(six.text_type(value)))
+    if kind == 'EMAIL':
+        return x509.RFC822Name(six.text_type(value))
+    if kind == 'URI':
+        return x509.UniformResourceIdentifier(six.text_type(value))
+    raise ValueError('Unsupported general name: {0}'.format(kind))
+
+
+def build_extension(name, critical, value):
+    """
+    converts an extension expressed in the OpenSSL configuration
+    syntax (eg: ``keyUsage``, ``cRLSign, keyCertSign``) to an
+    extension object accepted by ``cryptography``
+    """
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    if name == 'basicConstraints':
+        options = dict(item.split(':', 1) for item in items)
+        pathlen = options.get('pathlen')
+        return x509.BasicConstraints(ca=options.get('CA', '').upper() == 'TRUE',
+                                     path_length=int(pathlen) if pathlen is not None else None)
+    if name == 'keyUsage' and all(item in KEY_USAGE for item in items):
+        flags = dict((attr, False) for attr in KEY_USAGE.values())
+        for item in items:
+            flags[KEY_USAGE[item]] = True
+        return x509.KeyUsage(**flags)
+    if name == 'extendedKeyUsage' and all(item in EXTENDED_KEY_USAGE for item in items):
+        return x509.ExtendedKeyUsage([EXTENDED_KEY_USAGE[item] for item in items])
+    if name == 'subjectAltName':
+        try:
+            return x509.SubjectAlternativeName([_general_name(item) for item in items])
+        except ValueError:
+            pass
+    return _openssl_extension(name, critical, value)
+
+
+class CryptographyBackend(BaseBackend):
+    """
+    crypto backend based on the ``cryptography`` library
+
+    Parsed certificates and keys are cached per process.
+    ``cryptography`` does not provide a human readable
+    representation of certificates, hence text dumps
+    are delegated to OpenSSL; the same happens when parsing
+    and verifying legacy certificates which ``cryptography``
+    refuses to load (eg: invalid version numbers).
+    """
+    name = 'cryptography'
+    fallback = PyOpenSSLBackend()
+
+    def generate_key(self, key_length):
+        return rsa.generate_private_key(public_exponent=65537,
+                                        key_size=key_length,
+                                        backend=default_backend())
+
+    def dump_private_key(self, key):
+        return key.private_bytes(encoding=serialization.Encoding.PEM,
+                                 format=serialization.PrivateFormat.PKCS8,
+                                 encryption_algorithm=serialization.NoEncryption())
+
+    def load_private_key(self, private_key):
+        # not cached, keys of certificates are usually loaded once
+        return serialization.load_pem_private_key(_to_bytes(private_key), None, default_backend())
+
+    def load_public_key(self, certificate):
+        return load_certificate(certificate).public_key()
+
+    def _get_subject(self, instance):
+        attributes = []
+        for attr, oid in SUBJECT_OIDS:
+            value = getattr(instance, attr)
+            if value:
+                attributes.append(x509.NameAttribute(oid, six.text_type(value)))
+        return x509.Name(attributes)
+
+    def load_csr(self, csr):
+        try:
+            request = x509.load_pem_x509_csr(_to_bytes(csr), default_backend())
+        except ValueError:
+            raise ValueError('invalid certificate signing request')
+        if not request.is_signature_valid:
+            raise ValueError('invalid certificate signing request')
+        public_key = request.public_key()
+        attrs = {'key_length': str(public_key.key_size)}
+        for attr, oid in SUBJECT_OIDS:
+            values = request.subject.get_attributes_for_oid(oid)
+            attrs[attr] = values[0].value if values else ''
+        return public_key, attrs
+
+    def sign(self, instance, key, issuer=None):
+        subject = self._get_subject(instance)
+        # public keys are returned by load_csr
+        public_key = key.public_key() if isinstance(key, rsa.RSAPrivateKey) else key
+        ski = x509.SubjectKeyIdentifier.from_public_key(public_key)
+        # self-signed certificate (CA)
+        if issuer is None:
+            issuer_name = subject
+            issuer_key = key
+            aki_key_id = ski.digest
+            aki_issuer = subject
+            aki_serial = instance.serial_number
+        # certificate issued by a CA
+        else:
+            issuer_cert = load_certificate(issuer.certificate)
+            issuer_name = issuer_cert.subject
+            issuer_key = load_private_key(issuer.private_key)
+            try:
+                aki_key_id = issuer_cert.extensions.get_extension_for_class(
+                    x509.SubjectKeyIdentifier
+                ).value.digest
+            except x509.ExtensionNotFound:
+                aki_key_id = x509.SubjectKeyIdentifier.from_public_key(
+                    issuer_cert.public_key()
+                ).digest
+            aki_issuer = issuer_cert.issuer
+            aki_serial = issuer_cert.serial_number
+        builder = x509.CertificateBuilder() \
+            .subject_name(subject) \
+            .issuer_name(issuer_name) \
+            .public_key(public_key) \
+            .serial_number(int(instance.serial_number)) \
+            .not_valid_before(_naive_utc(instance.validity_start)) \
+            .not_valid_after(_naive_utc(instance.validity_end))
+        extensions, extra_extensions = instance._compile_extensions(self)
+        for extension, critical in extensions:
+            builder = builder.add_extension(extension, critical)
+        builder = builder.add_extension(ski, False)
+        builder = builder.add_extension(x509.AuthorityKeyIdentifier(
+            key_identifier=aki_key_id,
+            authority_cert_issuer=[x509.DirectoryName(aki_issuer)],
+            authority_cert_serial_number=int(aki_serial)
+        ), False)
+        for extension, critical in extra_extensions:
+            builder = builder.add_extension(extension, critical)
+        cert = builder.sign(issuer_key, _hash(instance.digest), default_backend())
+        return cert.public_bytes(serialization.Encoding.PEM)
+
+    def compile_extensions(self, extensions):
+        return [(build_extension(name, critical, value), bool(critical))
+                for name, critical, value in extensions]
+
+    def parse(self, instance):
+        try:
+            cert = load_certificate(instance.certificate)
+        except x509.InvalidVersion:
+            return self.fallback.parse(instance)
+        subject = cert.subject
+        data = {
+            'key_length': str(cert.public_key().key_size),
+            'digest': cert.signature_hash_algorithm.name,
+            # naive datetimes are interpreted in the current time
+            # zone in order to be consistent with the pyOpenSSL backend
+            'validity_start': timezone.make_aware(cert.not_valid_before),
+            'validity_end': timezone.make_aware(cert.not_valid_after),
+            'serial_number': cert.serial_number,
+        }
+        for attr, oid in SUBJECT_OIDS:
+            values = subject.get_attributes_for_oid(oid)
+            data[attr] = values[0].value if values else ''
+        data['common_name'] = data['common_name'] or None
+        return data
+
+    def verify(self, instance, ca, check_time=True):
+        try:
+            cert = load_certificate(instance.certificate)
+            chain = load_chain(ca.get_chain())
+        except x509.InvalidVersion:
+            return self.fallback.verify(instance, ca, check_time)
+        # like the pyOpenSSL backend, only the root CA of the chain
+        # is trusted, the other certificates are verified up to it
+        certs = [cert] + chain
+        for child, issuer in zip(certs, chain):
+            if child.issuer != issuer.subject:
+                raise VerificationError('unable to get local issuer certificate')
+            try:
+                issuer.public_key().verify(child.signature,
+                                           child.tbs_certificate_bytes,
+                                           padding.PKCS1v15(),
+                                           child.signature_hash_algorithm)
+            except InvalidSignature:
+                raise VerificationError('certificate signature failure')
+        if not check_time:
+            return
+        now = _naive_utc(timezone.now())
+        for c in certs:
+            if c.not_valid_before > now:
+                raise VerificationError('certificate is not yet valid')
+            if c.not_valid_after < now:
+                raise VerificationError('certificate has expired')
+
+    def key_matches(self, instance):
+        try:
+            cert = load_certificate(instance.certificate)
+        except x509.InvalidVersion:
+            return self.fallback.key_matches(instance)
+        key = load_private_key(instance.private_key)
+        return cert.public_key().public_numbers() == key.public_key().public_numbers()
+
+    def build_crl(self, ca, revoked):
+        ca_cert = load_certificate(ca.certificate)
+        now = _naive_utc(timezone.now())
+        builder = x509.CertificateRevocationListBuilder() \
+            .issuer_name(ca_cert.subject) \
+            .last_update(now) \
+            .next_update(now + timedelta(days=1))
+        for serial_number, revocation_date, reason in revoked:
+            entry = x509.RevokedCertificateBuilder() \
+                .serial_number(int(serial_number)) \
+                .revocation_date(_naive_utc(revocation_date)) \
+                .add_extension(x509.CRLReason(CRL_REASONS[reason]), False) \
+                .build(default_backend())
+            builder = builder.add_revoked_certificate(entry)
+        crl = builder.sign(load_private_key(ca.private_key), _hash(ca.digest), default_backend())
+        return crl.public_bytes(serialization.Encoding.PEM)
+
+    def dump_text(self, instance):
+        cert = crypto.load_certificate(crypto.FILETYPE_PEM, _to_bytes(instance.certificate))
+        return crypto.dump_certificate(crypto.FILETYPE_TEXT, cert).decode('utf-8')
@@ -0,0 +1,160 @@
+from datetime import datetime
+
+from django.utils import timezone
+from django.utils.lru_cache import lru_cache
+from OpenSSL import crypto
+
+from ..models.base import SIGNATURE_MAPPING, generalized_time
+from ..utils import bytes_compat
+from .base import BaseBackend, VerificationError
+
+PEM_END = '-----END CERTIFICATE-----'
+# X509_V_FLAG_NO_CHECK_TIME (OpenSSL >= 1.1.0), not exposed by pyOpenSSL
+NO_CHECK_TIME = 0x200000
+
+
+@lru_cache(maxsize=128)
+def _get_store(chain, check_time=True):
+    """
+    returns a verification store which trusts only the root CA
+    of ``chain`` and the intermediate certificates of ``chain``
+    (cached per process)
+    """
+    certs = [crypto.load_certificate(crypto.FILETYPE_PEM, pem + PEM_END)
+             for pem in chain.split(PEM_END) if pem.strip()]
+    store = crypto.X509Store()
+    if not check_time:
+        store.set_flags(NO_CHECK_TIME)
+    store.add_cert(certs[-1])
+    intermediates = certs[:-1]
+    try:
+        crypto.X509StoreContext(store, certs[-1], chain=[])
+    except TypeError:
+        # pyOpenSSL < 20 doesn't support untrusted chains: intermediates
+        # are trusted only after being verified from the root down
+        for cert in reversed(intermediates):
+            crypto.X509StoreContext(store, cert).verify_certificate()
+            store.add_cert(cert)
+        intermediates = None
+    return store, intermediates
+
+
+class PyOpenSSLBackend(BaseBackend):
+    """
+    crypto backend based on ``OpenSSL.crypto`` (default)
+    """
+    name = 'pyOpenSSL'
+
+    def generate_key(self, key_length):
+        key = crypto.PKey()
+        key.generate_key(crypto.TYPE_RSA, key_length)
+        return key
+
+    def dump_private_key(self, key):
+        return crypto.dump_privatekey(crypto.FILETYPE_PEM, key)
+
+    def load_private_key(self, private_key):
+        return crypto.load_privatekey(crypto.FILETYPE_PEM, private_key)
+
+    def load_public_key(self, certificate):
+        return crypto.load_certificate(crypto.FILETYPE_PEM, bytes_compat(certificate)).get_pubkey()
+
+    def load_csr(self, csr):
+        try:
+            request = crypto.load_certificate_request(crypto.FILETYPE_PEM, bytes_compat(csr))
+            public_key = request.get_pubkey()
+            request.verify(public_key)
+        except crypto.Error:
+            raise ValueError('invalid certificate signing request')
+        subject = request.get_subject()
+        return public_key, {
+            'key_length': str(public_key.bits()),
+            'country_code': subject.countryName or '',
+            'state': subject.stateOrProvinceName or '',
+            'city': subject.localityName or '',
+            'organization': subject.organizationName or '',
+            'email': subject.emailAddress or '',
+            'common_name': subject.commonName or '',
+        }
+
+    def sign(self, instance, key, issuer=None):
+        cert = crypto.X509()
+        subject = instance._fill_subject(cert.get_subject())
+        cert.set_version(0x2)  # version 3 (0 indexed counting)
+        cert.set_subject(subject)
+        cert.set_serial_number(instance.serial_number)
+        cert.set_notBefore(bytes_compat(instance.validity_start.strftime(generalized_time)))
+        cert.set_notAfter(bytes_compat(instance.validity_end.strftime(generalized_time)))
+        # self-signed certificate (CA)
+        if issuer is None:
+            issuer_name = subject
+            issuer_key = key
+        # certificate issued by a CA
+        else:
+            issuer_name = issuer.x509.get_subject()
+            issuer_key = issuer.pkey
+        cert.set_issuer(issuer_name)
+        cert.set_pubkey(key)
+        extensions, extra_extensions = instance._compile_extensions(self)
+        cert = instance._add_extensions(cert, extensions, extra_extensions)
+        cert.sign(issuer_key, str(instance.digest))
+        return crypto.dump_certificate(crypto.FILETYPE_PEM, cert)
+
+    def compile_extensions(self, extensions):
+        return [crypto.X509Extension(bytes_compat(name), bool(critical), bytes_compat(value))
+                for name, critical, value in extensions]
+
+    def parse(self, instance):
+        cert = instance.x509
+        # this line might fail if a certificate with
+        # an unsupported signature algorithm is imported
+        algorithm = cert.get_signature_algorithm().decode('utf8')
+        not_before = cert.get_notBefore().decode('utf8')
+        not_after = cert.get_notAfter().decode('utf8')
+        subject = cert.get_subject()
+        return {
+            'key_length': str(cert.get_pubkey().bits()),
+            'digest': SIGNATURE_MAPPING[algorithm],
+            'validity_start': timezone.make_aware(datetime.strptime(not_before, generalized_time)),
+            'validity_end': timezone.make_aware(datetime.strptime(not_after, generalized_time)),
+            'country_code': subject.countryName or '',
+            'state': subject.stateOrProvinceName or '',
+            'city': subject.localityName or '',
+            'organization': subject.organizationName or '',
+            'email': subject.emailAddress or '',
+            'common_name': subject.commonName,
+            'serial_number': cert.get_serial_number(),
+        }
+
+    def verify(self, instance, ca, check_time=True):
+        # certificates signed by the parents of the CA verify against its chain
+        if instance.x509.get_issuer() != ca.x509.get_subject():
+            raise VerificationError('unable to get local issuer certificate')
+        try:
+            store, intermediates = _get_store(ca.get_chain(), check_time)
+            if intermediates is None:
+                store_ctx = crypto.X509StoreContext(store, instance.x509)
+            else:
+                store_ctx = crypto.X509StoreContext(store, instance.x509, chain=intermediates)
+            store_ctx.verify_certificate()
+        except crypto.X509StoreContextError as e:
+            raise VerificationError(e.args[0][2])
+
+    def key_matches(self, instance):
+        public_key = crypto.dump_publickey(crypto.FILETYPE_PEM, instance.x509.get_pubkey())
+        return public_key == crypto.dump_publickey(crypto.FILETYPE_PEM, instance.pkey)
+
+    def build_crl(self, ca, revoked):
+        crl = crypto.CRL()
+        for serial_number, revocation_date, reason in revoked:
+            entry = crypto.Revoked()
+            # pyOpenSSL expects the serial number in hexadecimal notation
+            entry.set_serial(bytes_compat('{0:x}'.format(int(serial_number))))
+            entry.set_reason(bytes_compat(reason))
+            entry.set_rev_date(bytes_compat(revocation_date.strftime(generalized_time)))
+            crl.add_revoked(entry)
+        return crl.export(ca.x509, ca.pkey, days=1)
+
+    def dump_text(self, instance):
+        text = crypto.dump_certificate(crypto.FILETYPE_TEXT, instance.x509)
+        return text.decode('utf-8')
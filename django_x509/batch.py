@@ -0,0 +1,167 @@
+"""
+Batched issuance and revocation of certificates
+
+Each batch is processed in a single transaction; items which
+fail are rolled back to a savepoint and reported in the result
+of the item, without affecting the rest of the batch.
+The CA is loaded and parsed once per batch and its CRL and
+filter of revoked serial numbers are updated once per batch.
+"""
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, router, transaction
+from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.six import integer_types, string_types
+
+from .models import CertProfile, Revocation
+from .ratelimit import RateLimitExceeded
+from .signals import cert_revoked
+
+# fields which can be specified in issuance requests
+ISSUE_FIELDS = ('name', 'notes', 'key_length', 'digest', 'validity_start', 'validity_end',
+                'country_code', 'state', 'city', 'organization', 'email', 'common_name',
+                'extensions', 'serial_number', 'idempotency_key')
+
+
+def _errors(error):
+    if isinstance(error, ValidationError):
+        if hasattr(error, 'error_dict'):
+            return error.message_dict
+        return {'__all__': error.messages}
+    return {'__all__': [force_text(error)]}
+
+
+def _is_serial_number(value):
+    return isinstance(value, integer_types) and not isinstance(value, bool) and value > 0
+
+
+def _new_cert(ca, item, profiles):
+    unknown = set(item) - set(ISSUE_FIELDS + ('csr', 'profile'))
+    if unknown:
+        raise ValidationError(dict((field, ['Unknown field']) for field in sorted(unknown)))
+    attrs = dict((field, item[field]) for field in ISSUE_FIELDS if field in item)
+    profile_id = item.get('profile')
+    if profile_id is not None:
+        profile = profiles.get(profile_id)
+        if profile is None:
+            raise ValidationError({'profile': ['Unknown profile']})
+        return profile.new_cert(ca, attrs.pop('common_name', ''), **attrs)
+    attrs.setdefault('name', attrs.get('common_name', ''))
+    return ca.cert_set.model(ca=ca, **attrs)
+
+
+def _issue(ca, item, profiles):
+    if not isinstance(item, dict):
+        raise ValidationError('Invalid item')
+    cert = _new_cert(ca, item, profiles)
+    csr = item.get('csr')
+    if csr:
+        if not isinstance(csr, string_types):
+            raise ValidationError({'csr': ['Invalid certificate signing request']})
+        # the name and the key length may be read from the request
+        cert.full_clean(exclude=['ca', 'name', 'key_length'])
+    else:
+        cert.full_clean(exclude=['ca'])
+
+    def save():
+        if not csr:
+            cert.save()
+            return
+        try:
+            cert.sign_request(csr)
+        except ValueError as e:
+            raise ValidationError({'csr': [force_text(e)]})
+
+    if cert.idempotency_key:
+        # retried requests return the certificate issued the first time
+        return type(cert).objects.all()._get_or_save(cert, save)[0]
+    save()
+    return cert
+
+
+def issue_certs(ca, items):
+    """
+    creates the certificates described by ``items``, a list of dicts
+    containing the values of the fields of ``Cert`` (eg: ``common_name``),
+    the ``id`` of a ``CertProfile`` (``profile``) and a PEM certificate
+    signing request (``csr``, the private key is generated by the server
+    when missing); items with an ``idempotency_key`` already used for
+    a valid certificate of ``ca`` return that certificate; returns a list
+    of results, one for each item, which contain either the new
+    certificate or the validation ``errors``;
+    when ``DJANGO_X509_ASYNC_ISSUANCE`` is enabled the ``status`` of
+    certificates without ``csr`` is ``pending`` and their ``certificate``
+    and ``private_key`` are empty until the ``x509_worker`` generates them;
+    items rejected by rate limits contain ``retry_after`` (seconds)
+    """
+    model = ca.cert_set.model
+    db = router.db_for_write(model)
+    profile_ids = set(item.get('profile') for item in items if isinstance(item, dict))
+    profile_ids = [pk for pk in profile_ids if isinstance(pk, integer_types)]
+    profiles = CertProfile.objects.using(db).in_bulk(profile_ids) if profile_ids else {}
+    results = []
+    with transaction.atomic(using=db):
+        for item in items:
+            try:
+                with transaction.atomic(using=db):
+                    cert = _issue(ca, item, profiles)
+            except RateLimitExceeded as e:
+                results.append({'errors': _errors(e), 'retry_after': e.retry_after})
+                continue
+            except (ValidationError, ValueError, TypeError, DatabaseError) as e:
+                results.append({'errors': _errors(e)})
+                continue
+            results.append({'id': cert.pk,
+                            'serial_number': cert.serial_number,
+                            'common_name': cert.common_name,
+                            'status': cert.status,
+                            'certificate': force_text(cert.certificate),
+                            'private_key': force_text(cert.private_key)})
+    return results
+
+
+def revoke_certs(ca, serial_numbers):
+    """
+    revokes the certificates of ``ca`` whose serial numbers are listed
+    in ``serial_numbers``; returns a list of results, one for each serial
+    number, whose ``status`` is ``revoked``, ``already_revoked``,
+    ``not_found`` or ``invalid``
+    """
+    model = ca.cert_set.model
+    db = router.db_for_write(model)
+    valid = [serial_number for serial_number in serial_numbers
+             if _is_serial_number(serial_number)]
+    now = timezone.now()
+    results = []
+    revoked = []
+    with transaction.atomic(using=db):
+        certs = ca.cert_set.using(db) \
+                           .filter(serial_number__in=valid) \
+                           .select_for_update() \
+                           .only('id', 'ca', 'serial_number', 'revoked', 'revoked_at',
+                                 'validity_start', 'validity_end')
+        certs = dict((cert.serial_number, cert) for cert in certs)
+        for serial_number in serial_numbers:
+            if not _is_serial_number(serial_number):
+                status = 'invalid'
+            elif serial_number not in certs:
+                status = 'not_found'
+            elif certs[serial_number].revoked:
+                status = 'already_revoked'
+            else:
+                cert = certs[serial_number]
+                cert.revoked = True
+                cert.revoked_at = now
+                revoked.append(cert)
+                status = 'revoked'
+            results.append({'serial_number': serial_number, 'status': status})
+        if revoked:
+            ca.cert_set.using(db) \
+                       .filter(pk__in=[cert.pk for cert in revoked]) \
+                       .update(revoked=True, revoked_at=now, modified=now)
+            Revocation.record(revoked, using=db)
+            ca.invalidate_crl()
+            ca.update_revoked_filter(*[cert.serial_number for cert in revoked])
+    for cert in revoked:
+        cert_revoked.send(sender=model, instance=cert)
+    return results
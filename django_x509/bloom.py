@@ -0,0 +1,97 @@
+"""
+Bloom filter of revoked serial numbers
+
+This module has no dependencies besides the python standard
+library, hence consumers of the filters exported by django-x509
+(eg: edge proxies) can copy it or import it without django::
+
+    from django_x509.bloom import BloomFilter
+
+    with open('ca-1.bloom', 'rb') as f:
+        revoked = BloomFilter.from_bytes(f.read())
+    if serial_number in revoked:
+        # possibly revoked, check with OCSP or the CRL
+        ...
+
+Binary format (big endian)::
+
+    magic (4 bytes, "X5BF"), version (1 byte), number of hash
+    functions (1 byte), size in bits (4 bytes), number of serial
+    numbers added (4 bytes), capacity (4 bytes), bit array
+
+Bit positions are computed with double hashing: the first
+16 bytes of the SHA256 digest of the decimal representation
+of the serial number are split in two 64 bit integers
+``h1`` and ``h2`` and the position of the hash function
+``i`` is ``(h1 + i * h2) % size``.
+"""
+import hashlib
+import math
+import struct
+
+MAGIC = b'X5BF'
+VERSION = 1
+HEADER = struct.Struct('>4sBBIII')
+
+
+class BloomFilter(object):
+    """
+    Bloom filter of integers which holds up to ``capacity``
+    items with a false positive probability of ``error_rate``
+    """
+    def __init__(self, capacity=1000, error_rate=0.001, size=None, hashes=None, bits=None, count=0):
+        self.capacity = max(int(capacity), 1)
+        if size is None:
+            size = int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        if hashes is None:
+            hashes = int(round(float(size) / self.capacity * math.log(2)))
+        self.size = max(size, 8)
+        self.hashes = max(hashes, 1)
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+        self.count = count
+
+    def _positions(self, serial_number):
+        digest = hashlib.sha256(str(int(serial_number)).encode('ascii')).digest()
+        h1, h2 = struct.unpack('>QQ', digest[:16])
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, serial_number):
+        for position in self._positions(serial_number):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, serial_number):
+        for position in self._positions(serial_number):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    @property
+    def error_rate(self):
+        """
+        expected false positive probability with the current amount of items
+        """
+        return (1 - math.exp(-float(self.hashes) * self.count / self.size)) ** self.hashes
+
+    def to_bytes(self):
+        header = HEADER.pack(MAGIC, VERSION, self.hashes, self.size, self.count, self.capacity)
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        magic, version, hashes, size, count, capacity = HEADER.unpack(data[:HEADER.size])
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Unsupported bloom filter format')
+        bits = bytearray(data[HEADER.size:])
+        if len(bits) != (size + 7) // 8:
+            raise ValueError('Truncated bloom filter')
+        return cls(capacity=capacity, size=size, hashes=hashes, bits=bits, count=count)
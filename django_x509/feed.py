@@ -0,0 +1,128 @@
+"""
+Change feed of CAs and certificates
+
+Consumers (eg: inventories, edge proxies) keep the cursor returned
+with each page and pass it back to receive only what changed since
+then, hence they don't need to download every certificate again::
+
+    from django_x509.feed import get_changes
+
+    cursor = None
+    while True:
+        changes, cursor, more = get_changes('cert', cursor)
+        for entry in changes:
+            sync(entry)  # entry['action']: updated, revoked or deleted
+        if not more:
+            break
+
+Pages are ordered by ``(modified, id)`` and selected with keyset
+pagination on the index of ``modified``, which keeps the cost
+of each page constant regardless of the size of the tables.
+Deletions are reported through ``Tombstone`` rows.
+
+Rows modified in the last ``DJANGO_X509_CHANGE_FEED_DELAY`` seconds
+are not returned: transactions which are still in progress may
+commit rows with an older ``modified`` value, which would otherwise
+be skipped by consumers whose cursor has already moved past it.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import settings as app_settings
+from .models import Ca, Cert, Tombstone
+
+FIELDS = {
+    'ca': ('id', 'parent', 'name', 'common_name', 'serial_number',
+           'validity_start', 'validity_end', 'certificate', 'modified'),
+    'cert': ('id', 'ca', 'name', 'common_name', 'serial_number', 'validity_start',
+             'validity_end', 'revoked', 'revoked_at', 'certificate', 'modified'),
+}
+MODELS = {'ca': Ca, 'cert': Cert}
+
+
+def encode_cursor(modified, pk):
+    """
+    returns the cursor which points after the row
+    identified by ``modified`` and ``pk``
+    """
+    if timezone.is_aware(modified):
+        modified = timezone.make_naive(modified, timezone.utc)
+    timestamp = calendar.timegm(modified.utctimetuple()) * 10 ** 6 + modified.microsecond
+    return '{0}-{1}'.format(timestamp, pk)
+
+
+def decode_cursor(cursor):
+    """
+    returns the ``(modified, pk)`` tuple encoded in ``cursor``,
+    raises ``ValueError`` if ``cursor`` is not valid
+    """
+    try:
+        timestamp, pk = [int(part) for part in cursor.split('-')]
+    except (AttributeError, TypeError):
+        raise ValueError('invalid cursor')
+    if timestamp < 0 or pk < 0:
+        raise ValueError('invalid cursor')
+    modified = datetime(1970, 1, 1) + timedelta(microseconds=timestamp)
+    if settings.USE_TZ:
+        modified = timezone.make_aware(modified, timezone.utc)
+    return modified, pk
+
+
+def _after(queryset, position, pk_field):
+    if position is None:
+        return queryset
+    modified, pk = position
+    return queryset.filter(Q(modified__gt=modified) |
+                           Q(**{'modified': modified, '{0}__gt'.format(pk_field): pk}))
+
+
+def get_changes(model, cursor=None, limit=None):
+    """
+    returns a ``(changes, cursor, more)`` tuple in which ``changes``
+    is the list of the CAs (``model='ca'``) or certificates
+    (``model='cert'``) changed after ``cursor``, ``cursor`` points
+    after the last change and ``more`` tells whether more changes
+    are available; each change is a ``dict`` whose ``action`` is
+    ``updated``, ``revoked`` (certificates only) or ``deleted``
+    (only ``id``, ``ca``, ``serial_number`` and ``modified``
+    are present in this case)
+    """
+    if model not in MODELS:
+        raise ValueError('unknown model: {0}'.format(model))
+    page_size = app_settings.CHANGE_FEED_PAGE_SIZE
+    limit = min(int(limit or page_size), page_size)
+    if limit < 1:
+        raise ValueError('invalid limit')
+    position = decode_cursor(cursor) if cursor else None
+    until = timezone.now() - timedelta(seconds=app_settings.CHANGE_FEED_DELAY)
+    # the tables are queried separately, each for one page
+    # at most, and the results are merged
+    rows = _after(MODELS[model].objects.filter(modified__lte=until), position, 'pk')
+    rows = rows.order_by('modified', 'pk').values(*FIELDS[model])[:limit + 1]
+    changes = []
+    for row in rows:
+        revoked = row.get('revoked')
+        row['action'] = 'revoked' if revoked else 'updated'
+        changes.append(row)
+    tombstones = Tombstone.objects.filter(model=model, modified__lte=until)
+    tombstones = _after(tombstones, position, 'object_id')
+    tombstones = tombstones.order_by('modified', 'object_id') \
+                           .values_list('object_id', 'ca_id', 'serial_number', 'modified')
+    for object_id, ca_id, serial_number, modified in tombstones[:limit + 1]:
+        change = {'id': object_id,
+                  'serial_number': serial_number,
+                  'modified': modified,
+                  'action': 'deleted'}
+        if model == 'cert':
+            change['ca'] = ca_id
+        changes.append(change)
+    changes.sort(key=lambda change: (change['modified'], change['id']))
+    more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        cursor = encode_cursor(changes[-1]['modified'], changes[-1]['id'])
+    return changes, cursor, more
@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...audit import audit_certs
+from ...models import Cert
+from ...routers import use_replica
+
+
+class Command(BaseCommand):
+    help = ('Verifies that every certificate has been signed by its CA '
+            'and that its private key matches its public key')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ca', action='append', dest='cas', default=[],
+                            help='audit only certificates of this CA (id), can be repeated')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='number of worker processes (defaults to the number of CPUs)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='certificates read from the database and sent '
+                                 'to workers at once (default: %(default)s)')
+        parser.add_argument('--max-failures', type=int, default=100,
+                            help='maximum number of failures listed '
+                                 'in the report (default: %(default)s)')
+        parser.add_argument('--json', action='store_true', default=False,
+                            help='print the report in JSON format')
+
+    def handle(self, *args, **options):
+        queryset = Cert.objects.all()
+        if options['cas']:
+            queryset = queryset.filter(ca__in=options['cas'])
+        verbose = options['verbosity'] > 1 and not options['json']
+
+        def progress(audited):
+            self.stdout.write('{0} certificates audited'.format(audited))
+
+        with use_replica():
+            report = audit_certs(queryset,
+                                 processes=options['processes'],
+                                 chunk_size=options['chunk_size'],
+                                 progress=progress if verbose else None)
+        failures = report['failures']
+        report['failures'] = failures[:options['max_failures']]
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=4))
+        else:
+            self._print_report(report, len(failures))
+        if failures:
+            raise CommandError('{0} certificates failed the audit'.format(len(failures)))
+
+    def _print_report(self, report, total_failures):
+        self.stdout.write('Audited {audited} certificates of {cas} CAs in '
+                          '{seconds:.1f} seconds ({rate:.0f} certificates/s)'.format(**report))
+        self.stdout.write('OK: {0}'.format(report['ok']))
+        for problem, count in report['problems'].items():
+            self.stdout.write('{0}: {1}'.format(problem, count))
+        for pk, ca_id, problem, detail in report['failures']:
+            self.stdout.write('cert {0} (CA {1}): {2}: {3}'.format(pk, ca_id, problem, detail))
+        if total_failures > len(report['failures']):
+            self.stdout.write('... {0} more failures not shown'.format(
+                total_failures - len(report['failures'])))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Ca
+
+
+class Command(BaseCommand):
+    help = 'Exports the bloom filter of revoked serial numbers of a CA'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ca', help='id of the CA')
+        parser.add_argument('--output', help='write the filter to this file')
+        parser.add_argument('--rebuild', action='store_true', default=False,
+                            help='build the filter again from the database '
+                                 '(removes expired certificates)')
+
+    def handle(self, *args, **options):
+        try:
+            ca = Ca.objects.get(pk=options['ca'])
+        except (Ca.DoesNotExist, ValueError):
+            raise CommandError('CA "{0}" does not exist'.format(options['ca']))
+        if options['rebuild']:
+            bloom = ca.update_revoked_filter()
+        else:
+            bloom = ca.get_revoked_filter()
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                f.write(bloom.to_bytes())
+        self.stdout.write('{0} revoked serial numbers, capacity {1}, {2} bytes, '
+                          'false positive rate {3:.6f}'.format(len(bloom),
+                                                               bloom.capacity,
+                                                               len(bloom.to_bytes()),
+                                                               bloom.error_rate))
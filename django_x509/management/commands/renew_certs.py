@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...models import Cert
+from ...renewal import renew_certs
+
+
+class Command(BaseCommand):
+    help = ('Renews the certificates which are not revoked and have not '
+            'been renewed yet (successors are renewed only after the expiration '
+            'of their predecessors), reusing their private keys by default')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ca', action='append', dest='cas', default=[],
+                            help='renew only certificates of this CA (id), can be repeated')
+        parser.add_argument('--expiring', type=float, default=None,
+                            help='renew only certificates expiring within this number of days')
+        parser.add_argument('--validity', type=float, default=None,
+                            help='days of validity of the new certificates '
+                                 '(defaults to the validity of the renewed ones)')
+        parser.add_argument('--new-key', action='store_true', default=False,
+                            help='generate new private keys')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='number of worker processes (defaults to the number of CPUs)')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='certificates renewed in each transaction (default: %(default)s)')
+
+    def handle(self, *args, **options):
+        # certificates renewed by a previous (interrupted) run are skipped, and so
+        # are their successors until the certificates they replace have expired
+        queryset = Cert.objects.filter(revoked=False, successors__isnull=True) \
+                               .exclude(predecessor__validity_end__gt=timezone.now())
+        if options['cas']:
+            queryset = queryset.filter(ca__in=options['cas'])
+        if options['expiring'] is not None:
+            queryset = queryset.filter(validity_end__lte=timezone.now() +
+                                       timedelta(days=options['expiring']))
+        report = renew_certs(queryset,
+                             reuse_key=not options['new_key'],
+                             validity=options['validity'],
+                             processes=options['processes'],
+                             chunk_size=options['chunk_size'])
+        self.stdout.write('Renewed {renewed} certificates in {seconds:.1f} seconds '
+                          '({rate:.0f} certificates/s)'.format(**report))
+        for pk, error in report['failures']:
+            self.stdout.write('cert {0}: {1}'.format(pk, error))
+        if report['failures']:
+            raise CommandError('{0} certificates could not be renewed'.format(report['failed']))
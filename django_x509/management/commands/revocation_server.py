@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import settings as app_settings
+
+
+class Command(BaseCommand):
+    help = ('Serves the CRLs and OCSP responses of all CAs from memory '
+            'with a standalone asyncio HTTP server')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1',
+                            help='address to listen on (default: %(default)s)')
+        parser.add_argument('--port', type=int, default=8001,
+                            help='port to listen on (default: %(default)s)')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='seconds between snapshot refreshes (default: %(default)s)')
+        parser.add_argument('--validity', type=float, default=24,
+                            help='hours of validity of OCSP responses, which are '
+                                 'signed again after half of it (default: %(default)s)')
+
+    def handle(self, *args, **options):
+        try:
+            from ...revocation_server import RevocationServer, Snapshot
+        except ImportError as e:
+            raise CommandError('the revocation server requires python >= 3.4 '
+                               'and cryptography >= 2.4 ({0})'.format(e))
+        if app_settings.CRL_PROTECTED:
+            raise CommandError('the revocation server does not authenticate clients, '
+                               'it cannot be used when DJANGO_X509_CRL_PROTECTED is enabled')
+        snapshot = Snapshot(validity=timedelta(hours=options['validity']))
+        cas, certs = snapshot.refresh()
+        self.stdout.write('Loaded {0} CAs and {1} certificates'.format(cas, certs))
+        server = RevocationServer(snapshot,
+                                  host=options['host'],
+                                  port=options['port'],
+                                  interval=options['interval'])
+        server.start()
+        self.stdout.write('Serving on http://{0}:{1}/ (CONTROL-C to quit)'.format(
+            options['host'], options['port']))
+        try:
+            server.loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Ca
+from ...rollover import rollover_ca
+
+
+class Command(BaseCommand):
+    help = ('Creates a successor of a CA and re-issues all the active '
+            'certificates of the CA signed by the successor, reusing '
+            'their private keys by default')
+
+    def add_arguments(self, parser):
+        parser.add_argument('ca', help='id of the CA')
+        parser.add_argument('--resume', action='store_true', default=False,
+                            help='continue the last rollover of the CA instead of '
+                                 'creating a new successor')
+        parser.add_argument('--reuse-ca-key', action='store_true', default=False,
+                            help='the successor reuses the private key of the CA')
+        parser.add_argument('--new-key', action='store_true', default=False,
+                            help='generate new private keys for the certificates')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='number of worker processes (defaults to the number of CPUs)')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='certificates re-issued in each transaction (default: %(default)s)')
+
+    def handle(self, *args, **options):
+        try:
+            ca = Ca.objects.get(pk=options['ca'])
+        except (Ca.DoesNotExist, ValueError):
+            raise CommandError('CA "{0}" does not exist'.format(options['ca']))
+        if options['resume']:
+            successor = ca.successors.order_by('-created').first()
+            if successor is None:
+                raise CommandError('CA "{0}" has no successor to resume'.format(ca.pk))
+        else:
+            successor = ca.renew(reuse_key=options['reuse_ca_key'])
+        self.stdout.write('Re-issuing certificates of CA {0} signed by CA {1}'.format(ca.pk, successor.pk))
+        progress = self._progress if options['verbosity'] > 1 else None
+        report = rollover_ca(ca,
+                             reuse_key=not options['new_key'],
+                             successor=successor,
+                             processes=options['processes'],
+                             chunk_size=options['chunk_size'],
+                             progress=progress)
+        self.stdout.write('Re-issued {renewed} certificates in {seconds:.1f} seconds '
+                          '({rate:.0f} certificates/s)'.format(**report))
+        unrecoverable = set(report['unrecoverable'])
+        for pk, error in report['failures']:
+            suffix = ' (unrecoverable)' if pk in unrecoverable else ''
+            self.stdout.write('cert {0}: {1}{2}'.format(pk, error, suffix))
+        if report['failures']:
+            message = '{0} certificates could not be re-issued'.format(report['failed'])
+            retryable = report['failed'] - len(unrecoverable)
+            if retryable:
+                message += ', run again with --resume to retry {0} of them'.format(retryable)
+            if unrecoverable:
+                ids = ', '.join(str(pk) for pk in sorted(unrecoverable))
+                message += '; certificates {0} would fail again, ' \
+                           'revoke or re-issue them manually'.format(ids)
+            raise CommandError(message)
+
+    def _progress(self, done, total):
+        self.stdout.write('{0}/{1}'.format(done, total))
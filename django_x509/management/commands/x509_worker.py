@@ -0,0 +1,47 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ...models import Job
+from ...models.job import default_worker_id
+
+
+class Command(BaseCommand):
+    help = ('Generates the CAs and certificates saved while '
+            'DJANGO_X509_ASYNC_ISSUANCE is enabled')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='exit when no jobs are left instead of waiting for new ones')
+        parser.add_argument('--batch', type=int, default=10,
+                            help='jobs claimed at once (default: %(default)s)')
+        parser.add_argument('--sleep', type=float, default=1,
+                            help='seconds to wait when no jobs are available (default: %(default)s)')
+        parser.add_argument('--worker-id', default=None,
+                            help='identifier of this worker (defaults to hostname:pid)')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        worker = options['worker_id'] or default_worker_id()
+        verbose = options['verbosity'] > 1
+        # jobs which have been claimed are completed before exiting
+        signal.signal(signal.SIGTERM, self._stop)
+        processed = 0
+        while not self.stopping:
+            close_old_connections()
+            jobs = Job.objects.claim(worker=worker, limit=options['batch'])
+            for job in jobs:
+                job.run()
+                processed += 1
+                if verbose:
+                    self.stdout.write('{0}: {1}'.format(job, job.error or 'ok'))
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        self.stdout.write('{0} jobs processed'.format(processed))
+
+    def _stop(self, signum, frame):
+        self.stopping = True
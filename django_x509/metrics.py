@@ -0,0 +1,255 @@
+"""
+In-process instrumentation of PKI operations
+
+Metrics are collected per process and can be read through the python API
+(``REGISTRY``, ``Counter.value``, ``Histogram.percentile``) or exported in
+the prometheus text exposition format (``render``), which is what the
+``metrics`` view returns.
+
+When ``DJANGO_X509_METRICS_ENABLED`` is ``False`` (default) no measurement
+is taken and instrumented code paths only pay for a boolean check.
+"""
+import threading
+from collections import OrderedDict
+from timeit import default_timer
+
+from . import settings as app_settings
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+REGISTRY = OrderedDict()
+
+
+def enabled():
+    return app_settings.METRICS_ENABLED
+
+
+def _labels_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append('{0}="{1}"'.format(name, value))
+    return '{{{0}}}'.format(','.join(escaped))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _NoopTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+class _Timer(object):
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(default_timer() - self.start, **self.labels)
+        return False
+
+
+class Metric(object):
+    """
+    base class of metric types
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """
+        returns a list of ``(name, label pairs, value)`` tuples
+        """
+        raise NotImplementedError()
+
+    def render(self):
+        lines = ['# HELP {0} {1}'.format(self.name, self.documentation),
+                 '# TYPE {0} {1}'.format(self.name, self.type)]
+        for name, pairs, value in self.samples():
+            lines.append('{0}{1} {2}'.format(name,
+                                             _format_labels(pairs),
+                                             _format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """
+    monotonically increasing counter
+    """
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not enabled():
+            return
+        key = _labels_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_labels_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, list(zip(self.labelnames, key)), value)
+                for key, value in items]
+
+
+class Histogram(Metric):
+    """
+    cumulative histogram of observed values (usually durations in seconds)
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not enabled():
+            return
+        key = _labels_key(self.labelnames, labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[0][i] += 1
+                    break
+            data[1] += value
+            data[2] += 1
+
+    def time(self, **labels):
+        """
+        returns a context manager which observes
+        the duration of the wrapped block
+        """
+        if not enabled():
+            return _NOOP_TIMER
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        data = self._values.get(_labels_key(self.labelnames, labels))
+        return data[2] if data else 0
+
+    def sum(self, **labels):
+        data = self._values.get(_labels_key(self.labelnames, labels))
+        return data[1] if data else 0.0
+
+    def percentile(self, quantile, **labels):
+        """
+        estimates the requested quantile (0-1) by linear
+        interpolation within the matching bucket;
+        returns ``None`` if nothing has been observed yet
+        """
+        data = self._values.get(_labels_key(self.labelnames, labels))
+        if not data or not data[2]:
+            return None
+        rank = quantile * data[2]
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, data[0]):
+            if count and cumulative + count >= rank:
+                if bound == float('inf'):
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return lower
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, ([c for c in data[0]], data[1], data[2]))
+                           for key, data in self._values.items())
+        samples = []
+        for key, (counts, total, count) in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(('{0}_bucket'.format(self.name),
+                                pairs + [('le', _format_value(bound))],
+                                cumulative))
+            samples.append(('{0}_sum'.format(self.name), pairs, total))
+            samples.append(('{0}_count'.format(self.name), pairs, count))
+        return samples
+
+
+def render():
+    """
+    returns all the metrics in the prometheus text exposition format
+    """
+    return '\n'.join(metric.render() for metric in REGISTRY.values()) + '\n'
+
+
+def reset():
+    """
+    clears all the collected values
+    """
+    for metric in REGISTRY.values():
+        metric.reset()
+
+
+keygen_seconds = Histogram('django_x509_keygen_seconds',
+                           'Time spent generating private keys',
+                           ['model', 'key_length'])
+sign_seconds = Histogram('django_x509_sign_seconds',
+                         'Time spent building and signing certificates',
+                         ['model', 'digest'])
+import_seconds = Histogram('django_x509_import_seconds',
+                           'Time spent importing existing certificates',
+                           ['model'])
+verify_ca_seconds = Histogram('django_x509_verify_ca_seconds',
+                              'Time spent verifying certificates against their CA',
+                              ['model'])
+issued_total = Counter('django_x509_issued_total',
+                       'Certificates generated',
+                       ['model'])
+crl_generation_seconds = Histogram('django_x509_crl_generation_seconds',
+                                   'Time spent generating and signing CRLs',
+                                   ['ca'])
+crl_generated_total = Counter('django_x509_crl_generated_total',
+                              'CRLs generated',
+                              ['ca'])
+crl_view_seconds = Histogram('django_x509_crl_view_seconds',
+                             'Time spent serving CRLs through the CRL view',
+                             ['ca'])
+crl_requests_total = Counter('django_x509_crl_requests_total',
+                             'Requests received by the CRL view',
+                             ['ca', 'status'])
+rate_limited_total = Counter('django_x509_rate_limited_total',
+                             'Operations rejected by rate limits',
+                             ['scope'])
@@ -0,0 +1,43 @@
+from django.contrib.auth.models import AnonymousUser
+from django.utils.functional import SimpleLazyObject
+
+from . import settings as app_settings
+from .auth import get_client_cert, get_client_cert_user
+
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:  # django < 1.10
+    MiddlewareMixin = object
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_client_cert_user'):
+        user = get_client_cert_user(request.client_cert)
+        request._cached_client_cert_user = user or AnonymousUser()
+    return request._cached_client_cert_user
+
+
+class ClientCertificateMiddleware(MiddlewareMixin):
+    """
+    sets ``request.client_cert`` to the status of the client
+    certificate forwarded by the TLS proxy (``None`` if absent,
+    unknown, revoked or expired) and, unless a user is already
+    logged in, authenticates the user of the certificate
+    (the user is loaded only when ``request.user`` is accessed
+    and is cached like the status of the certificate)
+
+    must be placed after ``AuthenticationMiddleware``
+    """
+    def process_request(self, request):
+        request.client_cert = None
+        value = request.META.get(app_settings.CLIENT_CERT_HEADER)
+        if not value:
+            return
+        client_cert = get_client_cert(value)
+        if client_cert is None or not client_cert.is_valid():
+            return
+        request.client_cert = client_cert
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated():
+            return
+        request.user = SimpleLazyObject(lambda: get_user(request))
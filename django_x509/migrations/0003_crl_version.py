@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 20:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0002_certificate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ca',
+            name='crl_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='incremented when a certificate of this CA is revoked', verbose_name='CRL version'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 20:57
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0003_crl_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ca',
+            name='revoked_filter',
+            field=models.BinaryField(blank=True, null=True, verbose_name='revoked serial numbers filter'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_chain(apps, schema_editor):
+    # existing CAs are self-signed roots
+    Ca = apps.get_model('django_x509', 'Ca')
+    Ca.objects.update(chain=models.F('certificate'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0004_revoked_filter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ca',
+            name='chain',
+            field=models.TextField(blank=True, editable=False, help_text='certificates of this CA and of its parents up to the root CA, in PEM format', verbose_name='certificate chain'),
+        ),
+        migrations.AddField(
+            model_name='ca',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='leave blank to create a self-signed root CA', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='django_x509.Ca', verbose_name='parent CA'),
+        ),
+        migrations.RunPython(fill_chain, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import django_x509.models.base
+import django_x509.models.profile
+import jsonfield.fields
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0005_ca_hierarchy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CertProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('notes', models.TextField(blank=True)),
+                ('key_length', models.CharField(choices=[('', ''), ('512', '512'), ('1024', '1024'), ('2048', '2048'), ('4096', '4096')], default=django_x509.models.base.default_key_length, help_text='bits', max_length=6, verbose_name='key length')),
+                ('digest', models.CharField(choices=[('', ''), ('sha1', 'SHA1'), ('sha224', 'SHA224'), ('sha256', 'SHA256'), ('sha384', 'SHA384'), ('sha512', 'SHA512')], default=django_x509.models.base.default_digest_algorithm, help_text='bits', max_length=8, verbose_name='digest algorithm')),
+                ('validity', models.PositiveIntegerField(default=django_x509.models.profile.default_profile_validity, help_text='days', verbose_name='validity')),
+                ('country_code', models.CharField(blank=True, max_length=2)),
+                ('state', models.CharField(blank=True, max_length=64, verbose_name='state or province')),
+                ('city', models.CharField(blank=True, max_length=64, verbose_name='city')),
+                ('organization', models.CharField(blank=True, max_length=64, verbose_name='organization')),
+                ('email', models.EmailField(blank=True, max_length=254, verbose_name='email address')),
+                ('extensions', jsonfield.fields.JSONField(blank=True, default=list, help_text='additional x509 certificate extensions', verbose_name='extensions')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+            ],
+            options={
+                'verbose_name': 'certificate profile',
+                'verbose_name_plural': 'certificate profiles',
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='cert',
+            name='profile',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='django_x509.CertProfile', verbose_name='profile'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:07
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0006_certprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=16, verbose_name='model')),
+                ('object_id', models.PositiveIntegerField(verbose_name='object id')),
+                ('ca_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='CA id')),
+                ('serial_number', models.PositiveIntegerField(blank=True, null=True, verbose_name='serial number')),
+                ('modified', models.DateTimeField(default=django.utils.timezone.now, verbose_name='deleted at')),
+            ],
+            options={
+                'verbose_name': 'tombstone',
+                'verbose_name_plural': 'tombstones',
+            },
+        ),
+        migrations.AlterField(
+            model_name='ca',
+            name='modified',
+            field=model_utils.fields.AutoLastModifiedField(db_index=True, default=django.utils.timezone.now, editable=False, verbose_name='modified'),
+        ),
+        migrations.AlterField(
+            model_name='cert',
+            name='modified',
+            field=model_utils.fields.AutoLastModifiedField(db_index=True, default=django.utils.timezone.now, editable=False, verbose_name='modified'),
+        ),
+        migrations.AlterIndexTogether(
+            name='tombstone',
+            index_together=set([('model', 'modified', 'object_id')]),
+        ),
+    ]
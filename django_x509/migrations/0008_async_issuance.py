@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0007_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=16, verbose_name='model')),
+                ('object_id', models.PositiveIntegerField(verbose_name='object id')),
+                ('state', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='queued', max_length=8, verbose_name='state')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('worker', models.CharField(blank=True, max_length=128, verbose_name='worker')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='available at')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='locked until')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created')),
+                ('modified', models.DateTimeField(default=django.utils.timezone.now, verbose_name='modified')),
+            ],
+            options={
+                'verbose_name': 'job',
+                'verbose_name_plural': 'jobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='ca',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('issued', 'issued'), ('failed', 'failed')], default='issued', editable=False, help_text='pending certificates are generated by the x509_worker management command', max_length=8, verbose_name='status'),
+        ),
+        migrations.AddField(
+            model_name='cert',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('issued', 'issued'), ('failed', 'failed')], default='issued', editable=False, help_text='pending certificates are generated by the x509_worker management command', max_length=8, verbose_name='status'),
+        ),
+        migrations.AlterIndexTogether(
+            name='job',
+            index_together=set([('state', 'available_at')]),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0008_async_issuance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IssuanceLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serial_number', models.BigIntegerField(verbose_name='serial number')),
+                ('subject_hash', models.CharField(max_length=40, verbose_name='subject hash')),
+                ('validity_end', models.DateTimeField(verbose_name='validity end')),
+            ],
+            options={
+                'verbose_name': 'issuance log entry',
+                'verbose_name_plural': 'issuance log',
+            },
+        ),
+        migrations.AddField(
+            model_name='ca',
+            name='ephemeral_serial',
+            field=models.BigIntegerField(default=4294967296, editable=False, help_text='end of the last block of serial numbers reserved for short-lived certificates', verbose_name='ephemeral serial number'),
+        ),
+        migrations.AddField(
+            model_name='issuancelog',
+            name='ca',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='django_x509.Ca', verbose_name='CA'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='issuancelog',
+            unique_together=set([('ca', 'serial_number')]),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0009_ephemeral_certs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cert',
+            name='predecessor',
+            field=models.ForeignKey(blank=True, editable=False, help_text='certificate renewed by this certificate', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='successors', to='django_x509.Cert', verbose_name='predecessor'),
+        ),
+    ]
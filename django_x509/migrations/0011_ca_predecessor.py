@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0010_cert_predecessor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ca',
+            name='predecessor',
+            field=models.ForeignKey(blank=True, editable=False, help_text='CA replaced by this CA (see rollover_ca)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='successors', to='django_x509.Ca', verbose_name='predecessor'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0011_ca_predecessor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cert',
+            name='idempotency_key',
+            field=models.CharField(blank=True, default=None, editable=False, help_text='key sent by the client which requested the certificate (see get_or_issue)', max_length=64, null=True, verbose_name='idempotency key'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cert',
+            unique_together=set([('ca', 'serial_number'), ('ca', 'idempotency_key')]),
+        ),
+    ]
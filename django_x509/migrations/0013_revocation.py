@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_ledger(apps, schema_editor):
+    # revocations recorded before the ledger existed
+    Cert = apps.get_model('django_x509', 'Cert')
+    Revocation = apps.get_model('django_x509', 'Revocation')
+    db = schema_editor.connection.alias
+    certs = Cert.objects.using(db).filter(revoked=True).order_by('pk') \
+                        .values_list('ca_id', 'serial_number', 'revoked_at', 'modified',
+                                     'validity_start', 'validity_end')
+    Revocation.objects.using(db).bulk_create(
+        Revocation(ca_id=ca_id, serial_number=serial_number, revoked_at=revoked_at or modified,
+                   validity_start=validity_start, validity_end=validity_end)
+        for ca_id, serial_number, revoked_at, modified, validity_start, validity_end in certs.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0012_cert_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Revocation',
+            fields=[
+                ('sequence', models.AutoField(primary_key=True, serialize=False, verbose_name='sequence')),
+                ('serial_number', models.BigIntegerField(verbose_name='serial number')),
+                ('revoked_at', models.DateTimeField(db_index=True, verbose_name='revoked at')),
+                ('reason', models.CharField(choices=[('unspecified', 'unspecified'), ('keyCompromise', 'key compromise'), ('cACompromise', 'CA compromise'), ('affiliationChanged', 'affiliation changed'), ('superseded', 'superseded'), ('cessationOfOperation', 'cessation of operation'), ('certificateHold', 'certificate hold')], default='unspecified', max_length=32, verbose_name='reason')),
+                ('validity_start', models.DateTimeField(verbose_name='validity start')),
+                ('validity_end', models.DateTimeField(verbose_name='validity end')),
+                ('ca', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revocations', to='django_x509.Ca', verbose_name='CA')),
+            ],
+            options={
+                'verbose_name': 'revocation',
+                'verbose_name_plural': 'revocations',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='revocation',
+            unique_together=set([('ca', 'serial_number')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='revocation',
+            index_together=set([('ca', 'validity_end')]),
+        ),
+        migrations.RunPython(fill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 21:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_last_serial(apps, schema_editor):
+    # serial numbers used to default to the ids of
+    # the rows (including rows which were deleted)
+    Ca = apps.get_model('django_x509', 'Ca')
+    Cert = apps.get_model('django_x509', 'Cert')
+    db = schema_editor.connection.alias
+    last_id = max(Ca.objects.using(db).aggregate(last=Max('pk'))['last'] or 0,
+                  Cert.objects.using(db).aggregate(last=Max('pk'))['last'] or 0)
+    for ca in Ca.objects.using(db).only('pk', 'parent', 'serial_number').iterator():
+        serials = [last_id,
+                   Cert.objects.using(db).filter(ca=ca).aggregate(last=Max('serial_number'))['last'] or 0,
+                   Ca.objects.using(db).filter(parent=ca).aggregate(last=Max('serial_number'))['last'] or 0]
+        if ca.parent_id is None:
+            serials.append(ca.serial_number or 0)
+        Ca.objects.using(db).filter(pk=ca.pk).update(last_serial=max(serials))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_x509', '0013_revocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ca',
+            name='last_serial',
+            field=models.BigIntegerField(default=0, editable=False, help_text='last serial number allocated to a certificate or CA signed by this CA', verbose_name='last serial number'),
+        ),
+        migrations.RunPython(fill_last_serial, migrations.RunPython.noop),
+    ]
@@ -1,2 +1,7 @@
 from .cert import Cert  # noqa
 from .ca import Ca  # noqa
+from .profile import CertProfile  # noqa
+from .tombstone import Tombstone  # noqa
+from .job import Job  # noqa
+from .issuancelog import IssuanceLog  # noqa
+from .revocation import Revocation  # noqa
@@ -1,18 +1,21 @@
 import collections
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, router, transaction
 from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from jsonfield import JSONField
 from model_utils.fields import AutoCreatedField, AutoLastModifiedField
-from OpenSSL import crypto
 
+from .. import metrics, ratelimit
 from .. import settings as app_settings
-from ..utils import bytes_compat
+from ..backends import get_backend
+from ..backends.base import VerificationError
+from ..utils import crypto
+from .job import Job
 
 generalized_time = '%Y%m%d%H%M%SZ'
 
@@ -33,6 +36,12 @@ DIGEST_CHOICES = (
     ('sha512', 'SHA512'),
 )
 
+STATUS_CHOICES = (
+    ('pending', _('pending')),
+    ('issued', _('issued')),
+    ('failed', _('failed')),
+)
+
 SIGNATURE_MAPPING = {
     'sha1WithRSAEncryption': 'sha1',
     'sha224WithRSAEncryption': 'sha224',
@@ -66,6 +75,32 @@ def default_digest_algorithm():
     return app_settings.DEFAULT_DIGEST_ALGORITHM
 
 
+def default_cert_extensions():
+    """
+    returns the ``basicConstraints`` and ``keyUsage``
+    extensions of end-entity certificates
+    """
+    return [
+        ('basicConstraints', False, 'CA:FALSE'),
+        ('keyUsage', app_settings.CERT_KEYUSAGE_CRITICAL, app_settings.CERT_KEYUSAGE_VALUE)
+    ]
+
+
+def verify_extension_format(extensions):
+    """
+    raises ``ValidationError`` if ``extensions`` is not a list
+    of dicts containing ``name``, ``critical`` and ``value``
+    """
+    msg = 'Extension format invalid'
+    if not isinstance(extensions, list):
+        raise ValidationError(msg)
+    for ext in extensions:
+        if not isinstance(ext, dict):
+            raise ValidationError(msg)
+        if not ('name' in ext and 'critical' in ext and 'value' in ext):
+            raise ValidationError(msg)
+
+
 @python_2_unicode_compatible
 class AbstractX509(models.Model):
     """
@@ -107,14 +142,29 @@ class AbstractX509(models.Model):
                                                 help_text=_('leave blank to determine automatically'),
                                                 blank=True,
                                                 null=True)
+    status = models.CharField(_('status'),
+                              max_length=8,
+                              choices=STATUS_CHOICES,
+                              default='issued',
+                              editable=False,
+                              help_text=_('pending certificates are generated by '
+                                          'the x509_worker management command'))
     certificate = models.TextField(blank=True, help_text='certificate in X.509 PEM format')
     private_key = models.TextField(blank=True, help_text='private key in X.509 PEM format')
     created = AutoCreatedField(_('created'), editable=True)
-    modified = AutoLastModifiedField(_('modified'), editable=True)
+    modified = AutoLastModifiedField(_('modified'), editable=True, db_index=True)
 
     class Meta:
         abstract = True
 
+    # cached properties holding objects which can't be pickled
+    unpicklable_attributes = ('x509', 'pkey')
+    # fields copied by renew (see _renew)
+    renew_fields = ('name', 'notes', 'key_length', 'digest', 'country_code', 'state',
+                    'city', 'organization', 'email', 'common_name', 'extensions')
+    # fields saved when a pending instance is generated (see Job)
+    generated_fields = ('certificate', 'private_key', 'status', 'modified')
+
     def __str__(self):
         return self.name
 
@@ -137,17 +187,40 @@ class AbstractX509(models.Model):
         self._verify_extension_format()
 
     def save(self, *args, **kwargs):
+        # public key of a certificate signing request (see AbstractCert.sign_request)
+        # or reused private key (see AbstractCert.renew)
+        public_key = kwargs.pop('public_key', None)
         generate = False
-        if not self.id and not self.certificate and not self.private_key:
+        if not self.id and not self.certificate and (not self.private_key or public_key is not None):
             generate = True
+        # certificates signing requests are always signed right away
+        if generate and app_settings.ASYNC_ISSUANCE and public_key is None:
+            self._save_pending(*args, **kwargs)
+            return
+        if generate:
+            # raises RateLimitExceeded before anything is saved
+            ratelimit.acquire('issue', self._get_issuer())
         super(AbstractX509, self).save(*args, **kwargs)
         if generate:
             # automatically determine serial number
             if not self.serial_number:
-                self.serial_number = self.id
-            self._generate()
+                self.serial_number = self._next_serial_number(kwargs.get('using'))
+            self._generate(public_key)
             super(AbstractX509, self).save(*args, **kwargs)
 
+    def _save_pending(self, *args, **kwargs):
+        """
+        saves a pending instance and the job which generates it
+        (processed by the ``x509_worker`` management command)
+        """
+        self.status = 'pending'
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self))):
+            super(AbstractX509, self).save(*args, **kwargs)
+            if not self.serial_number:
+                self.serial_number = self._next_serial_number(kwargs.get('using'))
+                super(AbstractX509, self).save(using=kwargs.get('using'), update_fields=['serial_number'])
+            Job.enqueue(self)
+
     @cached_property
     def x509(self):
         """
@@ -163,8 +236,7 @@ class AbstractX509(models.Model):
         contained in the x509 certificate
         """
         if self.certificate:
-            text = crypto.dump_certificate(crypto.FILETYPE_TEXT, self.x509)
-            return text.decode('utf-8')
+            return get_backend().dump_text(self)
 
     @cached_property
     def pkey(self):
@@ -174,34 +246,66 @@ class AbstractX509(models.Model):
         if self.private_key:
             return crypto.load_privatekey(crypto.FILETYPE_PEM, self.private_key)
 
-    def _generate(self):
+    def __reduce__(self):
+        # the parsed crypto objects can't be pickled,
+        # they're rebuilt from the PEM fields when accessed
+        reconstructor, args, state = super(AbstractX509, self).__reduce__()
+        state = dict((attr, value) for attr, value in state.items()
+                     if attr not in self.unpicklable_attributes)
+        return reconstructor, args, state
+
+    def __setstate__(self, state):
+        for attr in self.unpicklable_attributes:
+            state.pop(attr, None)
+        super(AbstractX509, self).__setstate__(state)
+
+    def _renew(self, reuse_key, validity, **kwargs):
         """
         (internal use only)
-        generates a new x509 certificate (CA or end-entity)
-        """
-        key = crypto.PKey()
-        key.generate_key(crypto.TYPE_RSA, int(self.key_length))
-        cert = crypto.X509()
-        subject = self._fill_subject(cert.get_subject())
-        cert.set_version(0x2)  # version 3 (0 indexed counting)
-        cert.set_subject(subject)
-        cert.set_serial_number(self.serial_number)
-        cert.set_notBefore(bytes_compat(self.validity_start.strftime(generalized_time)))
-        cert.set_notAfter(bytes_compat(self.validity_end.strftime(generalized_time)))
-        # generating certificate for CA
-        if not hasattr(self, 'ca'):
-            issuer = subject
-            issuer_key = key
-        # generating certificate issued by a CA
+        saves and returns a copy of this instance (``renew_fields``
+        and ``kwargs``) which has this instance as ``predecessor``
+        """
+        if validity is None:
+            validity = self.validity_end - self.validity_start
+        elif not isinstance(validity, timedelta):
+            validity = timedelta(days=validity)
+        now = timezone.now()
+        successor = type(self)(predecessor=self, validity_start=now, validity_end=now + validity)
+        for field in self.renew_fields:
+            setattr(successor, field, getattr(self, field))
+        for field, value in kwargs.items():
+            setattr(successor, field, value)
+        key = None
+        if reuse_key and self.private_key:
+            key = get_backend().load_private_key(self.private_key)
+            successor.private_key = self.private_key
+        elif reuse_key and successor._get_issuer() is not None:
+            # certificates issued for signing requests keep their public key
+            key = get_backend().load_public_key(self.certificate)
+        elif reuse_key:
+            raise ValueError('the private key of this {0} is not known'.format(self._meta.verbose_name))
+        successor.save(public_key=key)
+        return successor
+
+    def _generate(self, public_key=None):
+        """
+        (internal use only)
+        generates a new x509 certificate (CA or end-entity);
+        a new private key is generated unless ``public_key``
+        (in the native format of the backend) is given
+        """
+        backend = get_backend()
+        model = self._meta.model_name
+        if public_key is None:
+            with metrics.keygen_seconds.time(model=model, key_length=self.key_length):
+                key = backend.generate_key(int(self.key_length))
         else:
-            issuer = self.ca.x509.get_subject()
-            issuer_key = self.ca.pkey
-        cert.set_issuer(issuer)
-        cert.set_pubkey(key)
-        cert = self._add_extensions(cert)
-        cert.sign(issuer_key, str(self.digest))
-        self.certificate = crypto.dump_certificate(crypto.FILETYPE_PEM, cert)
-        self.private_key = crypto.dump_privatekey(crypto.FILETYPE_PEM, key)
+            key = public_key
+        with metrics.sign_seconds.time(model=model, digest=self.digest):
+            self.certificate = backend.sign(self, key, self._get_issuer())
+            if public_key is None:
+                self.private_key = backend.dump_private_key(key)
+        metrics.issued_total.inc(model=model)
 
     def _fill_subject(self, subject):
         """
@@ -228,34 +332,14 @@ class AbstractX509(models.Model):
         (internal use only)
         imports existing x509 certificates
         """
-        cert = self.x509
-        # when importing an end entity certificate
-        if hasattr(self, 'ca'):
-            self._verify_ca()
-        self.key_length = str(cert.get_pubkey().bits())
-        # this line might fail if a certificate with
-        # an unsupported signature algorithm is imported
-        algorithm = cert.get_signature_algorithm().decode('utf8')
-        self.digest = SIGNATURE_MAPPING[algorithm]
-        not_before = cert.get_notBefore().decode('utf8')
-        self.validity_start = datetime.strptime(not_before,
-                                                generalized_time)
-        self.validity_start = timezone.make_aware(self.validity_start)
-        not_after = cert.get_notAfter().decode('utf8')
-        self.validity_end = datetime.strptime(not_after,
-                                              generalized_time)
-        self.validity_end.replace(tzinfo=timezone.tzinfo())
-        self.validity_end = timezone.make_aware(self.validity_end)
-        subject = cert.get_subject()
-        self.country_code = subject.countryName or ''
-        self.state = subject.stateOrProvinceName or ''
-        self.city = subject.localityName or ''
-        self.organization = subject.organizationName or ''
-        self.email = subject.emailAddress or ''
-        self.common_name = subject.commonName
-        self.serial_number = cert.get_serial_number()
-        if not self.name:
-            self.name = self.common_name
+        with metrics.import_seconds.time(model=self._meta.model_name):
+            # when importing a certificate which is not self-signed
+            if self._get_issuer() is not None:
+                self._verify_ca()
+            for attr, value in get_backend().parse(self).items():
+                setattr(self, attr, value)
+            if not self.name:
+                self.name = self.common_name
 
     def _verify_ca(self):
         """
@@ -263,57 +347,94 @@ class AbstractX509(models.Model):
         verifies the current x509 is signed
         by the associated CA
         """
-        store = crypto.X509Store()
-        store.add_cert(self.ca.x509)
-        store_ctx = crypto.X509StoreContext(store, self.x509)
-        try:
-            store_ctx.verify_certificate()
-        except crypto.X509StoreContextError as e:
-            raise ValidationError(_("CA doesn't match, got the"
-                                    "following error from pyOpenSSL: \"%s\"") % e.args[0][2])
+        backend = get_backend()
+        with metrics.verify_ca_seconds.time(model=self._meta.model_name):
+            try:
+                backend.verify(self, self._get_issuer())
+            except VerificationError as e:
+                msg = _('CA doesn\'t match, got the following error from %(backend)s: "%(error)s"')
+                raise ValidationError(msg % {'backend': backend.name, 'error': e})
+
+    def _get_issuer(self):
+        """
+        (internal use only)
+        returns the CA which signs this certificate
+        (``None`` for self-signed certificates)
+        """
+        return getattr(self, 'ca', None)
+
+    def _next_serial_number(self, using=None):
+        """
+        (internal use only)
+        returns the next serial number of the issuer
+        (the instance itself for self-signed certificates)
+        """
+        issuer = self._get_issuer() or self
+        return issuer._next_serial(using)
+
+    def _get_pathlen(self):
+        """
+        (internal use only)
+        returns the path length constraint of CA certificates
+        """
+        return app_settings.CA_BASIC_CONSTRAINTS_PATHLEN
 
     def _verify_extension_format(self):
         """
         (internal use only)
         verifies the format of ``self.extension`` is correct
         """
-        msg = 'Extension format invalid'
-        if not isinstance(self.extensions, list):
-            raise ValidationError(msg)
-        for ext in self.extensions:
-            if not isinstance(ext, dict):
-                raise ValidationError(msg)
-            if not ('name' in ext and 'critical' in ext and 'value' in ext):
-                raise ValidationError(msg)
+        verify_extension_format(self.extensions)
 
-    def _add_extensions(self, cert):
+    def _get_extensions(self):
         """
         (internal use only)
-        adds x509 extensions to ``cert``
+        returns the ``basicConstraints`` and ``keyUsage`` extensions
+        as a list of ``(name, critical, value)`` tuples
         """
-        ext = []
-        # prepare extensions for CA
+        # extensions for CA
         if not hasattr(self, 'ca'):
-            pathlen = app_settings.CA_BASIC_CONSTRAINTS_PATHLEN
+            pathlen = self._get_pathlen()
             ext_value = 'CA:TRUE'
             if pathlen is not None:
                 ext_value = '{0}, pathlen:{1}'.format(ext_value, pathlen)
-            ext.append(crypto.X509Extension(b'basicConstraints',
-                                            app_settings.CA_BASIC_CONSTRAINTS_CRITICAL,
-                                            bytes_compat(ext_value)))
-            ext.append(crypto.X509Extension(b'keyUsage',
-                                            app_settings.CA_KEYUSAGE_CRITICAL,
-                                            bytes_compat(app_settings.CA_KEYUSAGE_VALUE)))
-            issuer_cert = cert
-        # prepare extensions for end-entity certs
-        else:
-            ext.append(crypto.X509Extension(b'basicConstraints',
-                                            False,
-                                            b'CA:FALSE'))
-            ext.append(crypto.X509Extension(b'keyUsage',
-                                            app_settings.CERT_KEYUSAGE_CRITICAL,
-                                            bytes_compat(app_settings.CERT_KEYUSAGE_VALUE)))
-            issuer_cert = self.ca.x509
+            return [
+                ('basicConstraints', app_settings.CA_BASIC_CONSTRAINTS_CRITICAL, ext_value),
+                ('keyUsage', app_settings.CA_KEYUSAGE_CRITICAL, app_settings.CA_KEYUSAGE_VALUE)
+            ]
+        # extensions for end-entity certs
+        return default_cert_extensions()
+
+    def _get_extra_extensions(self):
+        """
+        (internal use only)
+        returns ``self.extensions`` as a list
+        of ``(name, critical, value)`` tuples
+        """
+        return [(ext['name'], bool(ext['critical']), ext['value'])
+                for ext in self.extensions]
+
+    def _compile_extensions(self, backend):
+        """
+        (internal use only)
+        returns the extensions of ``_get_extensions`` and
+        ``_get_extra_extensions`` converted to the native
+        objects of ``backend`` (tuple of two lists)
+        """
+        return (backend.compile_extensions(self._get_extensions()),
+                backend.compile_extensions(self._get_extra_extensions()))
+
+    def _add_extensions(self, cert, extensions, extra_extensions):
+        """
+        (internal use only)
+        adds x509 extensions to ``cert``
+        (``OpenSSL.crypto.X509`` instance);
+        ``extensions`` and ``extra_extensions``
+        are returned by ``_compile_extensions``
+        """
+        ext = list(extensions)
+        issuer = self._get_issuer()
+        issuer_cert = issuer.x509 if issuer is not None else cert
         ext.append(crypto.X509Extension(b'subjectKeyIdentifier',
                                         False,
                                         b'hash',
@@ -327,10 +448,6 @@ class AbstractX509(models.Model):
                                  b'keyid:always,issuer:always',
                                  issuer=issuer_cert)
         ])
-        for ext in self.extensions:
-            cert.add_extensions([
-                crypto.X509Extension(bytes_compat(ext['name']),
-                                     bool(ext['critical']),
-                                     bytes_compat(ext['value']))
-            ])
+        if extra_extensions:
+            cert.add_extensions(extra_extensions)
         return cert
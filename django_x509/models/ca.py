@@ -1,12 +1,30 @@
+import re
+import threading
+import time
 from datetime import timedelta
 
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import models, router, transaction
 from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
-from OpenSSL import crypto
 
+from .. import metrics, ratelimit, routers
 from .. import settings as app_settings
-from ..utils import bytes_compat
-from .base import AbstractX509, generalized_time
+from ..backends import get_backend
+from ..bloom import BloomFilter
+from .base import AbstractX509
+from .issuancelog import IssuanceLog
+
+# serial numbers of short-lived certificates don't collide with the serial
+# numbers of certificates, which are allocated from ``Ca.last_serial``
+EPHEMERAL_SERIAL_START = 2 ** 32
+
+# blocks of serial numbers reserved by this process, by (database, CA id)
+_ephemeral_serials = {}
+_ephemeral_lock = threading.Lock()
 
 
 def default_ca_validity_end():
@@ -17,15 +35,179 @@ def default_ca_validity_end():
     return timezone.now() + delta
 
 
+def _cache_key(db, pk):
+    return 'django_x509:ca:{0}:{1}'.format(db, pk)
+
+
+class CaQuerySet(models.QuerySet):
+    def get_cached(self, pk):
+        """
+        Returns the CA ``pk`` from the cache ``DJANGO_X509_CA_CACHE``;
+        only ``modified``, ``status`` and ``atomic_fields`` (which are
+        changed with queryset updates) are read from the database, the
+        whole row is fetched again (and cached) if the CA has been modified
+        """
+        fields = ('modified', 'status') + self.model.atomic_fields
+        values = self.filter(pk=pk).values(*fields).first()
+        if values is None:
+            raise self.model.DoesNotExist('{0} matching query does not exist.'.format(
+                self.model._meta.object_name))
+        cache = caches[app_settings.CA_CACHE]
+        key = _cache_key(self.db, pk)
+        ca = cache.get(key)
+        if ca is None or ca.modified != values['modified']:
+            ca = self.get(pk=pk)
+            cache.set(key, ca, app_settings.CA_CACHE_TIMEOUT)
+        for field, value in values.items():
+            setattr(ca, field, value)
+        return ca
+
+
 class AbstractCa(AbstractX509):
     """
     Abstract Ca model (for reuse)
     """
+    parent = models.ForeignKey('django_x509.Ca',
+                               verbose_name=_('parent CA'),
+                               related_name='children',
+                               blank=True,
+                               null=True,
+                               help_text=_('leave blank to create a self-signed root CA'))
+    chain = models.TextField(_('certificate chain'),
+                             blank=True,
+                             editable=False,
+                             help_text=_('certificates of this CA and of its '
+                                         'parents up to the root CA, in PEM format'))
+    crl_version = models.PositiveIntegerField(_('CRL version'),
+                                              default=0,
+                                              editable=False,
+                                              help_text=_('incremented when a certificate '
+                                                          'of this CA is revoked'))
+    revoked_filter = models.BinaryField(_('revoked serial numbers filter'),
+                                        blank=True,
+                                        null=True,
+                                        editable=False)
+    predecessor = models.ForeignKey('self',
+                                    verbose_name=_('predecessor'),
+                                    related_name='successors',
+                                    blank=True,
+                                    null=True,
+                                    editable=False,
+                                    on_delete=models.SET_NULL,
+                                    help_text=_('CA replaced by this CA (see rollover_ca)'))
+    last_serial = models.BigIntegerField(_('last serial number'),
+                                         default=0,
+                                         editable=False,
+                                         help_text=_('last serial number allocated to a '
+                                                     'certificate or CA signed by this CA'))
+    ephemeral_serial = models.BigIntegerField(_('ephemeral serial number'),
+                                              default=EPHEMERAL_SERIAL_START,
+                                              editable=False,
+                                              help_text=_('end of the last block of serial numbers '
+                                                          'reserved for short-lived certificates'))
+
+    objects = CaQuerySet.as_manager()
+
     class Meta:
         abstract = True
         verbose_name = _('CA')
         verbose_name_plural = _('CAs')
 
+    # fields which are only changed with atomic queryset updates
+    atomic_fields = ('crl_version', 'revoked_filter', 'ephemeral_serial', 'last_serial')
+    # fields copied by renew
+    renew_fields = AbstractX509.renew_fields + ('parent',)
+    generated_fields = AbstractX509.generated_fields + ('chain',)
+
+    def save(self, *args, **kwargs):
+        # saving an instance loaded before a revocation
+        # must not overwrite the values of atomic_fields
+        if not self._state.adding and not args and \
+                kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and
+                                       field.name not in self.atomic_fields]
+        if self.certificate and not self.chain:
+            self.chain = self._build_chain()
+        super(AbstractCa, self).save(*args, **kwargs)
+        if self.pk:
+            db = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+            caches[app_settings.CA_CACHE].delete(_cache_key(db, self.pk))
+
+    def clean(self):
+        super(AbstractCa, self).clean()
+        if self.parent_id and self.parent.pathlen == 0:
+            raise ValidationError({'parent': _('The path length constraint of this CA '
+                                               'does not allow to sign other CAs')})
+
+    @cached_property
+    def pathlen(self):
+        """
+        Returns the path length constraint of the CA certificate
+        (``None`` means no constraint)
+        """
+        x509 = self.x509
+        for i in range(x509.get_extension_count()):
+            extension = x509.get_extension(i)
+            if extension.get_short_name() == b'basicConstraints':
+                match = re.search(r'pathlen:(\d+)', str(extension))
+                return int(match.group(1)) if match else None
+        return None
+
+    def _get_issuer(self):
+        return self.parent
+
+    def renew(self, reuse_key=False, validity=None):
+        """
+        Saves and returns a new CA with the same subject, parent
+        and extensions of this CA, which becomes its ``predecessor``;
+        a new private key is generated unless ``reuse_key`` is ``True``;
+        ``validity`` (a ``timedelta`` or a number of days) defaults to
+        the validity period of this CA. The certificates of this CA
+        are not affected (see ``django_x509.rollover.rollover_ca``).
+        """
+        return self._renew(reuse_key, validity)
+
+    def _get_pathlen(self):
+        if self.parent is None:
+            return super(AbstractCa, self)._get_pathlen()
+        if self.parent.pathlen is None:
+            return None
+        if self.parent.pathlen == 0:
+            raise ValidationError(_('The path length constraint of the parent CA '
+                                    'does not allow to sign other CAs'))
+        return self.parent.pathlen - 1
+
+    def _generate(self, public_key=None):
+        super(AbstractCa, self)._generate(public_key)
+        self.chain = self._build_chain()
+
+    def _build_chain(self):
+        """
+        (internal use only)
+        returns the PEM certificates of this CA
+        and of its parents up to the root CA
+        """
+        chain = force_text(self.certificate)
+        if self.parent is not None:
+            chain += self.parent.get_chain()
+        return chain
+
+    def get_chain(self):
+        """
+        Returns the PEM certificates of this CA and of its parents
+        up to the root CA (stored in the database, the hierarchy
+        of CAs is not walked)
+        """
+        return self.chain or force_text(self.certificate)
+
+    def iter_cert_summaries(self, chunk_size=2000):
+        """
+        Yields a ``CertSummary`` for each certificate of this CA
+        (see ``CertQuerySet.summaries``)
+        """
+        return self.cert_set.all().summaries(chunk_size)
+
     def get_revoked_certs(self):
         """
         Returns revoked certificates of this CA
@@ -36,21 +218,196 @@ class AbstractCa(AbstractX509):
                                     validity_start__lte=now,
                                     validity_end__gte=now)
 
+    def get_revocations(self):
+        """
+        Returns the entries of the ``Revocation`` ledger of the
+        revoked certificates of this CA (does not include expired
+        certificates), which are read by CRL generation
+        """
+        return self.revocations.active()
+
     @property
     def crl(self):
         """
         Returns up to date CRL of this CA
         """
-        revoked_certs = self.get_revoked_certs()
-        crl = crypto.CRL()
-        now_str = timezone.now().strftime(generalized_time)
-        for cert in revoked_certs:
-            revoked = crypto.Revoked()
-            revoked.set_serial(bytes_compat(cert.serial_number))
-            revoked.set_reason(b'unspecified')
-            revoked.set_rev_date(bytes_compat(now_str))
-            crl.add_revoked(revoked)
-        return crl.export(self.x509, self.pkey, days=1)
+        with metrics.crl_generation_seconds.time(ca=self.pk):
+            revoked = self.get_revocations().values_list('serial_number', 'revoked_at', 'reason')
+            crl = get_backend().build_crl(self, list(revoked))
+        metrics.crl_generated_total.inc(ca=self.pk)
+        return crl
+
+    def invalidate_crl(self):
+        """
+        Increments the CRL version, which invalidates
+        the CRL stored in the cache by ``get_cached_crl``
+        """
+        type(self).objects.filter(pk=self.pk).update(crl_version=models.F('crl_version') + 1)
+        # queryset updates don't send post_save
+        routers.record_write(self.pk)
+
+    def get_cached_crl(self):
+        """
+        Returns the CRL of this CA from the cache, the CRL is
+        generated again only if its version is older than
+        ``crl_version``; while a process rebuilds it (holding
+        a lock in the cache) the other processes keep returning
+        the previous version or, if there's none, wait for it;
+        the previous version is also returned when the ``crl``
+        rate limit is exceeded (``RateLimitExceeded`` is raised
+        if there's none)
+        """
+        cache = caches[app_settings.CRL_CACHE]
+        key = 'django_x509:crl:{0}'.format(self.pk)
+        lock_key = '{0}:lock'.format(key)
+        version = self.crl_version
+        cached = cache.get(key)
+        if cached is not None and cached[0] >= version:
+            return cached[1]
+        if cache.add(lock_key, True, app_settings.CRL_LOCK_TIMEOUT):
+            try:
+                try:
+                    ratelimit.acquire('crl', self)
+                except ratelimit.RateLimitExceeded:
+                    # the previous version is returned until
+                    # the CRL can be generated again
+                    if cached is not None:
+                        return cached[1]
+                    raise
+                crl = self.crl
+                cache.set(key, (version, crl), app_settings.CRL_CACHE_TIMEOUT)
+            finally:
+                cache.delete(lock_key)
+            return crl
+        if cached is not None:
+            return cached[1]
+        deadline = time.time() + app_settings.CRL_LOCK_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            cached = cache.get(key)
+            if cached is not None and cached[0] >= version:
+                return cached[1]
+        # the process holding the lock is taking too long
+        return self.crl
+
+    def build_revoked_filter(self, using=None):
+        """
+        Returns a new ``BloomFilter`` of the serial numbers of
+        the revoked certificates of this CA (does not include
+        expired certificates)
+        """
+        revoked = self.get_revocations()
+        if using:
+            revoked = revoked.using(using)
+        serial_numbers = list(revoked.values_list('serial_number', flat=True))
+        bloom = BloomFilter(capacity=max(len(serial_numbers) * 2,
+                                         app_settings.REVOKED_FILTER_CAPACITY),
+                            error_rate=app_settings.REVOKED_FILTER_ERROR_RATE)
+        for serial_number in serial_numbers:
+            bloom.add(serial_number)
+        return bloom
+
+    def get_revoked_filter(self):
+        """
+        Returns the stored ``BloomFilter`` of revoked serial
+        numbers, building it if it does not exist yet
+        """
+        if self.revoked_filter is None:
+            return self.update_revoked_filter()
+        return BloomFilter.from_bytes(self.revoked_filter)
+
+    def update_revoked_filter(self, *serial_numbers):
+        """
+        Adds ``serial_numbers`` to the stored filter of revoked
+        serial numbers and returns it; the filter is built again
+        if it does not exist, if it would overflow its capacity
+        or if no serial number is given
+        """
+        model = type(self)
+        db = router.db_for_write(model, instance=self)
+        queryset = model.objects.using(db).filter(pk=self.pk)
+        with transaction.atomic(using=db):
+            stored = queryset.select_for_update().values_list('revoked_filter', flat=True)[0]
+            if not serial_numbers or stored is None:
+                bloom = self.build_revoked_filter(using=db)
+            else:
+                bloom = BloomFilter.from_bytes(stored)
+                if len(bloom) + len(serial_numbers) > bloom.capacity:
+                    bloom = self.build_revoked_filter(using=db)
+                else:
+                    for serial_number in serial_numbers:
+                        bloom.add(serial_number)
+            self.revoked_filter = bloom.to_bytes()
+            queryset.update(revoked_filter=self.revoked_filter)
+        return bloom
+
+    def issue_ephemeral(self, subject=None, validity=None, csr=None, **kwargs):
+        """
+        Signs a short-lived certificate without saving a ``Cert``
+        and returns it (unsaved); ``subject`` is a dict of subject
+        fields (eg: ``common_name``), ``validity`` a ``timedelta`` or
+        a number of seconds (defaults to ``DJANGO_X509_EPHEMERAL_VALIDITY``)
+        and ``csr`` a PEM certificate signing request (a new private key
+        is generated when missing); other keyword arguments are set
+        on the certificate (eg: ``key_length``, ``extensions``).
+        Serial numbers are reserved from the CA in blocks and the
+        certificate is recorded in ``IssuanceLog`` in batches.
+        """
+        if validity is None:
+            validity = app_settings.EPHEMERAL_VALIDITY
+        if not isinstance(validity, timedelta):
+            validity = timedelta(seconds=validity)
+        now = timezone.now()
+        kwargs.update(subject or {})
+        cert = self.cert_set.model(ca=self, validity_start=now, validity_end=now + validity, **kwargs)
+        public_key = cert._load_csr(csr) if csr else None
+        if not cert.name:
+            cert.name = cert.common_name
+        cert.full_clean(exclude=['ca', 'serial_number'], validate_unique=False)
+        ratelimit.acquire('issue', self)
+        cert.serial_number = self._next_ephemeral_serial()
+        cert._generate(public_key)
+        IssuanceLog.append(cert)
+        return cert
+
+    def _next_serial(self, using=None):
+        """
+        (internal use only)
+        allocates and returns the next serial number of the
+        certificates signed by this CA (including the CAs it signs
+        and, for root CAs, its own certificate): serial numbers
+        are unique per issuer, not per table
+        """
+        model = type(self)
+        db = using or router.db_for_write(model, instance=self)
+        queryset = model.objects.using(db).filter(pk=self.pk)
+        with transaction.atomic(using=db):
+            queryset.update(last_serial=models.F('last_serial') + 1)
+            self.last_serial = queryset.values_list('last_serial', flat=True)[0]
+        return self.last_serial
+
+    def _next_ephemeral_serial(self):
+        """
+        (internal use only)
+        returns a unique serial number for a short-lived certificate,
+        reserving a block of ``DJANGO_X509_EPHEMERAL_SERIAL_BLOCK``
+        serial numbers from the database when needed
+        """
+        model = type(self)
+        db = router.db_for_write(model, instance=self)
+        key = (db, self.pk)
+        with _ephemeral_lock:
+            block = _ephemeral_serials.get(key)
+            if block is None or block[0] >= block[1]:
+                size = app_settings.EPHEMERAL_SERIAL_BLOCK
+                queryset = model.objects.using(db).filter(pk=self.pk)
+                with transaction.atomic(using=db):
+                    queryset.update(ephemeral_serial=models.F('ephemeral_serial') + size)
+                    end = queryset.values_list('ephemeral_serial', flat=True)[0]
+                block = _ephemeral_serials[key] = [end - size, end]
+            serial_number = block[0]
+            block[0] += 1
+        return serial_number
 
 AbstractCa._meta.get_field('validity_end').default = default_ca_validity_end
 
@@ -1,8 +1,127 @@
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import Q
 from django.utils import timezone
+from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 
+from ..backends import get_backend
+from ..signals import cert_revoked
 from .base import AbstractX509
+from .revocation import REASON_CHOICES, Revocation
+
+
+class CertSummary(object):
+    """
+    lightweight read-only record of a certificate,
+    yielded by ``CertQuerySet.summaries``
+    """
+    __slots__ = ('id', 'serial_number', 'common_name', 'validity_start',
+                 'validity_end', 'revoked', 'revoked_at')
+
+    def __init__(self, id, serial_number, common_name, validity_start,
+                 validity_end, revoked, revoked_at):
+        self.id = id
+        self.serial_number = serial_number
+        self.common_name = common_name
+        self.validity_start = validity_start
+        self.validity_end = validity_end
+        self.revoked = revoked
+        self.revoked_at = revoked_at
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __repr__(self):
+        return '<CertSummary {0}: {1}>'.format(self.id, self.common_name)
+
+
+class CertQuerySet(models.QuerySet):
+    def summaries(self, chunk_size=2000):
+        """
+        Yields a ``CertSummary`` for each certificate, ordered by
+        primary key; rows are fetched ``chunk_size`` at a time
+        and model instances are not created, hence neither the
+        ``extensions`` nor the PEM fields are loaded
+        """
+        chunk_size = max(int(chunk_size), 1)
+        fields = CertSummary.__slots__
+        queryset = self.order_by('pk').values_list(*fields)
+        last_pk = None
+        while True:
+            chunk = queryset
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            rows = 0
+            for row in chunk[:chunk_size].iterator():
+                rows += 1
+                yield CertSummary(*row)
+            if rows < chunk_size:
+                break
+            last_pk = row[0]
+
+    def valid(self):
+        """
+        Returns the certificates which are neither revoked,
+        expired nor failed (pending certificates are included)
+        """
+        return self.filter(revoked=False, validity_end__gt=timezone.now()).exclude(status='failed')
+
+    def get_or_issue(self, ca, idempotency_key, csr=None, **kwargs):
+        """
+        Returns ``(cert, issued)``: the valid certificate of ``ca`` whose
+        ``idempotency_key`` is ``idempotency_key`` if it exists (``kwargs``
+        are ignored), otherwise a new certificate saved with the values of
+        ``kwargs`` (for the public key of the PEM certificate signing
+        request ``csr`` if given). Concurrent calls with the same key
+        wait for the one which issues the certificate and return it.
+        """
+        cert = self.model(ca=ca, idempotency_key=idempotency_key, **kwargs)
+
+        def save():
+            public_key = cert._load_csr(csr) if csr else None
+            if not cert.name:
+                cert.name = cert.common_name
+            cert.save(public_key=public_key)
+
+        return self._get_or_save(cert, save)
+
+    def _get_or_save(self, cert, save):
+        """
+        (internal use only)
+        returns ``(existing valid certificate, False)`` if the
+        idempotency key of ``cert`` has been used, otherwise
+        calls ``save`` and returns ``(cert, True)``
+        """
+        db = self._db or router.db_for_write(self.model)
+        queryset = self.using(db).filter(ca=cert.ca, idempotency_key=cert.idempotency_key)
+        existing = queryset.valid().first()
+        if existing is not None:
+            return existing, False
+        # the key of revoked, expired or failed certificates can be used again
+        # (valid certificates inserted by concurrent calls keep it)
+        queryset.filter(Q(revoked=True) | Q(validity_end__lte=timezone.now()) | Q(status='failed')) \
+                .update(idempotency_key=None)
+        try:
+            # the row inserted first holds the key: concurrent inserts
+            # wait on the unique index until the issuance is committed
+            with transaction.atomic(using=db):
+                save()
+        except IntegrityError:
+            existing = queryset.first()
+            if existing is None:
+                raise
+            return existing, False
+        return cert, True
+
+    def renew(self, reuse_key=True, validity=None, processes=1, chunk_size=100):
+        """
+        Renews each certificate with ``Cert.renew`` in a pool of
+        ``processes`` worker processes, see ``django_x509.renewal.renew_certs``
+        """
+        from ..renewal import renew_certs
+        return renew_certs(self, reuse_key=reuse_key, validity=validity,
+                           processes=processes, chunk_size=chunk_size)
 
 
 class AbstractCert(AbstractX509):
@@ -10,12 +129,35 @@ class AbstractCert(AbstractX509):
     Abstract Cert model
     """
     ca = models.ForeignKey('django_x509.Ca', verbose_name=_('CA'))
+    profile = models.ForeignKey('django_x509.CertProfile',
+                                verbose_name=_('profile'),
+                                blank=True,
+                                null=True,
+                                on_delete=models.SET_NULL)
     revoked = models.BooleanField(_('revoked'),
                                   default=False)
     revoked_at = models.DateTimeField(_('revoked at'),
                                       blank=True,
                                       null=True,
                                       default=None)
+    predecessor = models.ForeignKey('self',
+                                    verbose_name=_('predecessor'),
+                                    related_name='successors',
+                                    blank=True,
+                                    null=True,
+                                    editable=False,
+                                    on_delete=models.SET_NULL,
+                                    help_text=_('certificate renewed by this certificate'))
+    idempotency_key = models.CharField(_('idempotency key'),
+                                       max_length=64,
+                                       blank=True,
+                                       null=True,
+                                       default=None,
+                                       editable=False,
+                                       help_text=_('key sent by the client which requested '
+                                                   'the certificate (see get_or_issue)'))
+
+    objects = CertQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -24,17 +166,95 @@ class AbstractCert(AbstractX509):
         abstract = True
         verbose_name = _('certificate')
         verbose_name_plural = _('certificates')
-        unique_together = ('ca', 'serial_number')
+        unique_together = (('ca', 'serial_number'), ('ca', 'idempotency_key'))
+
+    # fields copied by renew
+    renew_fields = AbstractX509.renew_fields + ('profile',)
+
+    def _compile_extensions(self, backend):
+        # certificates issued with a profile reuse its
+        # compiled extensions unless they have been changed
+        if self.profile_id and self.extensions == self.profile.extensions:
+            return self.profile.get_compiled().get_native(backend)
+        return super(AbstractCert, self)._compile_extensions(backend)
+
+    def sign_request(self, csr):
+        """
+        Saves this new certificate for the public key of the PEM
+        certificate signing request ``csr``; empty subject fields
+        are filled with the values of the request and
+        ``private_key`` is left empty (it's not known)
+        """
+        self.save(public_key=self._load_csr(csr))
 
-    def revoke(self):
+    def _load_csr(self, csr):
+        """
+        (internal use only)
+        fills the empty subject fields with the values of
+        the PEM certificate signing request ``csr`` and
+        returns its public key
+        """
+        public_key, attrs = get_backend().load_csr(csr)
+        for attr, value in attrs.items():
+            if not getattr(self, attr):
+                setattr(self, attr, value)
+        self.key_length = attrs['key_length']
+        if not self.name:
+            self.name = self.common_name
+        return public_key
+
+    def renew(self, reuse_key=True, validity=None, ca=None):
+        """
+        Saves and returns a new certificate with the same subject,
+        profile and extensions of this certificate, which becomes
+        its ``predecessor``, signed by ``ca`` (defaults to the CA of
+        this certificate); the private key (or, for certificates issued
+        for signing requests, the public key) of this certificate is
+        reused unless ``reuse_key`` is ``False`` (which generates
+        a new one); ``validity`` (a ``timedelta`` or a number of days)
+        defaults to the validity period of this certificate
+        """
+        return self._renew(reuse_key, validity, ca=ca or self.ca)
+
+    def get_chain(self):
+        """
+        Returns the PEM certificates of this certificate,
+        of its CA and of its parents up to the root CA
+        """
+        return force_text(self.certificate) + self.ca.get_chain()
+
+    def revoke(self, reason='unspecified'):
         """
         * flag certificate as revoked
         * fill in revoked_at DateTimeField
+        * append it to the ``Revocation`` ledger with ``reason``
+        * invalidate the cached CRL of the CA
+        * add the serial number to the revoked filter of the CA
+        * send the ``cert_revoked`` signal
+
+        only issued certificates can be revoked; the other
+        columns of the row are not written, hence the instance
+        may be stale (eg: loaded before being issued)
         """
+        if reason not in dict(REASON_CHOICES):
+            raise ValueError('unknown revocation reason: {0}'.format(reason))
         now = timezone.now()
-        self.revoked = True
-        self.revoked_at = now
-        self.save()
+        db = router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=db):
+            updated = type(self).objects.using(db) \
+                                        .filter(pk=self.pk, status='issued') \
+                                        .update(revoked=True, revoked_at=now, modified=now)
+            if not updated:
+                raise ValueError('only issued certificates can be revoked')
+            self.revoked = True
+            self.revoked_at = now
+            self.modified = now
+            Revocation.record([self], reason, using=db)
+            # in the transaction, otherwise a failure would leave
+            # a stale CRL and a false negative of the filter
+            self.ca.invalidate_crl()
+            self.ca.update_revoked_filter(self.serial_number)
+        cert_revoked.send(sender=self.__class__, instance=self)
 
 
 class Cert(AbstractCert):
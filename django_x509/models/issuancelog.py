@@ -0,0 +1,165 @@
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.db import IntegrityError, connections, models, router, transaction
+from django.utils.encoding import force_bytes, python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
+
+from .. import settings as app_settings
+
+logger = logging.getLogger(__name__)
+
+# entries waiting to be written, grouped by database
+_buffer = defaultdict(list)
+_buffer_since = {}
+# timers which flush the buffers of idle processes, by database
+_timers = {}
+_lock = threading.Lock()
+
+
+def subject_hash(instance):
+    """
+    returns the SHA1 hex digest of the subject fields of ``instance``
+    """
+    fields = ('country_code', 'state', 'city', 'organization', 'email', 'common_name')
+    subject = '\n'.join(getattr(instance, field) or '' for field in fields)
+    return hashlib.sha1(force_bytes(subject)).hexdigest()
+
+
+@python_2_unicode_compatible
+class IssuanceLog(models.Model):
+    """
+    Append-only record of a short-lived certificate
+    issued with ``Ca.issue_ephemeral``
+    """
+    ca = models.ForeignKey('django_x509.Ca', verbose_name=_('CA'), on_delete=models.CASCADE)
+    serial_number = models.BigIntegerField(_('serial number'))
+    subject_hash = models.CharField(_('subject hash'), max_length=40)
+    validity_end = models.DateTimeField(_('validity end'))
+
+    class Meta:
+        verbose_name = _('issuance log entry')
+        verbose_name_plural = _('issuance log')
+        unique_together = ('ca', 'serial_number')
+
+    def __str__(self):
+        return '{0} {1}'.format(self.ca_id, self.serial_number)
+
+    @classmethod
+    def append(cls, instance):
+        """
+        buffers the entry of the certificate ``instance``; entries are
+        written with a single query when ``DJANGO_X509_EPHEMERAL_LOG_BATCH_SIZE``
+        entries are buffered or when the oldest entry has been buffered for
+        more than ``DJANGO_X509_EPHEMERAL_LOG_FLUSH_INTERVAL`` seconds (by a
+        timer thread if no other entry is appended in the meantime)
+        """
+        db = router.db_for_write(cls, instance=instance.ca)
+        entry = cls(ca_id=instance.ca_id,
+                    serial_number=instance.serial_number,
+                    subject_hash=subject_hash(instance),
+                    validity_end=instance.validity_end)
+        now = time.time()
+        with _lock:
+            _buffer[db].append(entry)
+            _buffer_since.setdefault(db, now)
+            full = len(_buffer[db]) >= app_settings.EPHEMERAL_LOG_BATCH_SIZE or \
+                now - _buffer_since[db] >= app_settings.EPHEMERAL_LOG_FLUSH_INTERVAL
+            if not full:
+                _schedule(db)
+        if full:
+            # the certificate has been issued already, errors of the
+            # flush are logged and the entries are written later
+            try:
+                cls.flush(db)
+            except Exception:
+                logger.exception('could not write the issuance log')
+
+    @classmethod
+    def flush(cls, using=None):
+        """
+        writes the buffered entries (of the database ``using`` or of all
+        databases); entries rejected by the database (eg: whose CA has
+        been deleted) are logged and dropped, entries which can't be
+        written because of other errors are buffered again and the first
+        of these errors is raised after trying all databases
+        """
+        with _lock:
+            dbs = [using] if using else list(_buffer.keys())
+            entries = dict((db, _buffer.pop(db, [])) for db in dbs)
+            since = dict((db, _buffer_since.pop(db, None)) for db in dbs)
+        error = None
+        for db, items in entries.items():
+            if not items:
+                continue
+            try:
+                cls._write(db, items)
+            except Exception as e:
+                with _lock:
+                    _buffer[db][:0] = items
+                    _buffer_since[db] = min(since[db], _buffer_since.get(db, since[db]))
+                    _schedule(db)
+                error = error or e
+        if error is not None:
+            raise error
+
+    @classmethod
+    def _write(cls, db, items):
+        """
+        writes ``items`` with a single query or, if the batch violates
+        a constraint, one at a time dropping the rejected entries;
+        written entries are removed from ``items``
+        """
+        try:
+            with transaction.atomic(using=db):
+                cls.objects.using(db).bulk_create(items)
+            del items[:]
+            return
+        except IntegrityError:
+            pass
+        while items:
+            try:
+                with transaction.atomic(using=db):
+                    cls.objects.using(db).bulk_create(items[:1])
+            except IntegrityError:
+                logger.exception('dropped issuance log entry {0}'.format(items[0]))
+            del items[0]
+
+
+def _schedule(db):
+    """
+    starts the timer which flushes the buffer of ``db``
+    (if not started yet); must be called holding ``_lock``
+    """
+    if db in _timers:
+        return
+    timer = threading.Timer(app_settings.EPHEMERAL_LOG_FLUSH_INTERVAL, _flush_timer, (db,))
+    timer.daemon = True
+    _timers[db] = timer
+    timer.start()
+
+
+def _flush_timer(db):
+    with _lock:
+        _timers.pop(db, None)
+    try:
+        IssuanceLog.flush(db)
+    except Exception:
+        logger.exception('could not write the issuance log')
+    finally:
+        # connections are per thread
+        connections[db].close()
+
+
+def _flush_at_exit():
+    try:
+        IssuanceLog.flush()
+    except Exception:  # pragma: no cover
+        logger.exception('could not write the issuance log')
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,202 @@
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, models, router, transaction
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
+
+from .. import ratelimit
+from .. import settings as app_settings
+
+STATE_CHOICES = (
+    ('queued', _('queued')),
+    ('running', _('running')),
+    ('done', _('done')),
+    ('failed', _('failed')),
+)
+
+
+def default_worker_id():
+    """
+    returns an identifier of the current worker process
+    """
+    return '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+
+class Retry(Exception):
+    """
+    raised when a job can't be processed yet
+    (eg: the CA which signs the certificate is pending)
+    """
+    def __init__(self, message, delay=None):
+        super(Retry, self).__init__(message)
+        self.delay = delay
+
+
+class JobQuerySet(models.QuerySet):
+    def available(self, now=None):
+        """
+        queued jobs and running jobs whose lease has expired
+        (the worker which claimed them has crashed)
+        """
+        now = now or timezone.now()
+        return self.filter(models.Q(state='queued', available_at__lte=now) |
+                           models.Q(state='running', locked_until__lt=now))
+
+    def claim(self, worker=None, limit=1):
+        """
+        marks up to ``limit`` available jobs as running and returns them;
+        on PostgreSQL the candidate rows are selected with
+        ``FOR UPDATE SKIP LOCKED``, on other databases each
+        claim is a conditional update which fails if another
+        worker has claimed the same job first
+        """
+        worker = worker or default_worker_id()
+        db = self.db
+        now = timezone.now()
+        lease = now + timedelta(seconds=app_settings.JOB_LEASE_SECONDS)
+        claimed = []
+        with transaction.atomic(using=db):
+            candidates = self._skip_locked(now, limit)
+            if candidates is None:
+                candidates = list(self.available(now).order_by('pk').values_list('pk', flat=True)[:limit])
+            for pk in candidates:
+                rows = self.available(now).filter(pk=pk).update(
+                    state='running',
+                    worker=worker,
+                    locked_until=lease,
+                    attempts=models.F('attempts') + 1,
+                    modified=now
+                )
+                if rows:
+                    claimed.append(pk)
+        return list(self.model.objects.using(db).filter(pk__in=claimed).order_by('pk'))
+
+    def _skip_locked(self, now, limit):
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql' or connection.pg_version < 90500:
+            return None
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM {0} '
+                           'WHERE (state = %s AND available_at <= %s) '
+                           'OR (state = %s AND locked_until < %s) '
+                           'ORDER BY id LIMIT %s '
+                           'FOR UPDATE SKIP LOCKED'.format(table),
+                           ['queued', now, 'running', now, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+@python_2_unicode_compatible
+class Job(models.Model):
+    """
+    Generation of a pending CA or certificate,
+    processed by the ``x509_worker`` management command
+    """
+    model = models.CharField(_('model'), max_length=16)
+    object_id = models.PositiveIntegerField(_('object id'))
+    state = models.CharField(_('state'), max_length=8, choices=STATE_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    worker = models.CharField(_('worker'), max_length=128, blank=True)
+    available_at = models.DateTimeField(_('available at'), default=timezone.now)
+    locked_until = models.DateTimeField(_('locked until'), blank=True, null=True)
+    error = models.TextField(_('error'), blank=True)
+    created = models.DateTimeField(_('created'), default=timezone.now)
+    modified = models.DateTimeField(_('modified'), default=timezone.now)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('job')
+        verbose_name_plural = _('jobs')
+        index_together = ('state', 'available_at')
+
+    def __str__(self):
+        return '{0} {1} ({2})'.format(self.model, self.object_id, self.state)
+
+    @classmethod
+    def enqueue(cls, instance):
+        """
+        creates the job which generates ``instance`` (a pending CA or certificate)
+        """
+        db = router.db_for_write(cls, instance=instance)
+        return cls.objects.using(db).create(model=instance._meta.model_name, object_id=instance.pk)
+
+    def get_instance(self):
+        model = apps.get_model('django_x509', self.model)
+        return model.objects.using(self._state.db).get(pk=self.object_id)
+
+    def run(self):
+        """
+        generates the pending CA or certificate; failed jobs are
+        retried with exponential backoff up to ``JOB_MAX_ATTEMPTS`` times
+        """
+        try:
+            self._run()
+        except Retry as e:
+            delay = app_settings.JOB_RETRY_DELAY if e.delay is None else e.delay
+            # retries don't count as failed attempts
+            self._finish('queued', str(e), delay=delay, attempts=self.attempts - 1)
+        except Exception:
+            if self.attempts >= app_settings.JOB_MAX_ATTEMPTS:
+                self._finish('failed', traceback.format_exc(), instance_status='failed')
+            else:
+                delay = app_settings.JOB_RETRY_DELAY * 2 ** (self.attempts - 1)
+                self._finish('queued', traceback.format_exc(), delay=delay)
+        else:
+            self._finish('done', '')
+
+    def _run(self):
+        db = self._state.db
+        try:
+            instance = self.get_instance()
+        except ObjectDoesNotExist:
+            # deleted before being generated
+            return
+        # a previous attempt has crashed after saving the certificate
+        if instance.status != 'pending':
+            return
+        issuer = instance._get_issuer()
+        if issuer is not None and issuer.status != 'issued':
+            raise Retry('{0} {1} is not issued yet'.format(issuer._meta.model_name, issuer.pk))
+        try:
+            ratelimit.acquire('issue', issuer)
+        except ratelimit.RateLimitExceeded as e:
+            raise Retry(str(e), delay=e.retry_after)
+        # keys are generated outside of transactions
+        instance._generate()
+        with transaction.atomic(using=db):
+            model = type(instance)
+            status = model.objects.using(db).select_for_update() \
+                                            .values_list('status', flat=True) \
+                                            .get(pk=instance.pk)
+            if status == 'pending':
+                instance.status = 'issued'
+                # the row may have changed (eg: revoked) since it was loaded
+                instance.save(using=db, update_fields=instance.generated_fields)
+
+    def _finish(self, state, error, delay=0, instance_status=None, attempts=None):
+        db = self._state.db
+        now = timezone.now()
+        if attempts is not None:
+            self.attempts = attempts
+        with transaction.atomic(using=db):
+            type(self).objects.using(db).filter(pk=self.pk).update(
+                state=state,
+                error=error,
+                attempts=self.attempts,
+                locked_until=None,
+                available_at=now + timedelta(seconds=delay),
+                modified=now
+            )
+            if instance_status:
+                model = apps.get_model('django_x509', self.model)
+                model.objects.using(db).filter(pk=self.object_id, status='pending') \
+                                       .update(status=instance_status)
+        self.state = state
+        self.error = error
@@ -0,0 +1,174 @@
+import collections
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
+from jsonfield import JSONField
+from model_utils.fields import AutoCreatedField, AutoLastModifiedField
+
+from .. import settings as app_settings
+from ..backends import get_backend
+from ..utils import crypto
+from .base import (DIGEST_CHOICES, KEY_LENGTH_CHOICES, default_cert_extensions,
+                   default_digest_algorithm, default_key_length,
+                   verify_extension_format)
+
+# pk: CompiledProfile
+_compiled = {}
+
+
+def default_profile_validity():
+    """
+    returns the default value for validity field
+    """
+    return app_settings.DEFAULT_CERT_VALIDITY
+
+
+class CompiledProfile(object):
+    """
+    extensions of a ``CertProfile``, validated once and
+    converted to the native objects of each crypto backend
+    the first time they're needed (cached per process)
+    """
+    def __init__(self, extensions, extra_extensions, modified=None):
+        self.extensions = tuple(extensions)
+        self.extra_extensions = tuple(extra_extensions)
+        self.modified = modified
+        self._native = {}
+
+    def get_native(self, backend):
+        """
+        returns the extensions converted by ``backend.compile_extensions``
+        """
+        native = self._native.get(backend.name)
+        if native is None:
+            native = (backend.compile_extensions(self.extensions),
+                      backend.compile_extensions(self.extra_extensions))
+            self._native[backend.name] = native
+        return native
+
+
+@python_2_unicode_compatible
+class AbstractCertProfile(models.Model):
+    """
+    Abstract CertProfile model
+
+    Holds the parameters shared by certificates which are
+    issued repeatedly (eg: device certificates)
+    """
+    name = models.CharField(max_length=64, unique=True)
+    notes = models.TextField(blank=True)
+    key_length = models.CharField(_('key length'),
+                                  help_text=_('bits'),
+                                  choices=KEY_LENGTH_CHOICES,
+                                  default=default_key_length,
+                                  max_length=6)
+    digest = models.CharField(_('digest algorithm'),
+                              help_text=_('bits'),
+                              choices=DIGEST_CHOICES,
+                              default=default_digest_algorithm,
+                              max_length=8)
+    validity = models.PositiveIntegerField(_('validity'),
+                                           help_text=_('days'),
+                                           default=default_profile_validity)
+    country_code = models.CharField(max_length=2, blank=True)
+    state = models.CharField(_('state or province'), max_length=64, blank=True)
+    city = models.CharField(_('city'), max_length=64, blank=True)
+    organization = models.CharField(_('organization'), max_length=64, blank=True)
+    email = models.EmailField(_('email address'), blank=True)
+    extensions = JSONField(_('extensions'),
+                           default=list,
+                           blank=True,
+                           help_text=_('additional x509 certificate extensions'),
+                           load_kwargs={'object_pairs_hook': collections.OrderedDict},
+                           dump_kwargs={'indent': 4})
+    created = AutoCreatedField(_('created'), editable=True)
+    modified = AutoLastModifiedField(_('modified'), editable=True)
+
+    class Meta:
+        abstract = True
+        verbose_name = _('certificate profile')
+        verbose_name_plural = _('certificate profiles')
+
+    # subject attributes copied to the certificates
+    subject_fields = ('country_code', 'state', 'city', 'organization', 'email')
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        verify_extension_format(self.extensions)
+        try:
+            self.compile().get_native(get_backend())
+        except (crypto.Error, ValueError) as e:
+            raise ValidationError({'extensions': _('Invalid extension: %(error)s') % {'error': e}})
+
+    def compile(self):
+        """
+        returns a new ``CompiledProfile``
+        """
+        verify_extension_format(self.extensions)
+        extra_extensions = [(ext['name'], bool(ext['critical']), ext['value'])
+                            for ext in self.extensions]
+        return CompiledProfile(default_cert_extensions(), extra_extensions, self.modified)
+
+    def get_compiled(self):
+        """
+        returns the ``CompiledProfile`` of this profile from the
+        cache of the current process; profiles which have been
+        modified after being cached are compiled again
+        """
+        if self.pk is None:
+            return self.compile()
+        compiled = _compiled.get(self.pk)
+        if compiled is None or compiled.modified != self.modified:
+            compiled = _compiled[self.pk] = self.compile()
+        return compiled
+
+    def new_cert(self, ca, common_name, **kwargs):
+        """
+        returns a new ``Cert`` of ``ca`` (not saved yet);
+        ``kwargs`` override the values of the profile
+        """
+        now = timezone.now()
+        attrs = dict((field, getattr(self, field)) for field in self.subject_fields)
+        attrs.update({
+            'name': common_name,
+            'key_length': self.key_length,
+            'digest': self.digest,
+            'extensions': self.extensions,
+            'validity_start': now,
+            'validity_end': now + timedelta(days=self.validity),
+        })
+        attrs.update(kwargs)
+        return ca.cert_set.model(ca=ca, common_name=common_name, profile=self, **attrs)
+
+    def issue(self, ca, common_name, **kwargs):
+        """
+        creates and returns a new ``Cert`` signed by ``ca``
+        (see ``new_cert``)
+        """
+        cert = self.new_cert(ca, common_name, **kwargs)
+        cert.save()
+        return cert
+
+
+def invalidate(sender, instance, **kwargs):
+    """
+    removes a profile from the cache of the current process
+    """
+    _compiled.pop(instance.pk, None)
+
+
+class CertProfile(AbstractCertProfile):
+    """
+    Concrete CertProfile model
+    """
+CertProfile.Meta.abstract = False
+
+post_save.connect(invalidate, sender=CertProfile, dispatch_uid='django_x509_profile_saved')
+post_delete.connect(invalidate, sender=CertProfile, dispatch_uid='django_x509_profile_deleted')
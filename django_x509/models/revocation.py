@@ -0,0 +1,104 @@
+from django.db import models, router
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
+
+# reasons supported by CRLs of both crypto backends
+REASON_CHOICES = (
+    ('unspecified', _('unspecified')),
+    ('keyCompromise', _('key compromise')),
+    ('cACompromise', _('CA compromise')),
+    ('affiliationChanged', _('affiliation changed')),
+    ('superseded', _('superseded')),
+    ('cessationOfOperation', _('cessation of operation')),
+    ('certificateHold', _('certificate hold')),
+)
+
+
+class RevocationQuerySet(models.QuerySet):
+    def active(self):
+        """
+        Returns the entries of certificates which are
+        valid (neither expired nor not valid yet)
+        """
+        now = timezone.now()
+        return self.filter(validity_start__lte=now, validity_end__gte=now)
+
+    def since(self, sequence):
+        """
+        Returns the entries appended after the entry ``sequence``
+        """
+        return self.filter(sequence__gt=sequence).order_by('sequence')
+
+    def counts(self):
+        """
+        Returns the number of entries of each CA
+        as ``{ca_id: count}`` (CAs without entries
+        are not included)
+        """
+        return dict(self.order_by()
+                        .values_list('ca')
+                        .annotate(count=Count('sequence'))
+                        .values_list('ca', 'count'))
+
+
+@python_2_unicode_compatible
+class Revocation(models.Model):
+    """
+    Append-only ledger of revoked certificates, read by
+    CRL generation instead of the rows of ``Cert``
+    (whose ``revoked`` and ``revoked_at`` are kept in sync)
+    """
+    sequence = models.AutoField(_('sequence'), primary_key=True)
+    ca = models.ForeignKey('django_x509.Ca',
+                           verbose_name=_('CA'),
+                           related_name='revocations',
+                           on_delete=models.CASCADE)
+    serial_number = models.BigIntegerField(_('serial number'))
+    revoked_at = models.DateTimeField(_('revoked at'), db_index=True)
+    reason = models.CharField(_('reason'), max_length=32,
+                              choices=REASON_CHOICES,
+                              default='unspecified')
+    # revoked certificates are listed in CRLs until they expire
+    validity_start = models.DateTimeField(_('validity start'))
+    validity_end = models.DateTimeField(_('validity end'))
+
+    objects = RevocationQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('revocation')
+        verbose_name_plural = _('revocations')
+        unique_together = ('ca', 'serial_number')
+        index_together = ('ca', 'validity_end')
+
+    def __str__(self):
+        return '{0} {1}'.format(self.ca_id, self.serial_number)
+
+    @classmethod
+    def record(cls, certs, reason='unspecified', using=None):
+        """
+        appends the entries of the revoked certificates ``certs``
+        (certificates which are already in the ledger are skipped)
+        """
+        certs = list(certs)
+        if not certs:
+            return []
+        db = using or router.db_for_write(cls, instance=certs[0])
+        existing = set(cls.objects.using(db)
+                                  .filter(ca__in=set(cert.ca_id for cert in certs),
+                                          serial_number__in=[cert.serial_number for cert in certs])
+                                  .values_list('ca_id', 'serial_number'))
+        entries = []
+        for cert in certs:
+            key = (cert.ca_id, cert.serial_number)
+            if key in existing:
+                continue
+            existing.add(key)
+            entries.append(cls(ca_id=cert.ca_id,
+                               serial_number=cert.serial_number,
+                               revoked_at=cert.revoked_at or timezone.now(),
+                               reason=reason,
+                               validity_start=cert.validity_start,
+                               validity_end=cert.validity_end))
+        return cls.objects.using(db).bulk_create(entries)
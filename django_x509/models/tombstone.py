@@ -0,0 +1,45 @@
+from django.db import models
+from django.db.models.signals import post_delete
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
+
+from .ca import Ca
+from .cert import Cert
+
+
+@python_2_unicode_compatible
+class Tombstone(models.Model):
+    """
+    Records the deletion of a CA or certificate,
+    which is reported by the change feed
+    """
+    model = models.CharField(_('model'), max_length=16)
+    object_id = models.PositiveIntegerField(_('object id'))
+    ca_id = models.PositiveIntegerField(_('CA id'), blank=True, null=True)
+    serial_number = models.PositiveIntegerField(_('serial number'), blank=True, null=True)
+    modified = models.DateTimeField(_('deleted at'), default=timezone.now)
+
+    class Meta:
+        verbose_name = _('tombstone')
+        verbose_name_plural = _('tombstones')
+        index_together = ('model', 'modified', 'object_id')
+
+    def __str__(self):
+        return '{0} {1}'.format(self.model, self.object_id)
+
+
+def create_tombstone(sender, instance, **kwargs):
+    """
+    creates a ``Tombstone`` when a CA or certificate is deleted
+    """
+    Tombstone.objects.using(kwargs.get('using')).create(
+        model=sender._meta.model_name,
+        object_id=instance.pk,
+        ca_id=getattr(instance, 'ca_id', None),
+        serial_number=instance.serial_number
+    )
+
+
+post_delete.connect(create_tombstone, sender=Ca, dispatch_uid='django_x509_ca_tombstone')
+post_delete.connect(create_tombstone, sender=Cert, dispatch_uid='django_x509_cert_tombstone')
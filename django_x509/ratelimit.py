@@ -0,0 +1,175 @@
+"""
+Token bucket rate limits of issuance and CRL generation
+
+Limits are configured in ``DJANGO_X509_RATE_LIMITS`` as ``(rate, burst)``
+tuples (tokens added per second and size of the bucket) for each scope:
+
+* ``issue`` and ``crl``: all the CAs
+* ``issue:ca`` and ``crl:ca``: default limit of each CA
+* ``issue:ca:<id>`` and ``crl:ca:<id>``: limit of a specific CA
+  (``None`` disables the default limit of each CA)
+
+Buckets are stored in the cache defined by ``DJANGO_X509_RATE_LIMIT_CACHE``,
+which must be shared by all processes (eg: memcached or redis).
+When a bucket is empty the operation waits for a token if it becomes
+available within ``DJANGO_X509_RATE_LIMIT_MAX_WAIT`` seconds, otherwise
+``RateLimitExceeded`` is raised.
+"""
+import math
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+from . import metrics
+from . import settings as app_settings
+
+OPERATIONS = ('issue', 'crl')
+
+
+class RateLimitExceeded(Exception):
+    """
+    raised when an operation exceeds the rate limit of ``scope``;
+    ``retry_after`` is the number of seconds after which
+    a token will be available
+    """
+    def __init__(self, scope, retry_after):
+        self.scope = scope
+        self.retry_after = retry_after
+        super(RateLimitExceeded, self).__init__(
+            'rate limit of "{0}" exceeded, retry after {1:.1f} seconds'.format(scope, retry_after))
+
+
+def get_limit(scope):
+    """
+    returns the ``(rate, burst)`` tuple of ``scope`` or ``None``
+    """
+    limits = app_settings.RATE_LIMITS
+    if scope in limits:
+        return limits[scope]
+    # default limit of each CA
+    if scope.count(':') == 2:
+        return limits.get(scope.rsplit(':', 1)[0])
+    return None
+
+
+def get_scopes(operation, ca=None):
+    """
+    returns the limited scopes of ``operation``
+    performed by (or signed by) ``ca``
+    """
+    if operation not in OPERATIONS:
+        raise ValueError('unknown operation: {0}'.format(operation))
+    scopes = [operation]
+    if ca is not None and ca.pk:
+        scopes.insert(0, '{0}:ca:{1}'.format(operation, ca.pk))
+    return [scope for scope in scopes if get_limit(scope)]
+
+
+def _cache():
+    return caches[app_settings.RATE_LIMIT_CACHE]
+
+
+def _key(scope, suffix=''):
+    return 'django_x509:ratelimit:{0}{1}'.format(scope, suffix)
+
+
+def _incr(cache, key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key, delta)
+
+
+def _lock(cache, key, timeout=1):
+    deadline = time.time() + timeout
+    while not cache.add(key, True, timeout):
+        if time.time() > deadline:
+            # a process has died holding the lock, the
+            # bucket is updated anyway (it expires soon)
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def _update(cache, scope, amount, now, max_wait=None):
+    """
+    takes ``amount`` tokens from the bucket of ``scope``, which may
+    go in debt up to ``max_wait`` seconds; returns the seconds to wait
+    for the tokens to be available or raises ``RateLimitExceeded``
+    """
+    rate, burst = get_limit(scope)
+    lock_key = _key(scope, ':lock')
+    locked = _lock(cache, lock_key)
+    try:
+        tokens, updated = cache.get(_key(scope)) or (burst, now)
+        tokens = min(burst, tokens + max(now - updated, 0) * rate) - amount
+        wait = -tokens / float(rate) if tokens < 0 else 0
+        if max_wait is not None and wait > max_wait:
+            raise RateLimitExceeded(scope, wait)
+        # full buckets don't need to be stored
+        timeout = int(math.ceil((burst - tokens) / float(rate))) + 1
+        cache.set(_key(scope), (tokens, now), timeout)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return wait
+
+
+def acquire(operation, ca=None):
+    """
+    takes a token from the buckets of ``operation`` (``issue`` or ``crl``)
+    of all the CAs and of ``ca``, waiting up to ``DJANGO_X509_RATE_LIMIT_MAX_WAIT``
+    seconds for it; raises ``RateLimitExceeded`` when the wait would be longer
+    """
+    scopes = get_scopes(operation, ca)
+    if not scopes:
+        return
+    cache = _cache()
+    now = time.time()
+    wait = 0
+    taken = []
+    try:
+        for scope in scopes:
+            wait = max(wait, _update(cache, scope, 1, now, app_settings.RATE_LIMIT_MAX_WAIT))
+            taken.append(scope)
+    except RateLimitExceeded as e:
+        # tokens taken from the other buckets are given back
+        for scope in taken:
+            _update(cache, scope, -1, now)
+        _incr(cache, _key(e.scope, ':rejected'))
+        metrics.rate_limited_total.inc(scope=e.scope)
+        raise
+    if not wait:
+        return
+    for scope in scopes:
+        _incr(cache, _key(scope, ':waiting'))
+    try:
+        time.sleep(wait)
+    finally:
+        for scope in scopes:
+            _incr(cache, _key(scope, ':waiting'), -1)
+
+
+def get_stats(ca=None):
+    """
+    returns the limit, the available tokens, the number of operations
+    waiting for a token and the number of rejected operations of the
+    scopes of all the CAs and, if specified, of the scopes of ``ca``
+    """
+    cache = _cache()
+    now = time.time()
+    stats = OrderedDict()
+    for operation in OPERATIONS:
+        for scope in reversed(get_scopes(operation, ca)):
+            rate, burst = get_limit(scope)
+            tokens, updated = cache.get(_key(scope)) or (burst, now)
+            stats[scope] = OrderedDict((
+                ('rate', rate),
+                ('burst', burst),
+                ('tokens', min(burst, tokens + max(now - updated, 0) * rate)),
+                ('waiting', cache.get(_key(scope, ':waiting'), 0)),
+                ('rejected', cache.get(_key(scope, ':rejected'), 0)),
+            ))
+    return stats
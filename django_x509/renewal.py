@@ -0,0 +1,153 @@
+"""
+Bulk renewal of certificates
+
+Certificates are renewed with ``Cert.renew`` in chunks of primary keys
+read with keyset pagination; each chunk is renewed in one transaction
+(failures are rolled back to a savepoint) by a pool of worker processes,
+each of which opens its own database connection and keeps a cache of
+the CAs, whose certificates and keys are parsed once per process.
+The successors may be signed by another CA (see ``django_x509.rollover``).
+"""
+import multiprocessing
+import traceback
+from collections import OrderedDict
+from timeit import default_timer
+
+from django.db import DatabaseError, connections, router, transaction
+
+from .models import Ca, Cert
+from .ratelimit import RateLimitExceeded
+
+# errors which may not happen again if the renewal is retried
+# (EnvironmentError: eg: the cache of the rate limits is unreachable)
+RETRYABLE_ERRORS = (DatabaseError, RateLimitExceeded, EnvironmentError)
+
+# CAs loaded by the current process
+_cas = {}
+
+
+def _init_worker():
+    _cas.clear()
+
+
+def _get_ca(ca_id, using):
+    ca = _cas.get(ca_id)
+    if ca is None:
+        ca = _cas[ca_id] = Ca.objects.using(using).get(pk=ca_id)
+    return ca
+
+
+def renew_chunk(pks, reuse_key=True, validity=None, using=None, ca_id=None):
+    """
+    renews the certificates whose primary keys are listed in ``pks``
+    (signed by the CA ``ca_id`` if given) and returns ``(renewed, failures,
+    unrecoverable)``, where ``renewed`` is a list of ``(id, successor id)``
+    tuples, ``failures`` a list of ``(id, error)`` and ``unrecoverable``
+    the ids of the failures which are not ``RETRYABLE_ERRORS`` (hence
+    would fail again if retried, eg: certificates which can't be parsed)
+    """
+    using = using or router.db_for_write(Cert)
+    renewed = []
+    failures = []
+    unrecoverable = []
+    certs = list(Cert.objects.using(using).filter(pk__in=pks).select_related('profile').order_by('pk'))
+    for cert in certs:
+        # the CA is shared by all the certificates
+        cert.ca = _get_ca(cert.ca_id, using)
+    ca = _get_ca(ca_id, using) if ca_id else None
+    # the transaction only writes (readers which start writing
+    # in the middle of a transaction can't wait for locks on SQLite)
+    with transaction.atomic(using=using):
+        for cert in certs:
+            try:
+                with transaction.atomic(using=using):
+                    successor = cert.renew(reuse_key=reuse_key, validity=validity, ca=ca)
+            except Exception as e:
+                failures.append((cert.pk, '{0}: {1}'.format(type(e).__name__, e)))
+                if not isinstance(e, RETRYABLE_ERRORS):
+                    unrecoverable.append(cert.pk)
+                continue
+            renewed.append((cert.pk, successor.pk))
+    return renewed, failures, unrecoverable
+
+
+def _renew_chunk(args):
+    try:
+        return renew_chunk(*args)
+    except Exception:
+        return [], [(pk, traceback.format_exc()) for pk in args[0]], []
+
+
+def iter_chunks(queryset, chunk_size):
+    """
+    yields lists of primary keys of ``queryset`` using keyset pagination
+    """
+    last_pk = None
+    queryset = queryset.order_by('pk').values_list('pk', flat=True)
+    while True:
+        qs = queryset
+        if last_pk is not None:
+            qs = qs.filter(pk__gt=last_pk)
+        pks = list(qs[:chunk_size])
+        if not pks:
+            break
+        yield pks
+        last_pk = pks[-1]
+
+
+def renew_certs(queryset=None, reuse_key=True, validity=None, processes=1,
+                chunk_size=100, ca=None, progress=None):
+    """
+    renews the issued certificates in ``queryset`` (see ``Cert.renew``) and returns
+    a report dict; ``processes`` is the number of worker processes (``None``
+    means the number of CPUs, ``1`` renews in the current process);
+    successors are signed by ``ca`` if given, and ``progress`` is called
+    with the number of certificates processed and the total after each chunk;
+    ``report['unrecoverable']`` lists the ids of the failures which would
+    fail again if retried (see ``renew_chunk``).
+    The primary keys are read before any renewal, hence successors
+    are never renewed again.
+    """
+    if queryset is None:
+        queryset = Cert.objects.all()
+    # pending and failed certificates have nothing to renew
+    queryset = queryset.filter(status='issued')
+    processes = processes or multiprocessing.cpu_count()
+    using = router.db_for_write(Cert)
+    chunks = list(iter_chunks(queryset, chunk_size))
+    total = sum(len(pks) for pks in chunks)
+    ca_id = ca.pk if ca else None
+    start = default_timer()
+    renewed = []
+    failures = []
+    unrecoverable = []
+    if processes == 1:
+        _init_worker()
+        results = (renew_chunk(pks, reuse_key, validity, using, ca_id) for pks in chunks)
+    else:
+        # connections must not be shared with the worker processes
+        connections.close_all()
+        pool = multiprocessing.Pool(processes, _init_worker)
+        results = pool.imap_unordered(_renew_chunk,
+                                      [(pks, reuse_key, validity, using, ca_id) for pks in chunks])
+    try:
+        for chunk_renewed, chunk_failures, chunk_unrecoverable in results:
+            renewed.extend(chunk_renewed)
+            failures.extend(chunk_failures)
+            unrecoverable.extend(chunk_unrecoverable)
+            if progress:
+                progress(len(renewed) + len(failures), total)
+    finally:
+        if processes != 1:
+            pool.close()
+            pool.join()
+    elapsed = default_timer() - start
+    return OrderedDict((
+        ('renewed', len(renewed)),
+        ('failed', len(failures)),
+        ('seconds', elapsed),
+        ('rate', len(renewed) / elapsed if elapsed else 0),
+        ('successors', OrderedDict(sorted(renewed))),
+        ('failures', sorted(failures)),
+        ('unrecoverable', sorted(unrecoverable)),
+    ))
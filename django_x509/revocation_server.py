@@ -0,0 +1,369 @@
+"""
+Standalone revocation server
+
+Serves pre-rendered CRLs and pre-signed OCSP responses (RFC 5019
+lightweight profile) of all CAs from an in-memory snapshot, without
+going through the Django request handling machinery.
+
+The snapshot is built and refreshed in a worker thread: each refresh
+only re-renders the CRLs of the CAs which have new entries in the
+revocation ledger and re-signs the OCSP responses of the rows modified
+since the previous one (plus those which are approaching their
+``nextUpdate``), while the event loop keeps serving the data of the
+previous snapshot.
+
+Requires python >= 3.4 (``asyncio``).
+"""
+import asyncio
+import base64
+import logging
+import re
+from datetime import timedelta
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509 import ocsp
+from django.db import close_old_connections
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.six.moves.urllib.parse import unquote
+
+from .backends.cryptography import (CRL_REASONS, _naive_utc, _to_bytes,
+                                    load_private_key)
+from .models import Ca, Cert, Revocation
+
+logger = logging.getLogger(__name__)
+
+CRL_PATH = re.compile(r'^/x509/ca/(?P<pk>[^/]+)\.crl$')
+OCSP_PATH = '/x509/ocsp'
+MAX_REQUEST_SIZE = 64 * 1024
+# rows modified slightly before the last refresh are fetched again
+# to avoid missing transactions committed after the refresh query
+MODIFIED_OVERLAP = timedelta(seconds=1)
+
+
+def http_response(status, body=b'', content_type='text/plain'):
+    """
+    renders a complete HTTP/1.1 response
+    """
+    head = 'HTTP/1.1 {0}\r\nContent-Type: {1}\r\nContent-Length: {2}\r\n\r\n'.format(
+        status, content_type, len(body))
+    return head.encode('ascii') + body
+
+
+NOT_FOUND = http_response('404 Not Found', b'Not Found')
+BAD_REQUEST = http_response('400 Bad Request', b'Bad Request')
+METHOD_NOT_ALLOWED = http_response('405 Method Not Allowed', b'Method Not Allowed')
+
+
+def ocsp_response(status):
+    """
+    renders an unsuccessful OCSP response
+    """
+    der = ocsp.OCSPResponseBuilder.build_unsuccessful(status).public_bytes(
+        serialization.Encoding.DER)
+    return http_response('200 OK', der, 'application/ocsp-response')
+
+
+OCSP_MALFORMED = ocsp_response(ocsp.OCSPResponseStatus.MALFORMED_REQUEST)
+OCSP_UNAUTHORIZED = ocsp_response(ocsp.OCSPResponseStatus.UNAUTHORIZED)
+
+
+class Snapshot(object):
+    """
+    in-memory copy of the revocation data of all CAs
+
+    * ``crls``: ``{ca_id: HTTP response}``
+    * ``responses``: ``{(ca_id, serial_number): HTTP response}``
+    * ``issuers``: ``{(issuer name hash, issuer key hash): ca_id}`` (SHA1)
+    """
+    def __init__(self, validity=timedelta(days=1)):
+        self.validity = validity
+        self.crls = {}
+        self.responses = {}
+        self.issuers = {}
+        self.last_modified = None
+        # last entry of the revocation ledger read
+        self.sequence = 0
+        self._cas = {}
+        self._signed_at = {}
+        # {ca_id: half of the validity of the CRL} (naive UTC)
+        self._crl_stale_at = {}
+        # {(ca_id, serial_number): (revoked_at, reason)}
+        self._revocations = {}
+
+    def _load_ca(self, ca):
+        cert = x509.load_pem_x509_certificate(_to_bytes(ca.certificate), default_backend())
+        name_hash = hashes.Hash(hashes.SHA1(), default_backend())
+        name_hash.update(cert.subject.public_bytes(default_backend()))
+        key_hash = x509.SubjectKeyIdentifier.from_public_key(cert.public_key()).digest
+        self.issuers[(name_hash.finalize(), key_hash)] = str(ca.pk)
+        self._cas[ca.pk] = (ca, cert, load_private_key(ca.private_key))
+
+    def _sign(self, ca_id, row, now):
+        ca, ca_cert, ca_key = self._cas[ca_id]
+        pk, serial_number, certificate, revoked, revoked_at, modified = row
+        cert = x509.load_pem_x509_certificate(_to_bytes(certificate), default_backend())
+        if revoked:
+            status = ocsp.OCSPCertStatus.REVOKED
+            # certificates revoked with QuerySet.update() are not in the ledger
+            revoked_at, reason = self._revocations.get((ca_id, int(serial_number)),
+                                                       (revoked_at or modified, 'unspecified'))
+            revocation_time = _naive_utc(revoked_at)
+            reason = CRL_REASONS[reason]
+        else:
+            status = ocsp.OCSPCertStatus.GOOD
+            revocation_time = reason = None
+        response = ocsp.OCSPResponseBuilder() \
+            .add_response(cert=cert,
+                          issuer=ca_cert,
+                          algorithm=hashes.SHA1(),
+                          cert_status=status,
+                          this_update=_naive_utc(now),
+                          next_update=_naive_utc(now + self.validity),
+                          revocation_time=revocation_time,
+                          revocation_reason=reason) \
+            .responder_id(ocsp.OCSPResponderEncoding.HASH, ca_cert) \
+            .sign(ca_key, hashes.SHA256())
+        der = response.public_bytes(serialization.Encoding.DER)
+        key = (str(ca_id), int(serial_number))
+        self.responses[key] = http_response('200 OK', der, 'application/ocsp-response')
+        return key
+
+    def _render_crl(self, ca_id):
+        crl = _to_bytes(self._cas[ca_id][0].crl)
+        # CRLs have their own nextUpdate, independent of self.validity
+        parsed = x509.load_pem_x509_crl(crl, default_backend())
+        self._crl_stale_at[ca_id] = parsed.last_update + (parsed.next_update - parsed.last_update) / 2
+        self.crls[str(ca_id)] = http_response('200 OK', crl, 'application/x-pem-file')
+
+    def refresh(self):
+        """
+        updates the snapshot with the rows modified since
+        the last refresh and re-signs the data (OCSP responses
+        and CRLs) which is past half of its validity; returns
+        the number of CAs and certificates processed
+        """
+        now = timezone.now()
+        cas = Ca.objects.all()
+        certs = Cert.objects.all()
+        if self.last_modified:
+            since = self.last_modified - MODIFIED_OVERLAP
+            stale = now - self.validity / 2
+            renew = [pk for pk, signed_at in self._signed_at.items() if signed_at < stale]
+            cas = cas.filter(modified__gte=since) | cas.filter(pk__in=renew)
+            changed = set(cas.values_list('pk', flat=True))
+            certs = certs.filter(modified__gte=since) | certs.filter(ca__in=changed)
+        # CRLs change only when entries are appended to the revocation
+        # ledger, otherwise they are re-rendered before their nextUpdate
+        dirty = set(ca_id for ca_id, stale_at in self._crl_stale_at.items()
+                    if stale_at <= _naive_utc(now))
+        entries = Revocation.objects.since(self.sequence) \
+                                    .values_list('sequence', 'ca_id', 'serial_number', 'revoked_at', 'reason')
+        for sequence, ca_id, serial_number, revoked_at, reason in entries.iterator():
+            self._revocations[(ca_id, serial_number)] = (revoked_at, reason)
+            self.sequence = sequence
+            dirty.add(ca_id)
+        last_modified = max(filter(None, (
+            Ca.objects.aggregate(last=Max('modified'))['last'],
+            Cert.objects.aggregate(last=Max('modified'))['last'],
+            self.last_modified,
+        )) or [None])
+        for ca in cas:
+            try:
+                self._load_ca(ca)
+            except Exception:
+                logger.exception('could not load CA {0}'.format(ca.pk))
+                continue
+            self._signed_at[ca.pk] = now
+        signed = set()
+        fields = ('pk', 'serial_number', 'certificate', 'revoked', 'revoked_at', 'modified')
+        for row in certs.values_list('ca_id', *fields).iterator():
+            ca_id = row[0]
+            if ca_id not in self._cas:
+                continue
+            try:
+                signed.add(self._sign(ca_id, row[1:], now))
+            except Exception:
+                logger.exception('could not sign OCSP response of cert {0}'.format(row[1]))
+        reloaded = set(ca.pk for ca in cas)
+        for ca_id in dirty | reloaded:
+            if ca_id in self._cas:
+                self._render_crl(ca_id)
+        self._purge(reloaded, signed)
+        self.last_modified = last_modified
+        return len(self._cas), len(signed)
+
+    def _purge(self, reloaded, signed):
+        """
+        drops deleted CAs and the responses of deleted certificates
+        (deletions are detected when all the certificates of a CA are
+        signed again, hence deleted data may be served for up to half
+        of the validity period)
+        """
+        existing = set(Ca.objects.values_list('pk', flat=True))
+        for ca_id in list(self._cas):
+            if ca_id not in existing:
+                del self._cas[ca_id]
+                self._signed_at.pop(ca_id, None)
+                self.crls.pop(str(ca_id), None)
+                self._crl_stale_at.pop(ca_id, None)
+                for key in [key for key in self._revocations if key[0] == ca_id]:
+                    del self._revocations[key]
+                reloaded.add(ca_id)
+        reloaded = set(str(ca_id) for ca_id in reloaded)
+        for key in list(self.responses):
+            if key[0] in reloaded and key not in signed:
+                del self.responses[key]
+        loaded = set(str(ca_id) for ca_id in self._cas)
+        for key, ca_id in list(self.issuers.items()):
+            if ca_id not in loaded:
+                del self.issuers[key]
+
+    def get_crl(self, pk):
+        return self.crls.get(pk, NOT_FOUND)
+
+    def get_ocsp(self, data):
+        """
+        returns the pre-signed response for the DER
+        encoded OCSP request ``data``
+        """
+        try:
+            request = ocsp.load_der_ocsp_request(data)
+            key = (request.issuer_name_hash, request.issuer_key_hash)
+            serial_number = request.serial_number
+        except Exception:
+            return OCSP_MALFORMED
+        if not isinstance(request.hash_algorithm, hashes.SHA1):
+            return OCSP_UNAUTHORIZED
+        ca_id = self.issuers.get(key)
+        return self.responses.get((ca_id, serial_number), OCSP_UNAUTHORIZED)
+
+
+class RevocationProtocol(asyncio.Protocol):
+    """
+    minimal HTTP/1.1 protocol (keep-alive and pipelining
+    are supported, chunked request bodies are not)
+    """
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.buffer = b''
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        while self.buffer:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                if len(self.buffer) > MAX_REQUEST_SIZE:
+                    self._reply(BAD_REQUEST, keep_alive=False)
+                return
+            lines = self.buffer[:end].split(b'\r\n')
+            try:
+                method, path, version = lines[0].decode('latin-1').split(' ')
+            except ValueError:
+                self._reply(BAD_REQUEST, keep_alive=False)
+                return
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(b':')
+                headers[name.strip().lower()] = value.strip().lower()
+            try:
+                length = int(headers.get(b'content-length', 0))
+            except ValueError:
+                length = -1
+            if length < 0 or length > MAX_REQUEST_SIZE:
+                self._reply(BAD_REQUEST, keep_alive=False)
+                return
+            start = end + 4
+            if len(self.buffer) < start + length:
+                return
+            body = self.buffer[start:start + length]
+            self.buffer = self.buffer[start + length:]
+            connection = headers.get(b'connection')
+            if version == 'HTTP/1.0':
+                keep_alive = connection == b'keep-alive'
+            else:
+                keep_alive = connection != b'close'
+            self._reply(self.respond(method, path, body), keep_alive)
+            if not keep_alive:
+                return
+
+    def _reply(self, response, keep_alive=True):
+        self.transport.write(response)
+        if not keep_alive:
+            self.buffer = b''
+            self.transport.close()
+
+    def respond(self, method, path, body):
+        """
+        returns the HTTP response for a request
+        """
+        if path.startswith(OCSP_PATH):
+            if method == 'POST' and path.rstrip('/') == OCSP_PATH:
+                return self.snapshot.get_ocsp(body)
+            if method == 'GET':
+                try:
+                    data = base64.b64decode(unquote(path[len(OCSP_PATH) + 1:]))
+                except (TypeError, ValueError):
+                    return OCSP_MALFORMED
+                return self.snapshot.get_ocsp(data)
+            return METHOD_NOT_ALLOWED
+        match = CRL_PATH.match(path)
+        if match is None:
+            return NOT_FOUND
+        if method != 'GET':
+            return METHOD_NOT_ALLOWED
+        return self.snapshot.get_crl(match.group('pk'))
+
+
+class RevocationServer(object):
+    """
+    serves ``snapshot`` on ``host``:``port`` and refreshes
+    it every ``interval`` seconds in a worker thread
+    """
+    def __init__(self, snapshot, host='127.0.0.1', port=8001, interval=10, loop=None):
+        self.snapshot = snapshot
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.loop = loop or asyncio.get_event_loop()
+        self.server = None
+        self._refreshing = False
+
+    def _refresh(self):
+        try:
+            return self.snapshot.refresh()
+        finally:
+            close_old_connections()
+
+    def schedule_refresh(self):
+        if not self._refreshing:
+            self._refreshing = True
+            future = self.loop.run_in_executor(None, self._refresh)
+            future.add_done_callback(self._refreshed)
+        self.loop.call_later(self.interval, self.schedule_refresh)
+
+    def _refreshed(self, future):
+        self._refreshing = False
+        if future.exception():
+            logger.error('snapshot refresh failed: {0}'.format(future.exception()))
+        else:
+            logger.debug('snapshot refreshed: {0} CAs, {1} certificates'.format(*future.result()))
+
+    def start(self):
+        coroutine = self.loop.create_server(lambda: RevocationProtocol(self.snapshot),
+                                            self.host, self.port, reuse_address=True)
+        self.server = self.loop.run_until_complete(coroutine)
+        self.loop.call_later(self.interval, self.schedule_refresh)
+        return self.server
+
+    def stop(self):
+        if self.server is not None:
+            self.server.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.server = None
@@ -0,0 +1,46 @@
+"""
+CA rollover
+
+``rollover_ca`` replaces a CA with a successor (see ``Ca.renew``) and
+re-issues every active certificate of the old CA signed by the new one,
+with ``django_x509.renewal.renew_certs`` (chunked transactions in a pool
+of worker processes). Certificates which already have a successor
+are skipped, hence an interrupted rollover is resumed by calling
+``rollover_ca`` again with the same successor.
+Certificates of the old CA are neither revoked nor changed.
+"""
+from django.utils import timezone
+
+from .models import Cert
+from .renewal import renew_certs
+
+
+def get_pending(ca):
+    """
+    returns the active certificates of ``ca`` which have not been
+    renewed (or re-issued by a successor of ``ca``) yet
+    """
+    return Cert.objects.filter(ca=ca, status='issued', revoked=False, successors__isnull=True,
+                               validity_end__gt=timezone.now())
+
+
+def rollover_ca(ca, reuse_key=True, successor=None, processes=None,
+                chunk_size=100, progress=None):
+    """
+    re-issues the active certificates of ``ca`` signed by ``successor``
+    (a new CA created with ``ca.renew()`` if not given) and returns the
+    report of ``renew_certs`` with the successor in ``report['ca']``;
+    the private keys of the certificates are reused unless
+    ``reuse_key`` is ``False``; ``processes``, ``chunk_size``
+    and ``progress`` are passed to ``renew_certs``
+    """
+    if successor is None:
+        successor = ca.renew()
+    report = renew_certs(get_pending(ca),
+                         reuse_key=reuse_key,
+                         processes=processes,
+                         chunk_size=chunk_size,
+                         ca=successor,
+                         progress=progress)
+    report['ca'] = successor
+    return report
@@ -0,0 +1,136 @@
+"""
+Database router which sends the reads of read-only
+code paths (CRL view, admin changelists, audit)
+to a replica database
+
+Enable it with::
+
+    DATABASE_ROUTERS = ['django_x509.routers.ReplicaRouter']
+    DJANGO_X509_REPLICA_DATABASE = 'replica'
+
+Reads are sent to the replica only inside ``use_replica()`` blocks;
+writes always go to the default database. After a write, reads stick to
+the primary for ``DJANGO_X509_REPLICA_STICKY_SECONDS``: in the thread
+which performed the write and, when the write concerns a CA (the CA or
+one of its certificates), in the ``use_replica()`` blocks of all the
+processes which read that CA (the time of the write is stored in the
+cache ``DJANGO_X509_CRL_CACHE``, hence it is shared between processes
+if the cache backend is). Writes are recorded when instances are saved
+or deleted and when the CRL of a CA is invalidated, not when a database
+is merely chosen for writing.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+
+from . import settings as app_settings
+
+LAST_WRITE_KEY = 'django_x509:last_write:{0}'
+
+_state = threading.local()
+
+
+def record_write(ca_id=None):
+    """
+    makes the following reads of the current thread, and
+    the reads of the CA ``ca_id``, stick to the primary database
+    """
+    if not app_settings.REPLICA_DATABASE:
+        return
+    _state.last_write = time.time()
+    _state.replica = False
+    sticky = app_settings.REPLICA_STICKY_SECONDS
+    if sticky and ca_id is not None:
+        caches[app_settings.CRL_CACHE].set(LAST_WRITE_KEY.format(ca_id), True, sticky)
+
+
+def recently_written(ca_id=None):
+    """
+    returns ``True`` if the current thread wrote, or the CA ``ca_id``
+    was written, within ``DJANGO_X509_REPLICA_STICKY_SECONDS``
+    """
+    sticky = app_settings.REPLICA_STICKY_SECONDS
+    if not sticky:
+        return False
+    if time.time() - getattr(_state, 'last_write', 0) < sticky:
+        return True
+    if ca_id is None:
+        return False
+    return caches[app_settings.CRL_CACHE].get(LAST_WRITE_KEY.format(ca_id)) is not None
+
+
+def _record_saved(sender, instance, **kwargs):
+    if sender._meta.app_label != ReplicaRouter.app_label:
+        return
+    if sender._meta.model_name == 'ca':
+        record_write(instance.pk)
+    else:
+        record_write(getattr(instance, 'ca_id', None))
+
+
+@contextmanager
+def use_replica(ca_id=None):
+    """
+    sends ``Ca`` and ``Cert`` reads performed in the block to the
+    replica database, unless the current thread or the CA ``ca_id``
+    (if the block reads a single CA) wrote recently
+    """
+    previous = getattr(_state, 'replica', False)
+    _state.replica = bool(app_settings.REPLICA_DATABASE) and not recently_written(ca_id)
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def replica_view(view):
+    """
+    decorator which wraps ``GET`` and ``HEAD`` requests
+    of a view in ``use_replica()``; the ``pk`` argument
+    of the view, if any, is the id of the CA it reads
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        with use_replica(kwargs.get('pk')):
+            response = view(request, *args, **kwargs)
+            # template responses query the database while rendering
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+            return response
+    return wrapper
+
+
+class ReplicaRouter(object):
+    """
+    routes reads of the django_x509 models performed
+    in ``use_replica()`` blocks to the replica database,
+    writes (including those of instances read from the
+    replica) to the default database
+    """
+    app_label = 'django_x509'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == self.app_label and getattr(_state, 'replica', False):
+            return app_settings.REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == self.app_label:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._meta.app_label == obj2._meta.app_label == self.app_label:
+            return True
+        return None
+
+
+post_save.connect(_record_saved, dispatch_uid='django_x509_replica_saved')
+post_delete.connect(_record_saved, dispatch_uid='django_x509_replica_deleted')
@@ -11,3 +11,34 @@ CA_KEYUSAGE_VALUE = getattr(settings, 'DJANGO_X509_CA_KEYUSAGE_VALUE', 'cRLSign,
 CERT_KEYUSAGE_CRITICAL = getattr(settings, 'DJANGO_X509_CERT_KEYUSAGE_CRITICAL', False)
 CERT_KEYUSAGE_VALUE = getattr(settings, 'DJANGO_X509_CERT_KEYUSAGE_VALUE', 'digitalSignature, keyEncipherment')  # noqa
 CRL_PROTECTED = getattr(settings, 'DJANGO_X509_CRL_PROTECTED', False)
+CRL_CACHE = getattr(settings, 'DJANGO_X509_CRL_CACHE', 'default')
+CRL_CACHE_TIMEOUT = getattr(settings, 'DJANGO_X509_CRL_CACHE_TIMEOUT', 3600)
+CRL_LOCK_TIMEOUT = getattr(settings, 'DJANGO_X509_CRL_LOCK_TIMEOUT', 30)
+CA_CACHE = getattr(settings, 'DJANGO_X509_CA_CACHE', 'default')
+CA_CACHE_TIMEOUT = getattr(settings, 'DJANGO_X509_CA_CACHE_TIMEOUT', 300)
+METRICS_ENABLED = getattr(settings, 'DJANGO_X509_METRICS_ENABLED', False)
+METRICS_PROTECTED = getattr(settings, 'DJANGO_X509_METRICS_PROTECTED', False)
+CRYPTO_BACKEND = getattr(settings,
+                         'DJANGO_X509_CRYPTO_BACKEND',
+                         'django_x509.backends.pyopenssl.PyOpenSSLBackend')
+REPLICA_DATABASE = getattr(settings, 'DJANGO_X509_REPLICA_DATABASE', None)
+REPLICA_STICKY_SECONDS = getattr(settings, 'DJANGO_X509_REPLICA_STICKY_SECONDS', 5)
+CLIENT_CERT_HEADER = getattr(settings, 'DJANGO_X509_CLIENT_CERT_HEADER', 'HTTP_X_SSL_CLIENT_CERT')
+CLIENT_CERT_CACHE_SIZE = getattr(settings, 'DJANGO_X509_CLIENT_CERT_CACHE_SIZE', 10000)
+CLIENT_CERT_CACHE_TTL = getattr(settings, 'DJANGO_X509_CLIENT_CERT_CACHE_TTL', 60)
+REVOKED_FILTER_CAPACITY = getattr(settings, 'DJANGO_X509_REVOKED_FILTER_CAPACITY', 1000)
+REVOKED_FILTER_ERROR_RATE = getattr(settings, 'DJANGO_X509_REVOKED_FILTER_ERROR_RATE', 0.001)
+CHANGE_FEED_DELAY = getattr(settings, 'DJANGO_X509_CHANGE_FEED_DELAY', 2)
+CHANGE_FEED_PAGE_SIZE = getattr(settings, 'DJANGO_X509_CHANGE_FEED_PAGE_SIZE', 500)
+BATCH_MAX_SIZE = getattr(settings, 'DJANGO_X509_BATCH_MAX_SIZE', 100)
+ASYNC_ISSUANCE = getattr(settings, 'DJANGO_X509_ASYNC_ISSUANCE', False)
+JOB_LEASE_SECONDS = getattr(settings, 'DJANGO_X509_JOB_LEASE_SECONDS', 300)
+JOB_MAX_ATTEMPTS = getattr(settings, 'DJANGO_X509_JOB_MAX_ATTEMPTS', 5)
+JOB_RETRY_DELAY = getattr(settings, 'DJANGO_X509_JOB_RETRY_DELAY', 10)
+RATE_LIMITS = getattr(settings, 'DJANGO_X509_RATE_LIMITS', {})
+RATE_LIMIT_CACHE = getattr(settings, 'DJANGO_X509_RATE_LIMIT_CACHE', 'default')
+RATE_LIMIT_MAX_WAIT = getattr(settings, 'DJANGO_X509_RATE_LIMIT_MAX_WAIT', 0)
+EPHEMERAL_VALIDITY = getattr(settings, 'DJANGO_X509_EPHEMERAL_VALIDITY', 3600)
+EPHEMERAL_SERIAL_BLOCK = getattr(settings, 'DJANGO_X509_EPHEMERAL_SERIAL_BLOCK', 100)
+EPHEMERAL_LOG_BATCH_SIZE = getattr(settings, 'DJANGO_X509_EPHEMERAL_LOG_BATCH_SIZE', 100)
+EPHEMERAL_LOG_FLUSH_INTERVAL = getattr(settings, 'DJANGO_X509_EPHEMERAL_LOG_FLUSH_INTERVAL', 5)
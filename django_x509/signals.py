@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# sent by Cert.revoke() after the certificate has been saved
+cert_revoked = Signal(providing_args=['instance'])
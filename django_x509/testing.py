@@ -0,0 +1,161 @@
+"""
+Helpers for the test suites of projects which use django-x509
+
+Generating RSA keys dominates the run time of test suites which create
+many CAs and certificates; ``install_key_fixtures()`` (called by the
+``KeyFixturesTestRunner`` test runner) makes the crypto backends take
+keys from the fixed keys stored in ``KEY_FIXTURES_DIR`` instead of
+generating them. Keys are served in the same order in each test
+(``reset_key_fixtures()`` is called before each test by the runner),
+whatever the order in which tests run, while certificates are still
+built and signed for real; keys of lengths which have no fixtures
+are generated.
+
+``create_ca`` and ``create_cert`` save CAs and certificates
+with default values which can be overridden.
+"""
+import glob
+import os
+import threading
+import unittest
+
+from django.test.runner import DiscoverRunner
+
+# fixed private keys, named rsa-<key length>-<n>.pem
+KEY_FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testing_keys')
+
+# PEM keys, by key length
+_keys = {}
+# index of the next key, by key length
+_counters = {}
+# generate_key of the patched backend classes (None if inherited)
+_originals = {}
+_lock = threading.Lock()
+
+
+def _next_key(key_length):
+    """
+    returns the next PEM key of ``key_length`` bits
+    or ``None`` if there are no fixtures of that length
+    """
+    with _lock:
+        if key_length not in _keys:
+            pattern = os.path.join(KEY_FIXTURES_DIR, 'rsa-{0}-*.pem'.format(key_length))
+            keys = []
+            for path in sorted(glob.glob(pattern)):
+                with open(path, 'rb') as f:
+                    keys.append(f.read())
+            _keys[key_length] = keys
+        keys = _keys[key_length]
+        if not keys:
+            return None
+        index = _counters.get(key_length, 0)
+        _counters[key_length] = (index + 1) % len(keys)
+        return keys[index]
+
+
+def _patch(cls):
+    generate_key = cls.generate_key
+
+    def fixture_generate_key(self, key_length):
+        pem = _next_key(key_length)
+        if pem is None:
+            return generate_key(self, key_length)
+        return self.load_private_key(pem)
+
+    _originals[cls] = cls.__dict__.get('generate_key')
+    cls.generate_key = fixture_generate_key
+
+
+def install_key_fixtures(backend_classes=None):
+    """
+    makes ``backend_classes`` (defaults to the
+    backends shipped with django-x509) take
+    keys from the fixtures in ``KEY_FIXTURES_DIR``
+    """
+    if backend_classes is None:
+        from .backends.cryptography import CryptographyBackend
+        from .backends.pyopenssl import PyOpenSSLBackend
+        backend_classes = (PyOpenSSLBackend, CryptographyBackend)
+    for cls in backend_classes:
+        if cls not in _originals:
+            _patch(cls)
+    reset_key_fixtures()
+
+
+def uninstall_key_fixtures():
+    """
+    restores the key generation of the patched backends
+    """
+    for cls, original in list(_originals.items()):
+        if original is None:
+            del cls.generate_key
+        else:
+            cls.generate_key = original
+        del _originals[cls]
+
+
+def reset_key_fixtures():
+    """
+    restarts serving keys from the first fixture of each length
+    """
+    with _lock:
+        _counters.clear()
+
+
+class KeyFixturesTestResult(object):
+    """
+    test result mixin which resets the key fixtures before each test
+    """
+    def startTest(self, test):
+        reset_key_fixtures()
+        super(KeyFixturesTestResult, self).startTest(test)
+
+
+class KeyFixturesTestRunner(DiscoverRunner):
+    """
+    test runner which installs the key fixtures
+    (``TEST_RUNNER = 'django_x509.testing.KeyFixturesTestRunner'``)
+    """
+    def setup_test_environment(self, **kwargs):
+        super(KeyFixturesTestRunner, self).setup_test_environment(**kwargs)
+        install_key_fixtures()
+
+    def teardown_test_environment(self, **kwargs):
+        uninstall_key_fixtures()
+        super(KeyFixturesTestRunner, self).teardown_test_environment(**kwargs)
+
+    def get_resultclass(self):
+        resultclass = super(KeyFixturesTestRunner, self).get_resultclass() or unittest.TextTestResult
+        return type('KeyFixtures' + resultclass.__name__, (KeyFixturesTestResult, resultclass), {})
+
+
+def create_ca(**kwargs):
+    """
+    saves and returns a new ``Ca``
+    """
+    from .models import Ca
+    options = {'name': 'Test CA',
+               'common_name': 'ca.example.com',
+               'organization': 'Test'}
+    options.update(kwargs)
+    ca = Ca(**options)
+    ca.full_clean()
+    ca.save()
+    return ca
+
+
+def create_cert(ca=None, **kwargs):
+    """
+    saves and returns a new ``Cert`` signed by ``ca``
+    (a new CA is created if ``ca`` is not given)
+    """
+    from .models import Cert
+    options = {'name': 'Test certificate',
+               'common_name': 'cert.example.com',
+               'organization': 'Test'}
+    options.update(kwargs)
+    cert = Cert(ca=ca or create_ca(), **options)
+    cert.full_clean()
+    cert.save()
+    return cert
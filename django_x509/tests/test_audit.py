@@ -0,0 +1,128 @@
+import json
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+from OpenSSL import crypto
+
+from .. import settings as app_settings
+from ..audit import KEY_MISMATCH, SIGNATURE_ERROR, audit_certs
+from ..models import Ca, Cert
+
+
+class TestAudit(TestCase):
+    """
+    tests for django_x509.audit and the audit_certs command
+    """
+    def _create_ca(self, name='ca'):
+        ca = Ca(name=name, key_length='1024', common_name=name)
+        ca.save()
+        return ca
+
+    def _create_cert(self, ca, name='cert'):
+        cert = Cert(name=name, ca=ca, key_length='1024', common_name=name)
+        cert.save()
+        return cert
+
+    def _prepare(self):
+        ca1 = self._create_ca('ca1')
+        ca2 = self._create_ca('ca2')
+        for i in range(5):
+            self._create_cert(ca1, 'cert{0}'.format(i))
+        # private key of another certificate
+        mismatch = self._create_cert(ca1, 'mismatch')
+        Cert.objects.filter(pk=mismatch.pk).update(private_key=self._create_cert(ca1).private_key)
+        # certificate signed by another CA (whose serial number is not used by ca1)
+        Ca.objects.filter(pk=ca2.pk).update(last_serial=100)
+        wrong_ca = self._create_cert(ca2, 'wrong-ca')
+        Cert.objects.filter(pk=wrong_ca.pk).update(ca=ca1)
+        return mismatch, wrong_ca
+
+    def _assert_report(self, report, mismatch, wrong_ca):
+        self.assertEqual(report['audited'], 8)
+        self.assertEqual(report['ok'], 6)
+        self.assertEqual(report['failed'], 2)
+        self.assertEqual(report['problems'][KEY_MISMATCH], 1)
+        self.assertEqual(report['problems'][SIGNATURE_ERROR], 1)
+        failures = dict((f[0], f[2]) for f in report['failures'])
+        self.assertEqual(failures, {mismatch.pk: KEY_MISMATCH,
+                                    wrong_ca.pk: SIGNATURE_ERROR})
+
+    def test_audit(self):
+        mismatch, wrong_ca = self._prepare()
+        report = audit_certs(processes=1, chunk_size=3)
+        self._assert_report(report, mismatch, wrong_ca)
+
+    def test_audit_process_pool(self):
+        mismatch, wrong_ca = self._prepare()
+        audited = []
+        report = audit_certs(processes=2, chunk_size=2, progress=audited.append)
+        self._assert_report(report, mismatch, wrong_ca)
+        self.assertEqual(audited[-1], 8)
+
+    def test_audit_expired(self):
+        past = timezone.now() - timedelta(days=10)
+        ca = Ca(name='ca', key_length='1024', common_name='ca',
+                validity_start=past - timedelta(days=10), validity_end=past)
+        ca.save()
+        Cert(name='cert', ca=ca, key_length='1024', common_name='cert').save()
+        Cert(name='expired', ca=ca, key_length='1024', common_name='expired',
+             validity_start=past - timedelta(days=10), validity_end=past).save()
+        report = audit_certs(processes=1)
+        self.assertEqual(report['audited'], 2)
+        self.assertEqual(report['failures'], [])
+        call_command('audit_certs', processes=1, stdout=StringIO())
+        setattr(app_settings, 'CRYPTO_BACKEND', 'django_x509.backends.cryptography.CryptographyBackend')
+        try:
+            self.assertEqual(audit_certs(processes=1)['failures'], [])
+        finally:
+            setattr(app_settings, 'CRYPTO_BACKEND', 'django_x509.backends.pyopenssl.PyOpenSSLBackend')
+
+    def test_audit_queryset(self):
+        ca = self._create_ca()
+        self._create_cert(ca)
+        self._prepare()
+        report = audit_certs(Cert.objects.filter(ca=ca), processes=1)
+        self.assertEqual(report['audited'], 1)
+        self.assertEqual(report['failed'], 0)
+
+    def test_audit_csr_pending(self):
+        ca = self._create_ca()
+        key = crypto.PKey()
+        key.generate_key(crypto.TYPE_RSA, 1024)
+        request = crypto.X509Req()
+        request.get_subject().commonName = 'csr'
+        request.set_pubkey(key)
+        request.sign(key, 'sha256')
+        csr = crypto.dump_certificate_request(crypto.FILETYPE_PEM, request).decode()
+        Cert(name='csr', ca=ca).sign_request(csr)
+        setattr(app_settings, 'ASYNC_ISSUANCE', True)
+        try:
+            pending = self._create_cert(ca, 'pending')
+            failed = self._create_cert(ca, 'failed')
+        finally:
+            setattr(app_settings, 'ASYNC_ISSUANCE', False)
+        Cert.objects.filter(pk=failed.pk).update(status='failed')
+        report = audit_certs(processes=1)
+        self.assertEqual(report['audited'], 1)
+        self.assertEqual(report['failed'], 0)
+        self.assertEqual(pending.status, 'pending')
+
+    def test_command(self):
+        ca = self._create_ca()
+        self._create_cert(ca)
+        out = StringIO()
+        call_command('audit_certs', processes=1, stdout=out)
+        self.assertIn('Audited 1 certificates of 1 CAs', out.getvalue())
+        self.assertIn('OK: 1', out.getvalue())
+
+    def test_command_failures(self):
+        mismatch, wrong_ca = self._prepare()
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('audit_certs', processes=1, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self._assert_report(report, mismatch, wrong_ca)
@@ -0,0 +1,135 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.six.moves.urllib.parse import quote
+
+from ..auth import _cache, _keys, _users, get_client_cert
+from ..middleware import ClientCertificateMiddleware
+from ..models import Ca, Cert
+
+BACKENDS = ['django_x509.auth.ClientCertificateBackend']
+
+
+class TestClientCertificateAuth(TestCase):
+    """
+    tests for django_x509.auth and django_x509.middleware
+    """
+    def setUp(self):
+        _cache.clear()
+        _keys.clear()
+        _users.clear()
+
+    def _create_ca(self, name='ca'):
+        ca = Ca(name=name, key_length='1024', common_name=name)
+        ca.save()
+        return ca
+
+    def _create_cert(self, ca, name='device1', **kwargs):
+        cert = Cert(name=name, ca=ca, key_length='1024', common_name=name, **kwargs)
+        cert.save()
+        return Cert.objects.get(pk=cert.pk)
+
+    def _request(self, certificate=None):
+        request = RequestFactory().get('/')
+        if certificate:
+            request.META['HTTP_X_SSL_CLIENT_CERT'] = certificate
+        request.user = AnonymousUser()
+        ClientCertificateMiddleware().process_request(request)
+        return request
+
+    def test_get_client_cert(self):
+        cert = self._create_cert(self._create_ca())
+        client_cert = get_client_cert(cert.certificate)
+        self.assertEqual(client_cert.pk, cert.pk)
+        self.assertEqual(client_cert.common_name, 'device1')
+        self.assertTrue(client_cert.is_valid())
+        with self.assertNumQueries(0):
+            self.assertEqual(get_client_cert(cert.certificate), client_cert)
+
+    def test_escaped_header(self):
+        cert = self._create_cert(self._create_ca())
+        self.assertEqual(get_client_cert(quote(cert.certificate)).pk, cert.pk)
+        self.assertEqual(get_client_cert(cert.certificate.replace('\n', '\t')).pk, cert.pk)
+
+    def test_unknown(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        # same issuer and serial number, different certificate
+        other_ca = self._create_ca('ca')
+        forged = self._create_cert(other_ca, serial_number=cert.serial_number)
+        Cert.objects.filter(pk=forged.pk).delete()
+        self.assertIsNone(get_client_cert(forged.certificate))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_client_cert(forged.certificate))
+        self.assertIsNone(get_client_cert('invalid'))
+        self.assertIsNone(get_client_cert(u'-----BEGIN CERTIFICATE-----\n\u00e8\n-----END CERTIFICATE-----'))
+
+    def test_pending_candidate(self):
+        pending = self._create_cert(self._create_ca())
+        # same issuer name and serial number
+        cert = self._create_cert(self._create_ca('ca'), serial_number=pending.serial_number)
+        Cert.objects.filter(pk=pending.pk).update(status='pending', certificate='')
+        self.assertEqual(get_client_cert(cert.certificate).pk, cert.pk)
+
+    def test_revoke_invalidates(self):
+        cert = self._create_cert(self._create_ca())
+        get_client_cert(cert.certificate)
+        cert.revoke()
+        client_cert = get_client_cert(cert.certificate)
+        self.assertTrue(client_cert.revoked)
+        self.assertFalse(client_cert.is_valid())
+
+    def test_delete_invalidates(self):
+        cert = self._create_cert(self._create_ca())
+        get_client_cert(cert.certificate)
+        cert.delete()
+        self.assertIsNone(get_client_cert(cert.certificate))
+
+    def test_keys_bounded(self):
+        ca = self._create_ca()
+        maxsize = _keys.maxsize
+        _keys.maxsize = 1
+        try:
+            first, second = self._create_cert(ca, 'first'), self._create_cert(ca, 'second')
+            get_client_cert(first.certificate)
+            get_client_cert(second.certificate)
+            self.assertEqual(len(_keys), 1)
+            second.revoke()
+            self.assertTrue(get_client_cert(second.certificate).revoked)
+        finally:
+            _keys.maxsize = maxsize
+
+    @override_settings(AUTHENTICATION_BACKENDS=BACKENDS)
+    def test_middleware(self):
+        user = get_user_model().objects.create_user('device1', 'device1@test.com')
+        cert = self._create_cert(self._create_ca())
+        self.assertEqual(self._request(cert.certificate).user, user)
+        # users are cached like certificates
+        with self.assertNumQueries(0):
+            request = self._request(cert.certificate)
+            self.assertEqual(request.client_cert.pk, cert.pk)
+            self.assertEqual(request.user, user)
+            self.assertIsNot(request.user._wrapped, self._request(cert.certificate).user._wrapped)
+        # saving users empties the cache
+        user.is_active = False
+        user.save()
+        self.assertFalse(self._request(cert.certificate).user.is_authenticated())
+
+    @override_settings(AUTHENTICATION_BACKENDS=BACKENDS)
+    def test_middleware_invalid(self):
+        get_user_model().objects.create_user('device1', 'device1@test.com')
+        cert = self._create_cert(self._create_ca())
+        cert.revoke()
+        request = self._request(cert.certificate)
+        self.assertIsNone(request.client_cert)
+        self.assertFalse(request.user.is_authenticated())
+        request = self._request()
+        self.assertIsNone(request.client_cert)
+        self.assertFalse(request.user.is_authenticated())
+
+    @override_settings(AUTHENTICATION_BACKENDS=BACKENDS)
+    def test_middleware_unknown_user(self):
+        cert = self._create_cert(self._create_ca())
+        request = self._request(cert.certificate)
+        self.assertEqual(request.client_cert.pk, cert.pk)
+        self.assertFalse(request.user.is_authenticated())
@@ -0,0 +1,90 @@
+from django.test import TestCase
+from OpenSSL import crypto
+
+from .. import settings as app_settings
+from ..backends import get_backend
+from ..backends.cryptography import CryptographyBackend
+from ..backends.pyopenssl import PyOpenSSLBackend
+from ..models import Ca, Cert
+from . import test_ca, test_cert
+
+CRYPTOGRAPHY_BACKEND = 'django_x509.backends.cryptography.CryptographyBackend'
+PYOPENSSL_BACKEND = 'django_x509.backends.pyopenssl.PyOpenSSLBackend'
+
+
+class CryptographyBackendMixin(object):
+    """
+    runs the tests of the mixed in TestCase with the cryptography backend
+    """
+    def setUp(self):
+        super(CryptographyBackendMixin, self).setUp()
+        setattr(app_settings, 'CRYPTO_BACKEND', CRYPTOGRAPHY_BACKEND)
+
+    def tearDown(self):
+        setattr(app_settings, 'CRYPTO_BACKEND', PYOPENSSL_BACKEND)
+        super(CryptographyBackendMixin, self).tearDown()
+
+
+class TestCaCryptography(CryptographyBackendMixin, test_ca.TestCa):
+    pass
+
+
+class TestCertCryptography(CryptographyBackendMixin, test_cert.TestCert):
+    pass
+
+
+class TestBackends(TestCase):
+    """
+    tests for django_x509.backends
+    """
+    def _create(self, backend):
+        setattr(app_settings, 'CRYPTO_BACKEND', backend)
+        ca = Ca(name='ca', key_length='1024', common_name='ca.org', country_code='IT')
+        ca.save()
+        cert = Cert(name='cert', ca=ca, key_length='1024', common_name='cert.org',
+                    extensions=[{'name': 'subjectAltName', 'critical': False,
+                                 'value': 'DNS:cert.org, IP:10.0.0.1'}])
+        cert.save()
+        setattr(app_settings, 'CRYPTO_BACKEND', PYOPENSSL_BACKEND)
+        return ca, cert
+
+    def test_get_backend(self):
+        self.assertIsInstance(get_backend(), PyOpenSSLBackend)
+        self.assertIs(get_backend(), get_backend())
+        self.assertIsInstance(get_backend(CRYPTOGRAPHY_BACKEND), CryptographyBackend)
+
+    def test_interoperability(self):
+        pyopenssl = get_backend(PYOPENSSL_BACKEND)
+        cryptography = get_backend(CRYPTOGRAPHY_BACKEND)
+        for backend in (PYOPENSSL_BACKEND, CRYPTOGRAPHY_BACKEND):
+            ca, cert = self._create(backend)
+            cert = Cert.objects.get(pk=cert.pk)
+            pyopenssl.verify(cert, ca)
+            cryptography.verify(cert, ca)
+            self.assertEqual(pyopenssl.parse(cert), cryptography.parse(cert))
+            self.assertEqual(pyopenssl.dump_text(cert), cryptography.dump_text(cert))
+
+    def test_same_extensions(self):
+        ca1, cert1 = self._create(PYOPENSSL_BACKEND)
+        ca2, cert2 = self._create(CRYPTOGRAPHY_BACKEND)
+        for obj1, obj2 in ((ca1, ca2), (cert1, cert2)):
+            x1, x2 = obj1.x509, obj2.x509
+            self.assertEqual(x1.get_extension_count(), x2.get_extension_count())
+            for i in range(x1.get_extension_count()):
+                e1, e2 = x1.get_extension(i), x2.get_extension(i)
+                self.assertEqual(e1.get_short_name(), e2.get_short_name())
+                self.assertEqual(e1.get_critical(), e2.get_critical())
+                if e1.get_short_name() not in (b'subjectKeyIdentifier', b'authorityKeyIdentifier'):
+                    self.assertEqual(e1.get_data(), e2.get_data())
+
+    def test_crl(self):
+        for backend in (PYOPENSSL_BACKEND, CRYPTOGRAPHY_BACKEND):
+            ca, cert = self._create(backend)
+            cert.revoke()
+            setattr(app_settings, 'CRYPTO_BACKEND', backend)
+            crl = crypto.load_crl(crypto.FILETYPE_PEM, ca.crl)
+            setattr(app_settings, 'CRYPTO_BACKEND', PYOPENSSL_BACKEND)
+            revoked = crl.get_revoked()
+            self.assertEqual(len(revoked), 1)
+            self.assertEqual(int(revoked[0].get_serial(), 16), cert.serial_number)
+            self.assertEqual(revoked[0].get_reason(), b'Unspecified')
@@ -0,0 +1,142 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from OpenSSL import crypto
+
+from .. import settings as app_settings
+from ..batch import issue_certs, revoke_certs
+from ..models import Ca, Cert, CertProfile
+
+CRYPTOGRAPHY_BACKEND = 'django_x509.backends.cryptography.CryptographyBackend'
+PYOPENSSL_BACKEND = 'django_x509.backends.pyopenssl.PyOpenSSLBackend'
+
+
+class TestBatch(TestCase):
+    """
+    tests for django_x509.batch and the batch views
+    """
+    def _create_ca(self):
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        return ca
+
+    def _create_csr(self, common_name='csr.org'):
+        key = crypto.PKey()
+        key.generate_key(crypto.TYPE_RSA, 1024)
+        request = crypto.X509Req()
+        request.get_subject().commonName = common_name
+        request.get_subject().organizationName = 'OpenWISP'
+        request.set_pubkey(key)
+        request.sign(key, 'sha256')
+        return crypto.dump_certificate_request(crypto.FILETYPE_PEM, request).decode(), key
+
+    def _post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_issue(self):
+        ca = self._create_ca()
+        results = issue_certs(ca, [
+            {'common_name': 'device1', 'key_length': '1024'},
+            {'common_name': 'device2', 'key_length': '0'},
+            {'common_name': 'device3', 'key_length': '1024', 'wrong': 'field'},
+            'wrong',
+        ])
+        self.assertEqual(Cert.objects.count(), 1)
+        cert = Cert.objects.get()
+        self.assertEqual(results[0]['id'], cert.pk)
+        self.assertEqual(results[0]['serial_number'], cert.serial_number)
+        self.assertEqual(results[0]['private_key'], cert.private_key)
+        self.assertEqual(cert.name, 'device1')
+        self.assertIn('key_length', results[1]['errors'])
+        self.assertIn('wrong', results[2]['errors'])
+        self.assertIn('__all__', results[3]['errors'])
+        cert._verify_ca()
+
+    def _test_csr(self):
+        ca = self._create_ca()
+        csr, key = self._create_csr()
+        results = issue_certs(ca, [{'csr': csr}, {'csr': 'wrong'}])
+        cert = Cert.objects.get(pk=results[0]['id'])
+        self.assertEqual(cert.common_name, 'csr.org')
+        self.assertEqual(cert.name, 'csr.org')
+        self.assertEqual(cert.organization, 'OpenWISP')
+        self.assertEqual(cert.private_key, '')
+        self.assertEqual(results[0]['private_key'], '')
+        self.assertEqual(crypto.dump_publickey(crypto.FILETYPE_PEM, cert.x509.get_pubkey()),
+                         crypto.dump_publickey(crypto.FILETYPE_PEM, key))
+        self.assertIn('csr', results[1]['errors'])
+        cert._verify_ca()
+
+    def test_csr(self):
+        self._test_csr()
+
+    def test_csr_cryptography(self):
+        setattr(app_settings, 'CRYPTO_BACKEND', CRYPTOGRAPHY_BACKEND)
+        try:
+            self._test_csr()
+        finally:
+            setattr(app_settings, 'CRYPTO_BACKEND', PYOPENSSL_BACKEND)
+
+    def test_issue_profile(self):
+        ca = self._create_ca()
+        profile = CertProfile.objects.create(name='devices', key_length='1024',
+                                             organization='OpenWISP')
+        results = issue_certs(ca, [{'common_name': 'device1', 'profile': profile.pk},
+                                   {'common_name': 'device2', 'profile': 0}])
+        cert = Cert.objects.get(pk=results[0]['id'])
+        self.assertEqual(cert.profile, profile)
+        self.assertEqual(cert.organization, 'OpenWISP')
+        self.assertIn('profile', results[1]['errors'])
+
+    def test_revoke(self):
+        ca = self._create_ca()
+        certs = issue_certs(ca, [{'common_name': 'device{0}'.format(i), 'key_length': '1024'}
+                                 for i in range(3)])
+        serials = [cert['serial_number'] for cert in certs]
+        Cert.objects.filter(serial_number=serials[2]).update(revoked=True)
+        # ledger entries are checked and appended with a query each
+        with self.assertNumQueries(12):
+            results = revoke_certs(ca, [serials[0], serials[1], serials[2], serials[0],
+                                        123456, 'wrong', True])
+        self.assertEqual([r['status'] for r in results],
+                         ['revoked', 'revoked', 'already_revoked', 'already_revoked',
+                          'not_found', 'invalid', 'invalid'])
+        self.assertEqual(Cert.objects.filter(revoked=True).count(), 3)
+        self.assertEqual(sorted(ca.revocations.values_list('serial_number', flat=True)), serials[:2])
+        ca = Ca.objects.get(pk=ca.pk)
+        self.assertEqual(ca.crl_version, 1)
+        bloom = ca.get_revoked_filter()
+        self.assertIn(serials[0], bloom)
+        self.assertIn(serials[1], bloom)
+
+    def test_views(self):
+        ca = self._create_ca()
+        issue_url = reverse('x509:issue', args=[ca.pk])
+        revoke_url = reverse('x509:revoke', args=[ca.pk])
+        data = {'certificates': [{'common_name': 'device1', 'key_length': '1024'}]}
+        self.assertEqual(self._post(issue_url, data).status_code, 403)
+        get_user_model().objects.create_superuser('admin', 'admin@test.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.assertEqual(self.client.get(issue_url).status_code, 405)
+        self.assertEqual(self.client.post(issue_url, data).status_code, 415)
+        self.assertEqual(self._post(issue_url, {'wrong': []}).status_code, 400)
+        self.assertEqual(self._post(issue_url, {'certificates': {}}).status_code, 400)
+        response = self._post(issue_url, data)
+        self.assertEqual(response.status_code, 200)
+        serial_number = json.loads(response.content.decode())['results'][0]['serial_number']
+        response = self._post(revoke_url, {'serial_numbers': [serial_number]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode())['results'],
+                         [{'serial_number': serial_number, 'status': 'revoked'}])
+        response = self._post(reverse('x509:revoke', args=[0]), {'serial_numbers': []})
+        self.assertEqual(response.status_code, 404)
+
+    def test_max_size(self):
+        get_user_model().objects.create_superuser('admin', 'admin@test.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        ca = self._create_ca()
+        response = self._post(reverse('x509:revoke', args=[ca.pk]),
+                              {'serial_numbers': list(range(1, app_settings.BATCH_MAX_SIZE + 2))})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,146 @@
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from .. import settings as app_settings
+from ..bloom import BloomFilter
+from ..models import Ca, Cert
+
+
+class TestBloomFilter(TestCase):
+    """
+    tests for django_x509.bloom
+    """
+    def test_contains(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(0, 2000, 2):
+            bloom.add(i)
+        self.assertEqual(len(bloom), 1000)
+        self.assertTrue(bloom.full)
+        for i in range(0, 2000, 2):
+            self.assertIn(i, bloom)
+        false_positives = sum(1 for i in range(1, 20000, 2) if i in bloom)
+        self.assertLess(false_positives / 10000.0, 0.02)
+        self.assertAlmostEqual(bloom.error_rate, 0.01, places=2)
+
+    def test_size(self):
+        bloom = BloomFilter(capacity=1000000, error_rate=0.001)
+        # ~1.8 MB for a million serial numbers
+        self.assertLess(len(bloom.to_bytes()), 1800000)
+        self.assertEqual(bloom.hashes, 10)
+
+    def test_serialization(self):
+        bloom = BloomFilter(capacity=100)
+        bloom.add(12345)
+        loaded = BloomFilter.from_bytes(bloom.to_bytes())
+        self.assertIn(12345, loaded)
+        self.assertNotIn(12346, loaded)
+        self.assertEqual(len(loaded), 1)
+        self.assertEqual(loaded.capacity, 100)
+        self.assertEqual((loaded.size, loaded.hashes), (bloom.size, bloom.hashes))
+
+    def test_invalid(self):
+        bloom = BloomFilter(capacity=100)
+        with self.assertRaises(ValueError):
+            BloomFilter.from_bytes(b'XXXX' + bloom.to_bytes()[4:])
+        with self.assertRaises(ValueError):
+            BloomFilter.from_bytes(bloom.to_bytes()[:-1])
+
+
+class TestRevokedFilter(TestCase):
+    """
+    tests for the bloom filter of revoked serial numbers of CAs
+    """
+    def _create_ca(self):
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        return ca
+
+    def _create_cert(self, ca, name='cert'):
+        cert = Cert(name=name, ca=ca, key_length='1024', common_name=name)
+        cert.save()
+        return cert
+
+    def test_revoke(self):
+        ca = self._create_ca()
+        cert1 = self._create_cert(ca, 'cert1')
+        cert2 = self._create_cert(ca, 'cert2')
+        self.assertIsNone(ca.revoked_filter)
+        cert1.revoke()
+        ca = Ca.objects.get(pk=ca.pk)
+        bloom = ca.get_revoked_filter()
+        self.assertIn(cert1.serial_number, bloom)
+        self.assertNotIn(cert2.serial_number, bloom)
+        cert2.revoke()
+        bloom = Ca.objects.get(pk=ca.pk).get_revoked_filter()
+        self.assertIn(cert2.serial_number, bloom)
+        self.assertEqual(len(bloom), 2)
+
+    def test_save_keeps_filter(self):
+        ca = self._create_ca()
+        stale = Ca.objects.get(pk=ca.pk)
+        cert = self._create_cert(ca)
+        cert.revoke()
+        stale.notes = 'changed'
+        stale.save()
+        ca = Ca.objects.get(pk=ca.pk)
+        self.assertEqual(ca.notes, 'changed')
+        self.assertEqual(ca.crl_version, 1)
+        self.assertIn(cert.serial_number, ca.get_revoked_filter())
+
+    def test_rebuild_when_full(self):
+        setattr(app_settings, 'REVOKED_FILTER_CAPACITY', 1)
+        try:
+            ca = self._create_ca()
+            certs = [self._create_cert(ca, 'cert{0}'.format(i)) for i in range(3)]
+            certs[0].revoke()
+            self.assertEqual(ca.get_revoked_filter().capacity, 2)
+            certs[1].revoke()
+            self.assertTrue(ca.get_revoked_filter().full)
+            # full filters are built again with twice the capacity
+            certs[2].revoke()
+            bloom = Ca.objects.get(pk=ca.pk).get_revoked_filter()
+            self.assertEqual(bloom.capacity, 6)
+            for cert in certs:
+                self.assertIn(cert.serial_number, bloom)
+        finally:
+            setattr(app_settings, 'REVOKED_FILTER_CAPACITY', 1000)
+
+    def test_view(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        cert.revoke()
+        response = self.client.get(reverse('x509:revoked_filter', args=[ca.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertIn(cert.serial_number, BloomFilter.from_bytes(response.content))
+        response = self.client.get(reverse('x509:revoked_filter', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_view_403(self):
+        setattr(app_settings, 'CRL_PROTECTED', True)
+        try:
+            ca = self._create_ca()
+            response = self.client.get(reverse('x509:revoked_filter', args=[ca.pk]))
+            self.assertEqual(response.status_code, 403)
+        finally:
+            setattr(app_settings, 'CRL_PROTECTED', False)
+
+    def test_command(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        cert.revoke()
+        path = os.path.join(tempfile.mkdtemp(), 'ca.bloom')
+        out = StringIO()
+        call_command('export_revoked_filter', str(ca.pk), output=path, rebuild=True, stdout=out)
+        self.assertIn('1 revoked serial numbers', out.getvalue())
+        with open(path, 'rb') as f:
+            self.assertIn(cert.serial_number, BloomFilter.from_bytes(f.read()))
+        os.remove(path)
+        with self.assertRaises(CommandError):
+            call_command('export_revoked_filter', '0', stdout=out)
@@ -1,9 +1,12 @@
+import pickle
 from datetime import datetime, timedelta
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.utils import timezone
+from django.utils.encoding import force_text
 from OpenSSL import crypto
 
 from .. import settings as app_settings
@@ -95,7 +98,8 @@ WRyKPvMvJzWT
         self.assertNotEqual(ca.certificate, '')
         self.assertNotEqual(ca.private_key, '')
         cert = crypto.load_certificate(crypto.FILETYPE_PEM, ca.certificate)
-        self.assertEqual(cert.get_serial_number(), ca.id)
+        self.assertEqual(cert.get_serial_number(), 1)
+        self.assertEqual(ca.serial_number, 1)
         subject = cert.get_subject()
         self.assertEqual(subject.countryName, ca.country_code)
         self.assertEqual(subject.stateOrProvinceName, ca.state)
@@ -331,9 +335,11 @@ WRyKPvMvJzWT
         revoked_list = crl.get_revoked()
         self.assertIsNotNone(revoked_list)
         self.assertEqual(len(revoked_list), 1)
-        self.assertEqual(int(revoked_list[0].get_serial()), cert.serial_number)
+        self.assertEqual(int(revoked_list[0].get_serial(), 16), cert.serial_number)
 
     def test_crl_view(self):
+        # primary keys are reused between tests
+        cache.clear()
         ca, cert = self._prepare_revoked()
         response = self.client.get(reverse('x509:crl', args=[ca.pk]))
         self.assertEqual(response.status_code, 200)
@@ -341,7 +347,7 @@ WRyKPvMvJzWT
         revoked_list = crl.get_revoked()
         self.assertIsNotNone(revoked_list)
         self.assertEqual(len(revoked_list), 1)
-        self.assertEqual(int(revoked_list[0].get_serial()), cert.serial_number)
+        self.assertEqual(int(revoked_list[0].get_serial(), 16), cert.serial_number)
 
     def test_crl_view_403(self):
         setattr(app_settings, 'CRL_PROTECTED', True)
@@ -413,3 +419,107 @@ KQV8C/ciDV+lIw2yBmlCNvUmy7GAsHSZM+C8y29+GFR7an6WV+xa
         ca.full_clean()
         ca.save()
         self.assertEqual(ca.email, '')
+
+    def _create_hierarchy(self):
+        setattr(app_settings, 'CA_BASIC_CONSTRAINTS_PATHLEN', 1)
+        root = self._create_ca()
+        setattr(app_settings, 'CA_BASIC_CONSTRAINTS_PATHLEN', 0)
+        intermediate = Ca(name='intermediate',
+                          parent=root,
+                          key_length='1024',
+                          digest='sha256',
+                          common_name='intermediate.openwisp.org')
+        intermediate.full_clean()
+        intermediate.save()
+        return root, intermediate
+
+    def test_intermediate_ca(self):
+        root, intermediate = self._create_hierarchy()
+        self.assertEqual(root.pathlen, 1)
+        self.assertEqual(intermediate.pathlen, 0)
+        self.assertEqual(intermediate.x509.get_issuer(), root.x509.get_subject())
+        intermediate._verify_ca()
+        root = Ca.objects.get(pk=root.pk)
+        intermediate = Ca.objects.get(pk=intermediate.pk)
+        self.assertEqual(intermediate.chain, intermediate.certificate + root.certificate)
+        self.assertEqual(intermediate.get_chain().count('BEGIN CERTIFICATE'), 2)
+        self.assertEqual(root.get_chain(), root.certificate)
+
+    def test_intermediate_ca_cert(self):
+        root, intermediate = self._create_hierarchy()
+        cert = self._create_cert(ca=intermediate)
+        self.assertEqual(cert.x509.get_issuer(), intermediate.x509.get_subject())
+        cert = Cert.objects.select_related('ca').get(pk=cert.pk)
+        # verification does not need to load the parent CA
+        with self.assertNumQueries(0):
+            cert._verify_ca()
+            chain = cert.get_chain()
+        self.assertEqual(chain.count('BEGIN CERTIFICATE'), 3)
+        # verification of imported certificates
+        imported = Cert(name='imported', ca=intermediate, certificate=cert.certificate)
+        imported._verify_ca()
+        with self.assertRaises(ValidationError):
+            Cert(name='invalid', ca=root, certificate=cert.certificate)._verify_ca()
+        # certificates signed by the parent of the CA are rejected
+        root_cert = self._create_cert(ca=root)
+        with self.assertRaises(ValidationError):
+            Cert(name='invalid', ca=intermediate, certificate=root_cert.certificate)._verify_ca()
+        # the intermediate CA is verified against the root CA
+        forged = Ca.objects.get(pk=self._create_ca().pk)
+        self.assertEqual(forged.x509.get_subject(), root.x509.get_subject())
+        intermediate = Ca.objects.get(pk=intermediate.pk)
+        intermediate.chain = intermediate.certificate + forged.certificate
+        with self.assertRaises(ValidationError):
+            Cert(name='imported', ca=intermediate, certificate=cert.certificate)._verify_ca()
+
+    def test_serial_number_per_issuer(self):
+        root, intermediate = self._create_hierarchy()
+        cert = self._create_cert(ca=root)
+        sub_cert = self._create_cert(ca=intermediate)
+        self.assertEqual([root.serial_number, intermediate.serial_number, cert.serial_number],
+                         [1, 2, 3])
+        self.assertEqual(sub_cert.serial_number, 1)
+        self.assertEqual(Ca.objects.get(pk=root.pk).last_serial, 3)
+
+    def test_intermediate_ca_pathlen(self):
+        root, intermediate = self._create_hierarchy()
+        ca = Ca(name='sub', parent=intermediate, key_length='1024',
+                digest='sha256', common_name='sub')
+        with self.assertRaises(ValidationError):
+            ca.full_clean()
+        with self.assertRaises(ValidationError):
+            ca.save()
+
+    def test_pickle(self):
+        ca = self._create_ca()
+        self.assertIsNotNone(ca.x509)
+        self.assertIsNotNone(ca.pkey)
+        loaded = pickle.loads(pickle.dumps(ca))
+        self.assertNotIn('x509', loaded.__dict__)
+        self.assertNotIn('pkey', loaded.__dict__)
+        self.assertEqual(loaded.x509.get_subject().commonName, 'openwisp.org')
+        self.assertEqual(crypto.dump_privatekey(crypto.FILETYPE_PEM, loaded.pkey),
+                         crypto.dump_privatekey(crypto.FILETYPE_PEM, ca.pkey))
+        # the parsed objects of the pickled instance are left alone
+        self.assertIn('x509', ca.__dict__)
+
+    def test_get_cached(self):
+        ca, cert = self._prepare_revoked()
+        cached = Ca.objects.get_cached(ca.pk)
+        self.assertEqual(cached, ca)
+        self.assertEqual(cached.certificate, force_text(ca.certificate))
+        # only the changing fields are read from the database
+        with self.assertNumQueries(1):
+            cached = Ca.objects.get_cached(ca.pk)
+        self.assertEqual(cached.crl_version, Ca.objects.get(pk=ca.pk).crl_version)
+        # revocations update the CRL version
+        Ca.objects.filter(pk=ca.pk).update(crl_version=100)
+        with self.assertNumQueries(1):
+            self.assertEqual(Ca.objects.get_cached(ca.pk).crl_version, 100)
+        # changes are fetched again
+        ca.notes = 'changed'
+        ca.save()
+        with self.assertNumQueries(2):
+            self.assertEqual(Ca.objects.get_cached(ca.pk).notes, 'changed')
+        with self.assertRaises(Ca.DoesNotExist):
+            Ca.objects.get_cached(0)
@@ -112,7 +112,9 @@ WRyKPvMvJzWT
         self.assertNotEqual(cert.certificate, '')
         self.assertNotEqual(cert.private_key, '')
         x509 = cert.x509
-        self.assertEqual(x509.get_serial_number(), cert.id)
+        self.assertEqual(x509.get_serial_number(), cert.serial_number)
+        # the certificate of the CA is the first one it signs
+        self.assertEqual(cert.serial_number, 2)
         subject = x509.get_subject()
         # check subject
         self.assertEqual(subject.countryName, cert.country_code)
@@ -365,3 +367,26 @@ WRyKPvMvJzWT
         cert._fill_subject(x509.get_subject())
         self.email = 'test@test.com'
         cert._fill_subject(x509.get_subject())
+
+    def test_summaries(self):
+        cert = self._create_cert()
+        ca = cert.ca
+        for i in range(4):
+            Cert.objects.create(name='cert{0}'.format(i), ca=ca, common_name='cert{0}'.format(i),
+                                serial_number=100 + i, certificate='placeholder',
+                                private_key='placeholder')
+        cert.revoke()
+        with self.assertNumQueries(3):
+            summaries = list(ca.iter_cert_summaries(chunk_size=2))
+        self.assertEqual([s.pk for s in summaries],
+                         list(Cert.objects.order_by('pk').values_list('pk', flat=True)))
+        summary = summaries[0]
+        self.assertEqual(summary.serial_number, cert.serial_number)
+        self.assertEqual(summary.common_name, 'test.org')
+        self.assertEqual(summary.validity_end, cert.validity_end)
+        self.assertTrue(summary.revoked)
+        self.assertEqual(summary.revoked_at, cert.revoked_at)
+        with self.assertRaises(AttributeError):
+            summary.certificate = 'placeholder'
+        revoked = list(Cert.objects.filter(revoked=True).summaries())
+        self.assertEqual([s.pk for s in revoked], [cert.pk])
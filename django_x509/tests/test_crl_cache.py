@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.test import TestCase, override_settings
+
+from .. import settings as app_settings
+from ..models import Ca, Cert
+
+crl_property = Ca.crl
+
+
+class AtomicFileBasedCache(FileBasedCache):
+    """
+    FileBasedCache.add() is not atomic between processes
+    (unlike the one of memcached, redis and the database cache)
+    """
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        lock = '{0}.add'.format(self._key_to_file(key, version))
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL)
+        except OSError:
+            return False
+        try:
+            return super(AtomicFileBasedCache, self).add(key, value, timeout, version)
+        finally:
+            os.close(fd)
+            os.remove(lock)
+
+
+def _get_cached_crl(pk, results):
+    ca = Ca.objects.get(pk=pk)
+    results.put(ca.get_cached_crl())
+
+
+class TestCrlCache(TestCase):
+    """
+    tests for AbstractCa.get_cached_crl
+    """
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django_x509.tests.test_crl_cache.AtomicFileBasedCache',
+                'LOCATION': self.cache_dir,
+            }
+        })
+        self.settings.enable()
+        # number of CRL generations, shared with forked processes
+        self.builds = builds = multiprocessing.Value('i', 0)
+
+        def crl(self):
+            with builds.get_lock():
+                builds.value += 1
+            time.sleep(0.3)
+            return crl_property.fget(self)
+
+        Ca.crl = property(crl)
+
+    def tearDown(self):
+        Ca.crl = crl_property
+        self.settings.disable()
+        shutil.rmtree(self.cache_dir)
+
+    def _create_ca(self):
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        return ca
+
+    def _create_cert(self, ca):
+        cert = Cert(name='cert', ca=ca, key_length='1024', common_name='cert')
+        cert.save()
+        return cert
+
+    def _run_processes(self, ca, count=6):
+        """
+        calls ``get_cached_crl`` in ``count`` concurrent processes
+        (forked processes work on a copy of the test database)
+        """
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_get_cached_crl,
+                                             args=(ca.pk, results))
+                     for i in range(count)]
+        for process in processes:
+            process.start()
+        crls = [results.get(timeout=30) for process in processes]
+        for process in processes:
+            process.join()
+        return crls
+
+    def test_cached(self):
+        ca = self._create_ca()
+        crl = ca.get_cached_crl()
+        self.assertEqual(ca.get_cached_crl(), crl)
+        self.assertEqual(self.builds.value, 1)
+
+    def test_revoke_invalidates(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        ca.get_cached_crl()
+        cert.revoke()
+        ca = Ca.objects.get(pk=ca.pk)
+        self.assertEqual(ca.crl_version, 1)
+        ca.get_cached_crl()
+        self.assertEqual(self.builds.value, 2)
+
+    def test_locked_returns_previous(self):
+        ca = self._create_ca()
+        previous = ca.get_cached_crl()
+        ca.crl_version = 1
+        caches['default'].add('django_x509:crl:{0}:lock'.format(ca.pk), True)
+        self.assertEqual(ca.get_cached_crl(), previous)
+        self.assertEqual(self.builds.value, 1)
+
+    def test_locked_timeout(self):
+        ca = self._create_ca()
+        caches['default'].add('django_x509:crl:{0}:lock'.format(ca.pk), True)
+        setattr(app_settings, 'CRL_LOCK_TIMEOUT', 0.1)
+        try:
+            self.assertIn(b'BEGIN X509 CRL', ca.get_cached_crl())
+        finally:
+            setattr(app_settings, 'CRL_LOCK_TIMEOUT', 30)
+
+    def test_processes_cold_cache(self):
+        ca = self._create_ca()
+        crls = self._run_processes(ca)
+        self.assertEqual(self.builds.value, 1)
+        self.assertEqual(len(set(crls)), 1)
+
+    def test_processes_after_revocation(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        previous = ca.get_cached_crl()
+        cert.revoke()
+        ca = Ca.objects.get(pk=ca.pk)
+        crls = self._run_processes(ca)
+        # a single process rebuilds the CRL,
+        # the others return the previous one
+        self.assertEqual(self.builds.value, 2)
+        self.assertEqual(len(set(crls)), 2)
+        self.assertEqual(crls.count(previous), 5)
+        self.assertNotEqual(ca.get_cached_crl(), previous)
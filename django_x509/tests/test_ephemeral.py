@@ -0,0 +1,186 @@
+import time
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from OpenSSL import crypto
+
+from .. import settings as app_settings
+from ..models import Ca, Cert, IssuanceLog
+from ..models import ca as ca_module
+from ..models import issuancelog
+from ..models.ca import EPHEMERAL_SERIAL_START
+
+
+class TestEphemeral(TestCase):
+    """
+    tests for Ca.issue_ephemeral and IssuanceLog
+    """
+    def setUp(self):
+        ca_module._ephemeral_serials.clear()
+        issuancelog._buffer.clear()
+        issuancelog._buffer_since.clear()
+
+    def tearDown(self):
+        self.setUp()
+        setattr(app_settings, 'EPHEMERAL_SERIAL_BLOCK', 100)
+        setattr(app_settings, 'EPHEMERAL_LOG_BATCH_SIZE', 100)
+        setattr(app_settings, 'EPHEMERAL_LOG_FLUSH_INTERVAL', 5)
+
+    def _create_ca(self):
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        return ca
+
+    def test_issue(self):
+        ca = self._create_ca()
+        cert = ca.issue_ephemeral({'common_name': 'device1', 'organization': 'OpenWISP'},
+                                  validity=timedelta(minutes=30),
+                                  key_length='1024')
+        self.assertIsNone(cert.pk)
+        self.assertEqual(Cert.objects.count(), 0)
+        self.assertEqual(cert.serial_number, EPHEMERAL_SERIAL_START)
+        self.assertEqual(cert.x509.get_serial_number(), EPHEMERAL_SERIAL_START)
+        self.assertEqual(cert.x509.get_subject().commonName, 'device1')
+        self.assertEqual(cert.validity_end - cert.validity_start, timedelta(minutes=30))
+        self.assertTrue(cert.private_key)
+        cert._verify_ca()
+        self.assertEqual(ca.issue_ephemeral({'common_name': 'device2'}, key_length='1024').serial_number,
+                         EPHEMERAL_SERIAL_START + 1)
+
+    def test_csr(self):
+        ca = self._create_ca()
+        key = crypto.PKey()
+        key.generate_key(crypto.TYPE_RSA, 1024)
+        request = crypto.X509Req()
+        request.get_subject().commonName = 'csr.org'
+        request.set_pubkey(key)
+        request.sign(key, 'sha256')
+        csr = crypto.dump_certificate_request(crypto.FILETYPE_PEM, request).decode()
+        cert = ca.issue_ephemeral(csr=csr, validity=60)
+        self.assertEqual(cert.common_name, 'csr.org')
+        self.assertEqual(cert.private_key, '')
+        self.assertEqual(crypto.dump_publickey(crypto.FILETYPE_PEM, cert.x509.get_pubkey()),
+                         crypto.dump_publickey(crypto.FILETYPE_PEM, key))
+
+    def test_serial_blocks(self):
+        setattr(app_settings, 'EPHEMERAL_SERIAL_BLOCK', 2)
+        ca = self._create_ca()
+        serials = [ca._next_ephemeral_serial() for i in range(3)]
+        self.assertEqual(serials, [EPHEMERAL_SERIAL_START + i for i in range(3)])
+        self.assertEqual(Ca.objects.get(pk=ca.pk).ephemeral_serial, EPHEMERAL_SERIAL_START + 4)
+        # another process reserves the next block
+        ca_module._ephemeral_serials.clear()
+        self.assertEqual(ca._next_ephemeral_serial(), EPHEMERAL_SERIAL_START + 4)
+        # saving a stale instance doesn't release reserved serial numbers
+        ca.save()
+        self.assertEqual(Ca.objects.get(pk=ca.pk).ephemeral_serial, EPHEMERAL_SERIAL_START + 6)
+
+    def test_log(self):
+        setattr(app_settings, 'EPHEMERAL_LOG_BATCH_SIZE', 3)
+        ca = self._create_ca()
+        for i in range(2):
+            ca.issue_ephemeral({'common_name': 'device{0}'.format(i)}, key_length='1024')
+        self.assertEqual(IssuanceLog.objects.count(), 0)
+        # the batch is written in a savepoint inside transactions
+        # (not otherwise, see TestIssuanceLogTransaction)
+        with self.assertNumQueries(3):
+            cert = ca.issue_ephemeral({'common_name': 'device2'}, key_length='1024')
+        self.assertEqual(IssuanceLog.objects.count(), 3)
+        log = IssuanceLog.objects.get(serial_number=cert.serial_number)
+        self.assertEqual(log.ca, ca)
+        self.assertEqual(log.validity_end, cert.validity_end)
+        self.assertEqual(log.subject_hash, issuancelog.subject_hash(cert))
+        ca.issue_ephemeral({'common_name': 'device3'}, key_length='1024')
+        IssuanceLog.flush()
+        self.assertEqual(IssuanceLog.objects.count(), 4)
+
+    def test_log_failure(self):
+        ca = self._create_ca()
+        cert = ca.issue_ephemeral({'common_name': 'device1'}, key_length='1024')
+        IssuanceLog.flush()
+        ca.issue_ephemeral({'common_name': 'device2'}, key_length='1024')
+        # a row conflicts with the buffered entry
+        conflict = IssuanceLog.objects.create(ca=ca, serial_number=cert.serial_number + 1,
+                                              subject_hash='', validity_end=cert.validity_end)
+        ca.issue_ephemeral({'common_name': 'device3'}, key_length='1024')
+        # the rejected entry is dropped, the others are written
+        IssuanceLog.flush()
+        self.assertEqual(len(issuancelog._buffer['default']), 0)
+        self.assertEqual(sorted(IssuanceLog.objects.values_list('serial_number', flat=True)),
+                         [cert.serial_number, conflict.serial_number, cert.serial_number + 2])
+        self.assertEqual(IssuanceLog.objects.get(serial_number=conflict.serial_number).subject_hash, '')
+
+    def test_log_unavailable(self):
+        ca = self._create_ca()
+        setattr(app_settings, 'EPHEMERAL_LOG_BATCH_SIZE', 1)
+
+        def write(cls, db, items):
+            raise OperationalError('database is locked')
+
+        original = IssuanceLog.__dict__['_write']
+        IssuanceLog._write = classmethod(write)
+        try:
+            # errors of the flush are not raised by the issuance
+            ca.issue_ephemeral({'common_name': 'device1'}, key_length='1024')
+            ca.issue_ephemeral({'common_name': 'device2'}, key_length='1024')
+            with self.assertRaises(OperationalError):
+                IssuanceLog.flush()
+        finally:
+            IssuanceLog._write = original
+        # entries are kept until they are written
+        self.assertEqual(len(issuancelog._buffer['default']), 2)
+        IssuanceLog.flush()
+        self.assertEqual(IssuanceLog.objects.count(), 2)
+
+    def test_invalid(self):
+        ca = self._create_ca()
+        with self.assertRaises(ValidationError):
+            ca.issue_ephemeral({'common_name': 'device1'}, key_length='0')
+        with self.assertRaises(TypeError):
+            ca.issue_ephemeral({'wrong': 'field'})
+
+
+class TestIssuanceLogTransaction(TransactionTestCase):
+    """
+    tests for IssuanceLog outside transactions
+    """
+    def tearDown(self):
+        issuancelog._buffer.clear()
+        issuancelog._buffer_since.clear()
+        setattr(app_settings, 'EPHEMERAL_LOG_BATCH_SIZE', 100)
+
+    def test_log_queries(self):
+        setattr(app_settings, 'EPHEMERAL_LOG_BATCH_SIZE', 2)
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        ca.issue_ephemeral({'common_name': 'device1'}, key_length='1024')
+        with CaptureQueriesContext(connection) as queries:
+            ca.issue_ephemeral({'common_name': 'device2'}, key_length='1024')
+        statements = [query['sql'].split()[0] for query in queries.captured_queries]
+        self.assertEqual(statements.count('INSERT'), 1)
+        self.assertNotIn('SAVEPOINT', statements)
+        self.assertEqual(IssuanceLog.objects.count(), 2)
+
+
+class TestIssuanceLogTimer(TransactionTestCase):
+    """
+    tests for the timer which flushes the buffer of idle processes
+    """
+    def tearDown(self):
+        setattr(app_settings, 'EPHEMERAL_LOG_FLUSH_INTERVAL', 5)
+
+    def test_timer(self):
+        setattr(app_settings, 'EPHEMERAL_LOG_FLUSH_INTERVAL', 0.1)
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        ca.issue_ephemeral({'common_name': 'device1'}, key_length='1024')
+        self.assertEqual(IssuanceLog.objects.count(), 0)
+        for i in range(50):
+            if IssuanceLog.objects.exists():
+                break
+            time.sleep(0.1)
+        self.assertEqual(IssuanceLog.objects.count(), 1)
+        self.assertEqual(len(issuancelog._buffer['default']), 0)
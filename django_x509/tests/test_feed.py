@@ -0,0 +1,131 @@
+import json
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import settings as app_settings
+from ..feed import decode_cursor, encode_cursor, get_changes
+from ..models import Ca, Cert, Tombstone
+
+
+class TestChangeFeed(TestCase):
+    """
+    tests for django_x509.feed
+    """
+    def setUp(self):
+        setattr(app_settings, 'CHANGE_FEED_DELAY', 0)
+
+    def tearDown(self):
+        setattr(app_settings, 'CHANGE_FEED_DELAY', 2)
+
+    def _create_ca(self):
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        return ca
+
+    def _create_certs(self, ca, count):
+        certs = []
+        for i in range(count):
+            cert = Cert(name='cert{0}'.format(i), ca=ca, common_name='cert{0}'.format(i),
+                        serial_number=i + 1, certificate='placeholder', private_key='placeholder')
+            cert.save()
+            certs.append(cert)
+        return certs
+
+    def _all_changes(self, model, cursor=None, limit=2):
+        changes = []
+        more = True
+        while more:
+            page, cursor, more = get_changes(model, cursor, limit=limit)
+            self.assertLessEqual(len(page), limit)
+            changes += page
+        return changes, cursor
+
+    def test_cursor(self):
+        now = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(now, 12)), (now, 12))
+        for cursor in ('wrong', '1-2-3', '-1-2'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_pages(self):
+        ca = self._create_ca()
+        certs = self._create_certs(ca, 5)
+        changes, cursor = self._all_changes('cert')
+        self.assertEqual([c['id'] for c in changes], [cert.pk for cert in certs])
+        self.assertEqual(changes[0]['action'], 'updated')
+        self.assertEqual(changes[0]['ca'], ca.pk)
+        self.assertNotIn('private_key', changes[0])
+        # nothing changed
+        self.assertEqual(get_changes('cert', cursor), ([], cursor, False))
+        certs[1].revoke()
+        certs[3].notes = 'changed'
+        certs[3].save()
+        changes, cursor = self._all_changes('cert', cursor)
+        self.assertEqual([(c['id'], c['action']) for c in changes],
+                         [(certs[1].pk, 'revoked'), (certs[3].pk, 'updated')])
+        ca_changes, ca_cursor = self._all_changes('ca')
+        self.assertEqual([c['id'] for c in ca_changes], [ca.pk])
+
+    def test_same_modified(self):
+        ca = self._create_ca()
+        certs = self._create_certs(ca, 5)
+        Cert.objects.update(modified=certs[0].modified)
+        changes, cursor = self._all_changes('cert', limit=2)
+        self.assertEqual([c['id'] for c in changes], [cert.pk for cert in certs])
+
+    def test_deletions(self):
+        ca = self._create_ca()
+        certs = self._create_certs(ca, 3)
+        changes, cursor = self._all_changes('cert')
+        pks = [cert.pk for cert in certs]
+        certs[0].delete()
+        changes, cursor = self._all_changes('cert', cursor)
+        self.assertEqual(changes, [{'id': pks[0],
+                                    'ca': ca.pk,
+                                    'serial_number': certs[0].serial_number,
+                                    'modified': changes[0]['modified'],
+                                    'action': 'deleted'}])
+        ca.delete()
+        changes, cursor = self._all_changes('cert', cursor)
+        self.assertEqual(sorted((c['id'], c['action']) for c in changes),
+                         [(pks[1], 'deleted'), (pks[2], 'deleted')])
+        changes, cursor = self._all_changes('ca')
+        self.assertEqual([c['action'] for c in changes], ['deleted'])
+        self.assertEqual(Tombstone.objects.count(), 4)
+
+    def test_delay(self):
+        self._create_certs(self._create_ca(), 1)
+        setattr(app_settings, 'CHANGE_FEED_DELAY', 60)
+        self.assertEqual(get_changes('cert'), ([], None, False))
+        Cert.objects.update(modified=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(len(get_changes('cert')[0]), 1)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            get_changes('user')
+        with self.assertRaises(ValueError):
+            get_changes('cert', limit=-1)
+
+    def test_view(self):
+        ca = self._create_ca()
+        certs = self._create_certs(ca, 3)
+        url = reverse('x509:changes', args=['cert'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+        get_user_model().objects.create_superuser('admin', 'admin@test.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode())
+        self.assertEqual([c['id'] for c in data['results']], [certs[0].pk, certs[1].pk])
+        self.assertTrue(data['more'])
+        response = self.client.get(url, {'cursor': data['cursor']})
+        data = json.loads(response.content.decode())
+        self.assertEqual([c['id'] for c in data['results']], [certs[2].pk])
+        self.assertFalse(data['more'])
+        response = self.client.get(url, {'cursor': 'wrong'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,111 @@
+from datetime import timedelta
+
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils import timezone
+from OpenSSL import crypto
+
+from .. import settings as app_settings
+from ..batch import issue_certs
+from ..models import Ca, Cert
+from ..models.cert import CertQuerySet
+
+
+class RacingQuerySet(CertQuerySet):
+    def valid(self):
+        return self.none()
+
+
+class TestIdempotency(TestCase):
+    """
+    tests for Cert.objects.get_or_issue and idempotency keys in batches
+    """
+    def _create_ca(self):
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        return ca
+
+    def test_get_or_issue(self):
+        ca = self._create_ca()
+        cert, issued = Cert.objects.get_or_issue(ca, 'device1', common_name='device1', key_length='1024')
+        self.assertTrue(issued)
+        self.assertEqual(cert.name, 'device1')
+        self.assertEqual(cert.idempotency_key, 'device1')
+        cert._verify_ca()
+        # retries don't generate new certificates
+        with self.assertNumQueries(1):
+            retry, issued = Cert.objects.get_or_issue(ca, 'device1', common_name='other')
+        self.assertFalse(issued)
+        self.assertEqual(retry, cert)
+        self.assertEqual(retry.common_name, 'device1')
+        # keys are unique per CA
+        other, issued = Cert.objects.get_or_issue(self._create_ca(), 'device1',
+                                                  common_name='device1', key_length='1024')
+        self.assertTrue(issued)
+        self.assertEqual(Cert.objects.count(), 2)
+
+    def test_invalid_existing(self):
+        ca = self._create_ca()
+        revoked, issued = Cert.objects.get_or_issue(ca, 'key', common_name='revoked', key_length='1024')
+        revoked.revoke()
+        cert, issued = Cert.objects.get_or_issue(ca, 'key', common_name='cert', key_length='1024')
+        self.assertTrue(issued)
+        self.assertNotEqual(cert, revoked)
+        revoked.refresh_from_db()
+        self.assertIsNone(revoked.idempotency_key)
+        Cert.objects.filter(pk=cert.pk).update(validity_end=timezone.now() - timedelta(days=1))
+        self.assertTrue(Cert.objects.get_or_issue(ca, 'key', common_name='new', key_length='1024')[1])
+
+    def test_csr(self):
+        ca = self._create_ca()
+        key = crypto.PKey()
+        key.generate_key(crypto.TYPE_RSA, 1024)
+        request = crypto.X509Req()
+        request.get_subject().commonName = 'csr.org'
+        request.set_pubkey(key)
+        request.sign(key, 'sha256')
+        csr = crypto.dump_certificate_request(crypto.FILETYPE_PEM, request).decode()
+        cert, issued = Cert.objects.get_or_issue(ca, 'csr', csr=csr)
+        self.assertTrue(issued)
+        self.assertEqual(cert.name, 'csr.org')
+        self.assertFalse(cert.private_key)
+        self.assertEqual(Cert.objects.get_or_issue(ca, 'csr', csr=csr), (cert, False))
+
+    def test_async(self):
+        ca = self._create_ca()
+        setattr(app_settings, 'ASYNC_ISSUANCE', True)
+        try:
+            cert, issued = Cert.objects.get_or_issue(ca, 'key', common_name='cert', key_length='1024')
+            # pending certificates are returned to retries
+            self.assertEqual(Cert.objects.get_or_issue(ca, 'key', common_name='cert'), (cert, False))
+        finally:
+            setattr(app_settings, 'ASYNC_ISSUANCE', False)
+        self.assertEqual(cert.status, 'pending')
+
+    def test_concurrent(self):
+        ca = self._create_ca()
+        winner, issued = Cert.objects.get_or_issue(ca, 'key', common_name='winner', key_length='1024')
+        cert = Cert(ca=ca, idempotency_key='key', name='cert', common_name='cert', key_length='1024')
+        # the certificate of a concurrent call is committed after the lookup
+        existing, issued = RacingQuerySet(Cert)._get_or_save(cert, cert.save)
+        self.assertFalse(issued)
+        self.assertEqual(existing, winner)
+        self.assertEqual(Cert.objects.get().idempotency_key, 'key')
+        # duplicates of other unique fields are not hidden
+        cert = Cert(ca=ca, idempotency_key='other', name='cert', common_name='cert',
+                    key_length='1024', serial_number=winner.serial_number)
+        with self.assertRaises(IntegrityError):
+            Cert.objects.all()._get_or_save(cert, cert.save)
+
+    def test_batch(self):
+        ca = self._create_ca()
+        items = [{'common_name': 'device1', 'key_length': '1024', 'idempotency_key': 'device1'},
+                 {'common_name': 'device2', 'key_length': '1024'},
+                 {'common_name': 'device3', 'key_length': '1024', 'idempotency_key': 'x' * 65}]
+        results = issue_certs(ca, items)
+        self.assertIn('idempotency_key', results[2]['errors'])
+        retry = issue_certs(ca, items[:2])
+        self.assertEqual(retry[0]['id'], results[0]['id'])
+        self.assertEqual(retry[0]['private_key'], results[0]['private_key'])
+        self.assertNotEqual(retry[1]['id'], results[1]['id'])
+        self.assertEqual(Cert.objects.count(), 3)
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+from unittest import skipIf
+
+from django.test import SimpleTestCase
+
+# modules which must not be loaded when django starts
+HEAVY_MODULES = ('OpenSSL', 'cryptography')
+
+SETUP_SCRIPT = 'import django; django.setup()'
+
+
+class TestImports(SimpleTestCase):
+    """
+    ensures django startup (including admin autodiscovery)
+    does not load the crypto libraries
+    """
+    def _run(self, code, *options):
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        process = subprocess.Popen([sys.executable] + list(options) + ['-c', code],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   env=env)
+        stdout, stderr = process.communicate()
+        self.assertEqual(process.returncode, 0, stderr)
+        return stdout.decode(), stderr.decode()
+
+    def test_crypto_not_imported(self):
+        code = '{0}; import json, sys; print(json.dumps(sorted(sys.modules)))'.format(SETUP_SCRIPT)
+        stdout, stderr = self._run(code)
+        loaded = [name for name in json.loads(stdout)
+                  if name.split('.')[0] in HEAVY_MODULES]
+        self.assertEqual(loaded, [])
+
+    def test_crypto_imported_on_first_use(self):
+        code = ('{0}; import sys; from django_x509.models import Ca; '
+                'Ca(certificate="").x509; print("OpenSSL" in sys.modules); '
+                'Ca(key_length="512", serial_number=1)._generate(); '
+                'print("OpenSSL" in sys.modules)').format(SETUP_SCRIPT)
+        stdout, stderr = self._run(code)
+        self.assertEqual(stdout.split(), ['False', 'True'])
+
+    @skipIf(sys.version_info < (3, 7), '-X importtime requires python >= 3.7')
+    def test_importtime(self):
+        stdout, stderr = self._run(SETUP_SCRIPT, '-X', 'importtime')
+        imported = []
+        for line in stderr.splitlines():
+            # format: "import time: <self us> | <cumulative us> | <indented module name>"
+            if not line.startswith('import time:') or line.endswith('imported package'):
+                continue
+            imported.append(line.split('|')[-1].strip())
+        self.assertIn('django_x509.models.base', imported)
+        heavy = [name for name in imported if name.split('.')[0] in HEAVY_MODULES]
+        self.assertEqual(heavy, [])
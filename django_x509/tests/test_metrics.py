@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from .. import metrics
+from .. import settings as app_settings
+from ..models import Ca, Cert
+
+
+class TestMetrics(TestCase):
+    """
+    tests for django_x509.metrics
+    """
+    def setUp(self):
+        metrics.reset()
+        setattr(app_settings, 'METRICS_ENABLED', True)
+
+    def tearDown(self):
+        setattr(app_settings, 'METRICS_ENABLED', False)
+        metrics.reset()
+
+    def _create_ca(self):
+        ca = Ca(name='newcert', key_length='1024', digest='sha256', common_name='openwisp.org')
+        ca.full_clean()
+        ca.save()
+        return ca
+
+    def test_disabled(self):
+        setattr(app_settings, 'METRICS_ENABLED', False)
+        self._create_ca()
+        self.assertEqual(metrics.keygen_seconds.count(model='ca', key_length='1024'), 0)
+        self.assertEqual(metrics.issued_total.value(model='ca'), 0)
+        with metrics.sign_seconds.time(model='ca', digest='sha256'):
+            pass
+        self.assertEqual(metrics.sign_seconds.count(model='ca', digest='sha256'), 0)
+
+    def test_generate(self):
+        ca = self._create_ca()
+        cert = Cert(name='cert', ca=ca, key_length='1024', digest='sha1', common_name='cert')
+        cert.save()
+        self.assertEqual(metrics.keygen_seconds.count(model='ca', key_length='1024'), 1)
+        self.assertEqual(metrics.sign_seconds.count(model='ca', digest='sha256'), 1)
+        self.assertEqual(metrics.keygen_seconds.count(model='cert', key_length='1024'), 1)
+        self.assertEqual(metrics.sign_seconds.count(model='cert', digest='sha1'), 1)
+        self.assertEqual(metrics.issued_total.value(model='ca'), 1)
+        self.assertEqual(metrics.issued_total.value(model='cert'), 1)
+        self.assertGreater(metrics.keygen_seconds.sum(model='ca', key_length='1024'), 0)
+
+    def test_import_and_verify(self):
+        ca = self._create_ca()
+        cert = Cert(name='cert', ca=ca, common_name='cert', key_length='1024')
+        cert.save()
+        imported = Cert(ca=ca, certificate=cert.certificate, private_key=cert.private_key)
+        imported._import()
+        self.assertEqual(metrics.import_seconds.count(model='cert'), 1)
+        self.assertEqual(metrics.verify_ca_seconds.count(model='cert'), 1)
+
+    def test_crl(self):
+        ca = self._create_ca()
+        ca.crl
+        ca.crl
+        self.assertEqual(metrics.crl_generated_total.value(ca=ca.pk), 2)
+        self.assertEqual(metrics.crl_generation_seconds.count(ca=ca.pk), 2)
+        self.client.get(reverse('x509:crl', args=[ca.pk]))
+        self.assertEqual(metrics.crl_requests_total.value(ca=ca.pk, status=200), 1)
+        self.assertEqual(metrics.crl_view_seconds.count(ca=ca.pk), 1)
+        # unknown CAs don't create new series
+        for pk in (123456, 'wrong'):
+            response = self.client.get('/x509/ca/{0}.crl'.format(pk))
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(metrics.crl_requests_total.value(ca='unknown', status=404), 2)
+        self.assertEqual(metrics.crl_view_seconds.count(ca='unknown'), 2)
+        self.assertEqual(metrics.crl_view_seconds.count(ca=123456), 0)
+
+    def test_percentile(self):
+        histogram = metrics.Histogram('test_percentile_seconds', 'test', buckets=(1, 2, float('inf')))
+        self.assertIsNone(histogram.percentile(0.5))
+        for value in (0.5, 1.5, 1.5, 1.5):
+            histogram.observe(value)
+        self.assertEqual(histogram.percentile(0.25), 1)
+        self.assertEqual(histogram.percentile(1), 2)
+        del metrics.REGISTRY['test_percentile_seconds']
+
+    def test_render(self):
+        ca = self._create_ca()
+        ca.crl
+        text = metrics.render()
+        self.assertIn('# TYPE django_x509_crl_generated_total counter', text)
+        self.assertIn('django_x509_crl_generated_total{{ca="{0}"}} 1'.format(ca.pk), text)
+        self.assertIn('django_x509_keygen_seconds_bucket{model="ca",key_length="1024",le="+Inf"} 1', text)
+        self.assertIn('django_x509_keygen_seconds_count{model="ca",key_length="1024"} 1', text)
+
+    def test_metrics_view(self):
+        self._create_ca()
+        response = self.client.get(reverse('x509:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('django_x509_keygen_seconds_count', response.content.decode())
+
+    def test_metrics_view_disabled(self):
+        setattr(app_settings, 'METRICS_ENABLED', False)
+        response = self.client.get(reverse('x509:metrics'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_metrics_view_403(self):
+        setattr(app_settings, 'METRICS_PROTECTED', True)
+        response = self.client.get(reverse('x509:metrics'))
+        self.assertEqual(response.status_code, 403)
+        get_user_model().objects.create_superuser('admin', 'admin@test.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.get(reverse('x509:metrics'))
+        self.assertEqual(response.status_code, 200)
+        setattr(app_settings, 'METRICS_PROTECTED', False)
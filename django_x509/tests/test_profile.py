@@ -0,0 +1,112 @@
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from .. import settings as app_settings
+from ..backends import get_backend
+from ..models import Ca, Cert, CertProfile
+from ..models.profile import _compiled
+
+CRYPTOGRAPHY_BACKEND = 'django_x509.backends.cryptography.CryptographyBackend'
+PYOPENSSL_BACKEND = 'django_x509.backends.pyopenssl.PyOpenSSLBackend'
+
+
+class TestCertProfile(TestCase):
+    """
+    tests for CertProfile model
+    """
+    def setUp(self):
+        _compiled.clear()
+
+    def _create_ca(self):
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        return ca
+
+    def _create_profile(self, **kwargs):
+        options = dict(name='devices',
+                       key_length='1024',
+                       digest='sha256',
+                       validity=30,
+                       organization='OpenWISP',
+                       extensions=[{'name': 'extendedKeyUsage',
+                                    'critical': False,
+                                    'value': 'clientAuth'}])
+        options.update(kwargs)
+        profile = CertProfile(**options)
+        profile.full_clean()
+        profile.save()
+        return profile
+
+    def test_issue(self):
+        ca = self._create_ca()
+        profile = self._create_profile()
+        cert = profile.issue(ca, 'device1')
+        cert = Cert.objects.get(pk=cert.pk)
+        self.assertEqual(cert.profile, profile)
+        self.assertEqual(cert.organization, 'OpenWISP')
+        self.assertEqual(cert.key_length, '1024')
+        self.assertEqual((cert.validity_end - cert.validity_start).days, 30)
+        self.assertEqual(cert.extensions, profile.extensions)
+        x509 = cert.x509
+        self.assertEqual(x509.get_subject().commonName, 'device1')
+        self.assertEqual(x509.get_extension_count(), 5)
+        e = x509.get_extension(4)
+        self.assertEqual(e.get_short_name(), b'extendedKeyUsage')
+        self.assertEqual(e.get_data(), b'0\n\x06\x08+\x06\x01\x05\x05\x07\x03\x02')
+        cert._verify_ca()
+
+    def test_issue_override(self):
+        ca = self._create_ca()
+        profile = self._create_profile()
+        cert = profile.issue(ca, 'device1', organization='Other', extensions=[])
+        self.assertEqual(cert.organization, 'Other')
+        self.assertEqual(cert.x509.get_extension_count(), 4)
+
+    def test_compiled_cache(self):
+        profile = self._create_profile()
+        compiled = profile.get_compiled()
+        self.assertIs(CertProfile.objects.get(pk=profile.pk).get_compiled(), compiled)
+        native = compiled.get_native(get_backend())
+        self.assertIs(compiled.get_native(get_backend()), native)
+        # issuing many certificates does not compile the profile again
+        ca = self._create_ca()
+        for i in range(3):
+            profile.issue(ca, 'device{0}'.format(i))
+        self.assertIs(profile.get_compiled(), compiled)
+        self.assertIs(compiled.get_native(get_backend()), native)
+
+    def test_compiled_invalidation(self):
+        profile = self._create_profile()
+        compiled = profile.get_compiled()
+        profile.extensions = []
+        profile.save()
+        self.assertIsNot(profile.get_compiled(), compiled)
+        self.assertEqual(profile.get_compiled().extra_extensions, ())
+        # changes made by other processes
+        stale = profile.get_compiled()
+        CertProfile.objects.filter(pk=profile.pk).update(modified=profile.created)
+        self.assertIsNot(CertProfile.objects.get(pk=profile.pk).get_compiled(), stale)
+
+    def test_cryptography_backend(self):
+        ca = self._create_ca()
+        profile = self._create_profile()
+        setattr(app_settings, 'CRYPTO_BACKEND', CRYPTOGRAPHY_BACKEND)
+        try:
+            cert = profile.issue(ca, 'device1')
+        finally:
+            setattr(app_settings, 'CRYPTO_BACKEND', PYOPENSSL_BACKEND)
+        cert = Cert.objects.get(pk=cert.pk)
+        self.assertEqual(cert.x509.get_extension(4).get_short_name(), b'extendedKeyUsage')
+        self.assertEqual(len(profile.get_compiled()._native), 1)
+
+    def test_invalid_extensions(self):
+        with self.assertRaises(ValidationError):
+            self._create_profile(extensions={})
+        try:
+            self._create_profile(extensions=[{'name': 'keyUsage',
+                                              'critical': False,
+                                              'value': 'wrong'}])
+        except ValidationError as e:
+            self.assertIn('Invalid extension', e.message_dict['extensions'][0])
+        else:
+            self.fail('ValidationError not raised')
@@ -0,0 +1,144 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from .. import settings as app_settings
+from ..batch import issue_certs
+from ..models import Ca, Cert, Job
+from ..ratelimit import RateLimitExceeded, acquire, get_stats
+
+
+class TestRateLimit(TestCase):
+    """
+    tests for django_x509.ratelimit
+    """
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        setattr(app_settings, 'RATE_LIMITS', {})
+        setattr(app_settings, 'RATE_LIMIT_MAX_WAIT', 0)
+        setattr(app_settings, 'ASYNC_ISSUANCE', False)
+        cache.clear()
+
+    def _create_ca(self, name='ca'):
+        ca = Ca(name=name, key_length='1024', common_name=name)
+        ca.save()
+        return ca
+
+    def _create_cert(self, ca, name='cert'):
+        cert = Cert(name=name, ca=ca, key_length='1024', common_name=name)
+        cert.save()
+        return cert
+
+    def test_disabled(self):
+        acquire('issue')
+        self.assertEqual(get_stats(), {})
+        with self.assertRaises(ValueError):
+            acquire('wrong')
+
+    def test_global(self):
+        setattr(app_settings, 'RATE_LIMITS', {'issue': (0.001, 2)})
+        ca = self._create_ca()
+        self._create_cert(ca)
+        with self.assertRaises(RateLimitExceeded) as context:
+            self._create_cert(ca, 'cert2')
+        self.assertEqual(context.exception.scope, 'issue')
+        self.assertGreater(context.exception.retry_after, 900)
+        # nothing is saved
+        self.assertEqual(Cert.objects.count(), 1)
+        stats = get_stats()
+        self.assertEqual(list(stats.keys()), ['issue'])
+        self.assertLess(stats['issue']['tokens'], 0.01)
+        self.assertEqual(stats['issue']['rejected'], 1)
+
+    def test_per_ca(self):
+        ca1 = self._create_ca('ca1')
+        ca2 = self._create_ca('ca2')
+        setattr(app_settings, 'RATE_LIMITS', {'issue:ca': (0.001, 1),
+                                              'issue:ca:{0}'.format(ca2.pk): (0.001, 3)})
+        self._create_cert(ca1)
+        with self.assertRaises(RateLimitExceeded) as context:
+            self._create_cert(ca1)
+        self.assertEqual(context.exception.scope, 'issue:ca:{0}'.format(ca1.pk))
+        self._create_cert(ca2)
+        self._create_cert(ca2)
+        self.assertEqual(get_stats(ca1)['issue:ca:{0}'.format(ca1.pk)]['rejected'], 1)
+        self.assertEqual(get_stats(ca2)['issue:ca:{0}'.format(ca2.pk)]['burst'], 3)
+        # the default limit of each CA can be disabled
+        app_settings.RATE_LIMITS['issue:ca:{0}'.format(ca1.pk)] = None
+        self._create_cert(ca1)
+
+    def test_refund(self):
+        ca = self._create_ca()
+        setattr(app_settings, 'RATE_LIMITS', {'issue': (0.001, 1), 'issue:ca': (0.001, 5)})
+        self._create_cert(ca)
+        with self.assertRaises(RateLimitExceeded):
+            self._create_cert(ca)
+        scope = 'issue:ca:{0}'.format(ca.pk)
+        self.assertAlmostEqual(get_stats(ca)[scope]['tokens'], 4, places=1)
+
+    def test_wait(self):
+        setattr(app_settings, 'RATE_LIMITS', {'issue': (20, 1)})
+        setattr(app_settings, 'RATE_LIMIT_MAX_WAIT', 1)
+        for i in range(3):
+            acquire('issue')
+        stats = get_stats()['issue']
+        self.assertEqual(stats['waiting'], 0)
+        self.assertEqual(stats['rejected'], 0)
+
+    def test_crl(self):
+        ca = self._create_ca()
+        setattr(app_settings, 'RATE_LIMITS', {'crl:ca': (0.001, 1)})
+        crl = ca.get_cached_crl()
+        ca.invalidate_crl()
+        ca = Ca.objects.get(pk=ca.pk)
+        # the previous version is returned
+        self.assertEqual(ca.get_cached_crl(), crl)
+        cache.delete('django_x509:crl:{0}'.format(ca.pk))
+        with self.assertRaises(RateLimitExceeded):
+            ca.get_cached_crl()
+        response = self.client.get(reverse('x509:crl', args=[ca.pk]))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 900)
+
+    def test_batch(self):
+        ca = self._create_ca()
+        setattr(app_settings, 'RATE_LIMITS', {'issue:ca': (0.001, 1)})
+        results = issue_certs(ca, [{'common_name': 'device1', 'key_length': '1024'},
+                                   {'common_name': 'device2', 'key_length': '1024'}])
+        self.assertIn('id', results[0])
+        self.assertIn('__all__', results[1]['errors'])
+        self.assertGreater(results[1]['retry_after'], 900)
+        self.assertEqual(Cert.objects.count(), 1)
+
+    def test_worker(self):
+        ca = self._create_ca()
+        setattr(app_settings, 'ASYNC_ISSUANCE', True)
+        setattr(app_settings, 'RATE_LIMITS', {'issue:ca': (0.001, 1)})
+        self._create_cert(ca)
+        self._create_cert(ca, 'cert2')
+        call_command('x509_worker', once=True, stdout=StringIO())
+        self.assertEqual(Cert.objects.filter(status='issued').count(), 1)
+        job = Job.objects.get(state='queued')
+        self.assertIn('rate limit', job.error)
+        self.assertEqual(job.attempts, 0)
+
+    def test_view(self):
+        ca = self._create_ca()
+        setattr(app_settings, 'RATE_LIMITS', {'issue': (10, 20), 'crl:ca': (1, 5)})
+        url = reverse('x509:rate_limits')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        get_user_model().objects.create_superuser('admin', 'admin@test.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.get(url, {'ca': ca.pk})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode())
+        self.assertEqual(sorted(data['limits'].keys()),
+                         ['crl:ca:{0}'.format(ca.pk), 'issue'])
+        self.assertEqual(data['jobs'], {'queued': 0, 'running': 0})
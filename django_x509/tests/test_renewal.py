@@ -0,0 +1,139 @@
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.six import StringIO
+from OpenSSL import crypto
+
+from .. import settings as app_settings
+from ..backends import get_backend
+from ..batch import issue_certs
+from ..models import Ca, Cert
+from ..renewal import renew_certs
+
+CRYPTOGRAPHY_BACKEND = 'django_x509.backends.cryptography.CryptographyBackend'
+PYOPENSSL_BACKEND = 'django_x509.backends.pyopenssl.PyOpenSSLBackend'
+
+
+class TestRenewal(TestCase):
+    """
+    tests for Cert.renew and django_x509.renewal
+    """
+    def _create_ca(self):
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        return ca
+
+    def _create_cert(self, ca, name='cert'):
+        cert = Cert(name=name, ca=ca, key_length='1024', common_name=name,
+                    organization='OpenWISP', extensions=[{'name': 'nsComment',
+                                                          'critical': False,
+                                                          'value': 'renewal test'}])
+        cert.save()
+        return cert
+
+    def _pubkey(self, cert):
+        return crypto.dump_publickey(crypto.FILETYPE_PEM, cert.x509.get_pubkey())
+
+    def _test_renew(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        successor = cert.renew()
+        self.assertEqual(successor.predecessor, cert)
+        self.assertEqual(list(cert.successors.all()), [successor])
+        self.assertNotEqual(successor.serial_number, cert.serial_number)
+        self.assertEqual(successor.serial_number, cert.serial_number + 1)
+        self.assertEqual(force_text(successor.private_key), force_text(cert.private_key))
+        self.assertEqual(self._pubkey(successor), self._pubkey(cert))
+        self.assertEqual(successor.x509.get_subject().organizationName, 'OpenWISP')
+        self.assertEqual(successor.extensions, cert.extensions)
+        self.assertEqual(successor.validity_end - successor.validity_start,
+                         cert.validity_end - cert.validity_start)
+        successor._verify_ca()
+        self.assertTrue(get_backend().key_matches(successor))
+
+    def test_renew(self):
+        self._test_renew()
+
+    def test_renew_cryptography(self):
+        setattr(app_settings, 'CRYPTO_BACKEND', CRYPTOGRAPHY_BACKEND)
+        try:
+            self._test_renew()
+        finally:
+            setattr(app_settings, 'CRYPTO_BACKEND', PYOPENSSL_BACKEND)
+
+    def test_new_key(self):
+        cert = self._create_cert(self._create_ca())
+        successor = cert.renew(reuse_key=False, validity=10)
+        self.assertNotEqual(force_text(successor.private_key), force_text(cert.private_key))
+        self.assertNotEqual(self._pubkey(successor), self._pubkey(cert))
+        self.assertEqual(successor.validity_end - successor.validity_start, timedelta(days=10))
+
+    def test_unknown_key(self):
+        ca = self._create_ca()
+        key = crypto.PKey()
+        key.generate_key(crypto.TYPE_RSA, 1024)
+        request = crypto.X509Req()
+        request.get_subject().commonName = 'csr.org'
+        request.set_pubkey(key)
+        request.sign(key, 'sha256')
+        csr = crypto.dump_certificate_request(crypto.FILETYPE_PEM, request).decode()
+        cert = Cert.objects.get(pk=issue_certs(ca, [{'csr': csr}])[0]['id'])
+        # the public key of the request is reused
+        successor = cert.renew()
+        self.assertFalse(successor.private_key)
+        self.assertEqual(self._pubkey(successor), self._pubkey(cert))
+        successor._verify_ca()
+        self.assertTrue(cert.renew(reuse_key=False).private_key)
+        # the key of self-signed CAs is needed
+        Ca.objects.filter(pk=ca.pk).update(private_key='')
+        with self.assertRaises(ValueError):
+            Ca.objects.get(pk=ca.pk).renew(reuse_key=True)
+
+    def test_async(self):
+        cert = self._create_cert(self._create_ca())
+        setattr(app_settings, 'ASYNC_ISSUANCE', True)
+        try:
+            successor = cert.renew()
+        finally:
+            setattr(app_settings, 'ASYNC_ISSUANCE', False)
+        # keys are reused, hence renewals are signed right away
+        self.assertEqual(successor.status, 'issued')
+        self.assertTrue(successor.certificate)
+
+    def test_queryset(self):
+        ca = self._create_ca()
+        certs = [self._create_cert(ca, 'cert{0}'.format(i)) for i in range(4)]
+        Cert.objects.filter(pk=certs[2].pk).update(private_key='', certificate='invalid')
+        # failed certificates are skipped
+        Cert.objects.filter(pk=certs[3].pk).update(status='failed')
+        report = Cert.objects.filter(pk__in=[c.pk for c in certs]).renew(chunk_size=2)
+        self.assertEqual(report['renewed'], 2)
+        self.assertEqual(report['failed'], 1)
+        self.assertEqual(report['failures'][0][0], certs[2].pk)
+        for cert in certs[:2]:
+            successor = Cert.objects.get(pk=report['successors'][cert.pk])
+            self.assertEqual(successor.predecessor_id, cert.pk)
+            self.assertEqual(force_text(successor.private_key), force_text(cert.private_key))
+        self.assertEqual(Cert.objects.count(), 6)
+
+    def test_command(self):
+        ca = self._create_ca()
+        for i in range(2):
+            self._create_cert(ca, 'cert{0}'.format(i))
+        out = StringIO()
+        call_command('renew_certs', processes=1, stdout=out)
+        self.assertIn('Renewed 2 certificates', out.getvalue())
+        self.assertEqual(Cert.objects.filter(predecessor__isnull=False).count(), 2)
+        call_command('renew_certs', processes=1, expiring=1, stdout=out)
+        self.assertEqual(Cert.objects.count(), 4)
+        # successors of a previous run are not renewed again
+        call_command('renew_certs', processes=1, stdout=out)
+        self.assertEqual(Cert.objects.count(), 4)
+        # until their predecessors expire
+        Cert.objects.filter(predecessor__isnull=True).update(validity_end=timezone.now())
+        call_command('renew_certs', processes=1, stdout=out)
+        self.assertEqual(Cert.objects.count(), 6)
+        self.assertEqual(renew_certs(Cert.objects.none())['renewed'], 0)
@@ -0,0 +1,107 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.db import OperationalError
+from django.test import TestCase
+from django.utils import timezone
+from OpenSSL import crypto
+
+from ..models import Ca, Cert, Revocation
+
+
+class TestRevocation(TestCase):
+    """
+    tests for the Revocation ledger
+    """
+    def _create_ca(self):
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        return ca
+
+    def _create_cert(self, ca, name='cert', **kwargs):
+        cert = Cert(name=name, ca=ca, key_length='1024', common_name=name, **kwargs)
+        cert.save()
+        return cert
+
+    def _crl_serials(self, ca):
+        crl = crypto.load_crl(crypto.FILETYPE_PEM, ca.crl)
+        return sorted(int(entry.get_serial(), 16) for entry in crl.get_revoked() or [])
+
+    def test_revoke(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        cert.revoke(reason='keyCompromise')
+        entry = Revocation.objects.get()
+        self.assertEqual(entry.ca, ca)
+        self.assertEqual(entry.serial_number, cert.serial_number)
+        self.assertEqual(entry.revoked_at, cert.revoked_at)
+        self.assertEqual(entry.reason, 'keyCompromise')
+        self.assertEqual(entry.validity_end, cert.validity_end)
+        # the columns of the certificate are kept in sync
+        cert.refresh_from_db()
+        self.assertTrue(cert.revoked)
+        # revoking again doesn't append another entry
+        cert.revoke()
+        self.assertEqual(Revocation.objects.count(), 1)
+        with self.assertRaises(ValueError):
+            self._create_cert(ca, 'other').revoke(reason='wrong')
+        self.assertEqual(Revocation.objects.count(), 1)
+
+    def test_revoke_atomic(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+
+        def update_revoked_filter(*serial_numbers):
+            raise OperationalError('database is locked')
+
+        cert.ca.update_revoked_filter = update_revoked_filter
+        with self.assertRaises(OperationalError):
+            cert.revoke()
+        self.assertFalse(Cert.objects.get(pk=cert.pk).revoked)
+        self.assertEqual(Revocation.objects.count(), 0)
+        self.assertEqual(Ca.objects.get(pk=ca.pk).crl_version, ca.crl_version)
+
+    def test_crl(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        cert.revoke(reason='superseded')
+        now = timezone.now()
+        expired = self._create_cert(ca, 'expired', validity_start=now - timedelta(days=20),
+                                    validity_end=now - timedelta(days=10))
+        expired.revoke()
+        self.assertEqual(self._crl_serials(ca), [cert.serial_number])
+        self.assertEqual(ca.get_revocations().count(), 1)
+        crl = crypto.load_crl(crypto.FILETYPE_PEM, ca.crl)
+        self.assertEqual(crl.get_revoked()[0].get_reason(), b'Superseded')
+        # the rows of the certificates are not read
+        Cert.objects.all().delete()
+        self.assertEqual(self._crl_serials(ca), [cert.serial_number])
+        self.assertIn(cert.serial_number, ca.build_revoked_filter())
+
+    def test_since(self):
+        ca = self._create_ca()
+        first, second = self._create_cert(ca, 'first'), self._create_cert(ca, 'second')
+        first.revoke()
+        sequence = Revocation.objects.get().sequence
+        second.revoke()
+        self.assertEqual([entry.serial_number for entry in Revocation.objects.since(sequence)],
+                         [second.serial_number])
+
+    def test_counts(self):
+        ca, other = self._create_ca(), self._create_ca()
+        Ca.objects.filter(pk=other.pk).update(last_serial=100)
+        self._create_cert(ca, 'first').revoke()
+        self._create_cert(ca, 'second').revoke()
+        self._create_cert(other).revoke()
+        self._create_cert(self._create_ca())
+        self.assertEqual(Revocation.objects.counts(), {ca.pk: 2, other.pk: 1})
+        # the CA changelist reads the counts from the ledger
+        Cert.objects.filter(ca=ca).delete()
+        get_user_model().objects.create_superuser('admin', 'admin@test.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.get(reverse('admin:django_x509_ca_changelist'))
+        counts = dict((c.pk, c.revoked_count) for c in response.context['cl'].result_list)
+        self.assertEqual(counts[ca.pk], 2)
+        self.assertEqual(counts[other.pk], 1)
+        self.assertEqual(len(counts), 3)
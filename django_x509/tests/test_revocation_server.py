@@ -0,0 +1,241 @@
+import base64
+import threading
+from datetime import timedelta
+from unittest import skipIf
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509 import ocsp
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
+from django.test import TestCase
+from django.utils import six
+from django.utils.six.moves.urllib.request import urlopen
+from django.utils.timezone import utc
+from OpenSSL import crypto
+
+from .. import settings as app_settings
+from ..backends.cryptography import load_certificate
+from ..models import Ca, Cert, Revocation
+
+try:
+    import asyncio
+    from ..revocation_server import (MODIFIED_OVERLAP, NOT_FOUND, OCSP_MALFORMED, OCSP_UNAUTHORIZED,
+                                     RevocationProtocol, RevocationServer, Snapshot)
+except ImportError:  # pragma: no cover
+    asyncio = None
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.data = b''
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        self.closed = True
+
+
+@skipIf(six.PY2, 'requires python >= 3.4')
+class TestRevocationServer(TestCase):
+    """
+    tests for django_x509.revocation_server
+    """
+    def _create_ca(self, name='ca'):
+        ca = Ca(name=name, key_length='1024', common_name=name)
+        ca.save()
+        return ca
+
+    def _create_cert(self, ca, name='cert'):
+        cert = Cert(name=name, ca=ca, key_length='1024', common_name=name)
+        cert.save()
+        return cert
+
+    def _ocsp_request(self, cert, ca, algorithm=None):
+        request = ocsp.OCSPRequestBuilder().add_certificate(
+            load_certificate(cert.certificate),
+            load_certificate(ca.certificate),
+            algorithm or hashes.SHA1()
+        ).build()
+        return request.public_bytes(serialization.Encoding.DER)
+
+    def _body(self, response):
+        return response.split(b'\r\n\r\n', 1)[1]
+
+    def _ocsp_status(self, response):
+        return ocsp.load_der_ocsp_response(self._body(response))
+
+    def test_refresh(self):
+        ca = self._create_ca()
+        cert1 = self._create_cert(ca, 'cert1')
+        cert2 = self._create_cert(ca, 'cert2')
+        snapshot = Snapshot()
+        self.assertEqual(snapshot.refresh(), (1, 2))
+        crl = crypto.load_crl(crypto.FILETYPE_PEM, self._body(snapshot.get_crl(str(ca.pk))))
+        self.assertIsNone(crl.get_revoked())
+        response = self._ocsp_status(snapshot.get_ocsp(self._ocsp_request(cert1, ca)))
+        self.assertEqual(response.response_status, ocsp.OCSPResponseStatus.SUCCESSFUL)
+        self.assertEqual(response.certificate_status, ocsp.OCSPCertStatus.GOOD)
+        self.assertEqual(response.serial_number, cert1.serial_number)
+        # only rows modified since the last refresh are processed
+        # (the time window is overlapped by MODIFIED_OVERLAP)
+        for model in (Ca, Cert):
+            model.objects.update(modified=F('modified') - MODIFIED_OVERLAP * 2)
+        self.assertEqual(snapshot.refresh(), (1, 0))
+        cert2.revoke()
+        self.assertEqual(snapshot.refresh(), (1, 1))
+        response = self._ocsp_status(snapshot.get_ocsp(self._ocsp_request(cert2, ca)))
+        self.assertEqual(response.certificate_status, ocsp.OCSPCertStatus.REVOKED)
+        crl = crypto.load_crl(crypto.FILETYPE_PEM, self._body(snapshot.get_crl(str(ca.pk))))
+        self.assertEqual(len(crl.get_revoked()), 1)
+
+    def test_refresh_ledger(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        other = self._create_cert(ca, 'other')
+        snapshot = Snapshot()
+        snapshot.refresh()
+        crl = snapshot.get_crl(str(ca.pk))
+        cert.revoke(reason='keyCompromise')
+        # CRLs are re-rendered when entries are appended to the ledger,
+        # regardless of the revocation time
+        Revocation.objects.update(revoked_at=F('revoked_at') - timedelta(days=1))
+        snapshot.refresh()
+        self.assertEqual(snapshot.sequence, Revocation.objects.get().sequence)
+        self.assertNotEqual(snapshot.get_crl(str(ca.pk)), crl)
+        crl = snapshot.get_crl(str(ca.pk))
+        # certificates updated without entries don't change the CRL
+        Cert.objects.filter(pk=other.pk).update(revoked=True)
+        snapshot.refresh()
+        self.assertEqual(snapshot.get_crl(str(ca.pk)), crl)
+        # OCSP responses carry the revocation time and reason of the ledger
+        entry = Revocation.objects.get()
+        response = self._ocsp_status(snapshot.get_ocsp(self._ocsp_request(cert, ca)))
+        self.assertEqual(response.revocation_reason, x509.ReasonFlags.key_compromise)
+        self.assertEqual(response.revocation_time,
+                         entry.revoked_at.astimezone(utc).replace(tzinfo=None, microsecond=0))
+        response = self._ocsp_status(snapshot.get_ocsp(self._ocsp_request(other, ca)))
+        self.assertEqual(response.certificate_status, ocsp.OCSPCertStatus.REVOKED)
+        self.assertEqual(response.revocation_reason, x509.ReasonFlags.unspecified)
+
+    def test_refresh_expiring(self):
+        ca = self._create_ca()
+        self._create_cert(ca)
+        snapshot = Snapshot()
+        snapshot.refresh()
+        signed_at = snapshot._signed_at[ca.pk]
+        snapshot._signed_at[ca.pk] = signed_at - snapshot.validity
+        self.assertEqual(snapshot.refresh(), (1, 1))
+        self.assertGreater(snapshot._signed_at[ca.pk], signed_at)
+
+    def test_refresh_crl_expiring(self):
+        ca = self._create_ca()
+        self._create_cert(ca)
+        # OCSP responses valid longer than CRLs
+        snapshot = Snapshot(validity=timedelta(days=4))
+        snapshot.refresh()
+        stale_at = snapshot._crl_stale_at[ca.pk]
+        crl = crypto.load_crl(crypto.FILETYPE_PEM, self._body(snapshot.get_crl(str(ca.pk))))
+        self.assertEqual(stale_at - timedelta(hours=12),
+                         crl.to_cryptography().last_update)
+        signed_at = snapshot._signed_at[ca.pk]
+        for model in (Ca, Cert):
+            model.objects.update(modified=F('modified') - MODIFIED_OVERLAP * 2)
+        snapshot._crl_stale_at[ca.pk] -= timedelta(hours=13)
+        self.assertEqual(snapshot.refresh(), (1, 0))
+        # the CRL is re-rendered although OCSP responses are not stale
+        self.assertGreaterEqual(snapshot._crl_stale_at[ca.pk], stale_at)
+        self.assertEqual(snapshot._signed_at[ca.pk], signed_at)
+
+    def test_refresh_deleted(self):
+        ca1 = self._create_ca('ca1')
+        ca2 = self._create_ca('ca2')
+        cert1 = self._create_cert(ca1, 'cert1')
+        cert2 = self._create_cert(ca1, 'cert2')
+        snapshot = Snapshot()
+        snapshot.refresh()
+        ca2.delete()
+        cert2.delete()
+        snapshot._signed_at[ca1.pk] -= snapshot.validity
+        snapshot.refresh()
+        self.assertEqual(snapshot.get_crl(str(ca2.pk)), NOT_FOUND)
+        self.assertEqual(list(snapshot.responses), [(str(ca1.pk), cert1.serial_number)])
+        self.assertEqual(len(snapshot.issuers), 1)
+
+    def test_ocsp_errors(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        other_ca = self._create_ca('other')
+        Ca.objects.filter(pk=other_ca.pk).update(last_serial=100)
+        other = self._create_cert(other_ca)
+        snapshot = Snapshot()
+        snapshot.refresh()
+        self.assertEqual(snapshot.get_ocsp(b'garbage'), OCSP_MALFORMED)
+        Cert.objects.filter(pk=other.pk).update(ca=ca)
+        # issuer not matching
+        self.assertEqual(snapshot.get_ocsp(self._ocsp_request(other, ca)), OCSP_UNAUTHORIZED)
+        request = self._ocsp_request(cert, ca, hashes.SHA256())
+        self.assertEqual(snapshot.get_ocsp(request), OCSP_UNAUTHORIZED)
+
+    def test_protocol(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        snapshot = Snapshot()
+        snapshot.refresh()
+        protocol = RevocationProtocol(snapshot)
+        transport = FakeTransport()
+        protocol.connection_made(transport)
+        request = self._ocsp_request(cert, ca)
+        get = base64.b64encode(request).decode()
+        # pipelined requests sent in pieces
+        data = ('GET /x509/ca/{0}.crl HTTP/1.1\r\nHost: localhost\r\n\r\n'
+                'POST /x509/ocsp HTTP/1.1\r\nContent-Length: {1}\r\n\r\n').format(ca.pk, len(request))
+        data = data.encode() + request
+        data += 'GET /x509/ocsp/{0} HTTP/1.1\r\n\r\n'.format(get).encode()
+        data += b'GET /x509/ca/0.crl HTTP/1.1\r\n\r\n'
+        for i in range(0, len(data), 7):
+            protocol.data_received(data[i:i + 7])
+        expected = snapshot.get_crl(str(ca.pk)) + snapshot.get_ocsp(request) * 2 + NOT_FOUND
+        self.assertEqual(transport.data, expected)
+        self.assertFalse(transport.closed)
+        protocol.data_received(b'DELETE /x509/ocsp HTTP/1.0\r\n\r\n')
+        self.assertIn(b'405 Method Not Allowed', transport.data)
+        self.assertTrue(transport.closed)
+
+    def test_protocol_bad_request(self):
+        protocol = RevocationProtocol(Snapshot())
+        transport = FakeTransport()
+        protocol.connection_made(transport)
+        protocol.data_received(b'INVALID\r\n\r\n')
+        self.assertTrue(transport.data.startswith(b'HTTP/1.1 400 Bad Request'))
+        self.assertTrue(transport.closed)
+
+    def test_server(self):
+        ca = self._create_ca()
+        snapshot = Snapshot()
+        snapshot.refresh()
+        loop = asyncio.new_event_loop()
+        server = RevocationServer(snapshot, port=0, interval=3600, loop=loop)
+        port = server.start().sockets[0].getsockname()[1]
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            response = urlopen('http://127.0.0.1:{0}/x509/ca/{1}.crl'.format(port, ca.pk))
+            self.assertEqual(response.getheader('Content-Type'), 'application/x-pem-file')
+            self.assertIn(b'BEGIN X509 CRL', response.read())
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            server.stop()
+            loop.close()
+
+    def test_command_crl_protected(self):
+        setattr(app_settings, 'CRL_PROTECTED', True)
+        try:
+            with self.assertRaises(CommandError):
+                call_command('revocation_server')
+        finally:
+            setattr(app_settings, 'CRL_PROTECTED', False)
@@ -0,0 +1,159 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.six import StringIO
+from OpenSSL import crypto
+
+from .. import settings as app_settings
+from ..batch import issue_certs
+from ..models import Ca, Cert
+from ..rollover import get_pending, rollover_ca
+
+
+class TestRollover(TestCase):
+    """
+    tests for Ca.renew and django_x509.rollover
+    """
+    def _create_ca(self, **kwargs):
+        options = dict(name='ca', key_length='1024', common_name='ca', organization='OpenWISP')
+        options.update(kwargs)
+        ca = Ca(**options)
+        ca.save()
+        return ca
+
+    def _create_cert(self, ca, name='cert'):
+        cert = Cert(name=name, ca=ca, key_length='1024', common_name=name)
+        cert.save()
+        return cert
+
+    def test_ca_renew(self):
+        setattr(app_settings, 'CA_BASIC_CONSTRAINTS_PATHLEN', 1)
+        try:
+            root = self._create_ca(name='root', common_name='root')
+        finally:
+            setattr(app_settings, 'CA_BASIC_CONSTRAINTS_PATHLEN', 0)
+        ca = self._create_ca(parent=root)
+        successor = ca.renew()
+        self.assertEqual(successor.predecessor, ca)
+        self.assertEqual(list(ca.successors.all()), [successor])
+        self.assertEqual(successor.parent, root)
+        self.assertEqual(successor.x509.get_subject().organizationName, 'OpenWISP')
+        self.assertNotEqual(force_text(successor.private_key), force_text(ca.private_key))
+        self.assertEqual(successor.validity_end - successor.validity_start,
+                         ca.validity_end - ca.validity_start)
+        reused = ca.renew(reuse_key=True)
+        self.assertEqual(force_text(reused.private_key), force_text(ca.private_key))
+
+    def test_rollover(self):
+        ca = self._create_ca()
+        certs = [self._create_cert(ca, 'cert{0}'.format(i)) for i in range(3)]
+        revoked = self._create_cert(ca, 'revoked')
+        revoked.revoke()
+        expired = self._create_cert(ca, 'expired')
+        Cert.objects.filter(pk=expired.pk).update(validity_end=timezone.now() - timedelta(days=1))
+        calls = []
+        report = rollover_ca(ca, processes=1, chunk_size=2,
+                             progress=lambda done, total: calls.append((done, total)))
+        successor = report['ca']
+        self.assertEqual(successor.predecessor, ca)
+        self.assertEqual(report['renewed'], 3)
+        self.assertEqual(calls, [(2, 3), (3, 3)])
+        for cert in certs:
+            new = Cert.objects.get(pk=report['successors'][cert.pk])
+            self.assertEqual(new.ca, successor)
+            self.assertEqual(new.predecessor_id, cert.pk)
+            self.assertEqual(force_text(new.private_key), force_text(cert.private_key))
+            new._verify_ca()
+        # certificates of the old CA are left untouched
+        self.assertEqual(Cert.objects.filter(ca=ca).count(), 5)
+        self.assertEqual(Cert.objects.filter(ca=ca, revoked=True).count(), 1)
+        self.assertFalse(get_pending(ca).exists())
+
+    def test_resume(self):
+        ca = self._create_ca()
+        certs = [self._create_cert(ca, 'cert{0}'.format(i)) for i in range(2)]
+        successor = ca.renew()
+        # interrupted after the first certificate
+        certs[0].renew(ca=successor)
+        self.assertEqual(list(get_pending(ca)), [certs[1]])
+        # renewals signed by the old CA replace their predecessors
+        renewal = certs[1].renew()
+        self.assertEqual(list(get_pending(ca)), [renewal])
+        report = rollover_ca(ca, successor=successor, processes=1)
+        self.assertEqual(report['renewed'], 1)
+        self.assertEqual(Cert.objects.filter(ca=successor).count(), 2)
+
+    def test_keyless(self):
+        ca = self._create_ca()
+        key = crypto.PKey()
+        key.generate_key(crypto.TYPE_RSA, 1024)
+        request = crypto.X509Req()
+        request.get_subject().commonName = 'csr.org'
+        request.set_pubkey(key)
+        request.sign(key, 'sha256')
+        csr = crypto.dump_certificate_request(crypto.FILETYPE_PEM, request).decode()
+        cert = Cert.objects.get(pk=issue_certs(ca, [{'csr': csr}])[0]['id'])
+        report = rollover_ca(ca, processes=1)
+        self.assertEqual(report['renewed'], 1)
+        new = Cert.objects.get(pk=report['successors'][cert.pk])
+        self.assertFalse(new.private_key)
+        self.assertEqual(crypto.dump_publickey(crypto.FILETYPE_PEM, new.x509.get_pubkey()),
+                         crypto.dump_publickey(crypto.FILETYPE_PEM, key))
+        new._verify_ca()
+
+    def test_command_unrecoverable(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        self._create_cert(ca, 'other')
+        Cert.objects.filter(pk=cert.pk).update(private_key='', certificate='invalid')
+        out = StringIO()
+        with self.assertRaises(CommandError) as context:
+            call_command('rollover_ca', str(ca.pk), processes=1, stdout=out)
+        self.assertIn('cert {0}: '.format(cert.pk), out.getvalue())
+        self.assertIn('(unrecoverable)', out.getvalue())
+        message = str(context.exception)
+        self.assertIn('certificates {0} would fail again'.format(cert.pk), message)
+        self.assertNotIn('--resume', message)
+
+    def test_command_rate_limited(self):
+        ca = self._create_ca()
+        for i in range(2):
+            self._create_cert(ca, 'cert{0}'.format(i))
+        cache.clear()
+        # the successor and one certificate
+        setattr(app_settings, 'RATE_LIMITS', {'issue': (0.001, 2)})
+        out = StringIO()
+        try:
+            with self.assertRaises(CommandError) as context:
+                call_command('rollover_ca', str(ca.pk), processes=1, stdout=out)
+        finally:
+            setattr(app_settings, 'RATE_LIMITS', {})
+            cache.clear()
+        self.assertIn('RateLimitExceeded', out.getvalue())
+        self.assertNotIn('(unrecoverable)', out.getvalue())
+        self.assertIn('run again with --resume to retry 1 of them', str(context.exception))
+        call_command('rollover_ca', str(ca.pk), processes=1, resume=True, stdout=out)
+        self.assertEqual(Cert.objects.filter(ca=ca.successors.get()).count(), 2)
+
+    def test_command(self):
+        ca = self._create_ca()
+        for i in range(2):
+            self._create_cert(ca, 'cert{0}'.format(i))
+        out = StringIO()
+        call_command('rollover_ca', str(ca.pk), processes=1, verbosity=2, stdout=out)
+        self.assertIn('Re-issued 2 certificates', out.getvalue())
+        self.assertIn('2/2', out.getvalue())
+        successor = ca.successors.get()
+        self.assertEqual(Cert.objects.filter(ca=successor).count(), 2)
+        call_command('rollover_ca', str(ca.pk), processes=1, resume=True, stdout=out)
+        self.assertEqual(ca.successors.count(), 1)
+        self.assertIn('Re-issued 0 certificates', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('rollover_ca', str(successor.pk), resume=True, stdout=out)
+        with self.assertRaises(CommandError):
+            call_command('rollover_ca', '0', stdout=out)
@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import router
+from django.test import TestCase, override_settings
+from OpenSSL import crypto
+
+from .. import settings as app_settings
+from ..models import Ca, Cert
+from ..routers import _state, recently_written, use_replica
+
+
+@override_settings(DATABASE_ROUTERS=['django_x509.routers.ReplicaRouter'])
+class TestReplicaRouter(TestCase):
+    """
+    tests for django_x509.routers (the test settings
+    define a "replica" database which is not replicated)
+    """
+    multi_db = True
+
+    def setUp(self):
+        cache.clear()
+        _state.last_write = 0
+        setattr(app_settings, 'REPLICA_DATABASE', 'replica')
+        setattr(app_settings, 'REPLICA_STICKY_SECONDS', 0)
+
+    def tearDown(self):
+        setattr(app_settings, 'REPLICA_DATABASE', None)
+        setattr(app_settings, 'REPLICA_STICKY_SECONDS', 5)
+
+    def _create_ca(self):
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        return ca
+
+    def _create_cert(self, ca):
+        cert = Cert(name='cert', ca=ca, key_length='1024', common_name='cert')
+        cert.save()
+        return cert
+
+    def _replicate(self, *objects):
+        for obj in objects:
+            obj.save(using='replica', force_insert=True)
+
+    def _revoked_in_crl_view(self, ca):
+        response = self.client.get(reverse('x509:crl', args=[ca.pk]))
+        self.assertEqual(response.status_code, 200)
+        crl = crypto.load_crl(crypto.FILETYPE_PEM, response.content)
+        return len(crl.get_revoked() or [])
+
+    def test_use_replica(self):
+        self._create_ca()
+        self.assertEqual(Ca.objects.count(), 1)
+        with use_replica():
+            self.assertEqual(Ca.objects.count(), 0)
+            self.assertEqual(Ca.objects.db, 'replica')
+        self.assertEqual(Ca.objects.db, 'default')
+
+    def test_not_configured(self):
+        setattr(app_settings, 'REPLICA_DATABASE', None)
+        with use_replica():
+            self.assertEqual(Ca.objects.db, 'default')
+
+    def test_writes_on_primary(self):
+        with use_replica():
+            ca = self._create_ca()
+            self._create_cert(ca)
+            # reads stick to the primary after a write
+            self.assertEqual(Ca.objects.db, 'default')
+        self.assertEqual(Cert.objects.using('default').count(), 1)
+        self.assertEqual(Cert.objects.using('replica').count(), 0)
+
+    def test_sticky(self):
+        setattr(app_settings, 'REPLICA_STICKY_SECONDS', 5)
+        self.assertFalse(recently_written())
+        self._create_ca()
+        self.assertTrue(recently_written())
+        with use_replica():
+            self.assertEqual(Ca.objects.db, 'default')
+
+    def test_sticky_per_ca(self):
+        setattr(app_settings, 'REPLICA_STICKY_SECONDS', 5)
+        ca, other = self._create_ca(), self._create_ca()
+        cert = self._create_cert(ca)
+        # choosing the database for writing is not a write
+        _state.last_write = 0
+        cache.clear()
+        router.db_for_write(Cert, instance=cert)
+        self.assertFalse(recently_written(ca.pk))
+        # writes of other threads or processes only concern their CA
+        cert.revoke()
+        _state.last_write = 0
+        self.assertTrue(recently_written(ca.pk))
+        self.assertFalse(recently_written(other.pk))
+        self.assertFalse(recently_written())
+        with use_replica(other.pk):
+            self.assertEqual(Ca.objects.db, 'replica')
+        with use_replica(ca.pk):
+            self.assertEqual(Ca.objects.db, 'default')
+
+    def test_crl_view(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        self._replicate(ca, cert)
+        cert.revoke()
+        # replica is lagging behind
+        self.assertEqual(self._revoked_in_crl_view(ca), 0)
+
+    def test_crl_view_sticky(self):
+        setattr(app_settings, 'REPLICA_STICKY_SECONDS', 5)
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        self._replicate(ca, cert)
+        cert.revoke()
+        self.assertEqual(self._revoked_in_crl_view(ca), 1)
+
+    def test_admin_changelist(self):
+        get_user_model().objects.create_superuser('admin', 'admin@test.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self._create_cert(self._create_ca())
+        response = self.client.get(reverse('admin:django_x509_cert_changelist'))
+        self.assertEqual(response.context_data['cl'].result_count, 0)
+        setattr(app_settings, 'REPLICA_DATABASE', None)
+        response = self.client.get(reverse('admin:django_x509_cert_changelist'))
+        self.assertEqual(response.context_data['cl'].result_count, 1)
@@ -0,0 +1,56 @@
+from django.test import TestCase
+from django.utils.encoding import force_text
+
+from ..backends import get_backend
+from ..backends.pyopenssl import PyOpenSSLBackend
+from ..models import Ca, Cert
+from ..testing import (create_ca, create_cert, install_key_fixtures,
+                       reset_key_fixtures, uninstall_key_fixtures)
+
+
+class TestTesting(TestCase):
+    """
+    tests for django_x509.testing (the test suite
+    runs with django_x509.testing.KeyFixturesTestRunner)
+    """
+    def _pem(self, key):
+        return force_text(get_backend().dump_private_key(key))
+
+    def test_key_fixtures(self):
+        backend = get_backend()
+        keys = [self._pem(backend.generate_key(1024)) for i in range(9)]
+        self.assertEqual(len(set(keys)), 8)
+        self.assertEqual(keys[0], keys[8])
+        # each test is served the same keys
+        reset_key_fixtures()
+        self.assertEqual(self._pem(backend.generate_key(1024)), keys[0])
+        # lengths without fixtures are generated
+        self.assertNotEqual(self._pem(backend.generate_key(512)),
+                            self._pem(backend.generate_key(512)))
+
+    def test_uninstall(self):
+        patched = PyOpenSSLBackend.generate_key
+        uninstall_key_fixtures()
+        try:
+            self.assertNotEqual(PyOpenSSLBackend.generate_key, patched)
+            backend = get_backend()
+            self.assertNotEqual(self._pem(backend.generate_key(1024)),
+                                self._pem(backend.generate_key(1024)))
+        finally:
+            install_key_fixtures()
+        reset_key_fixtures()
+        first = self._pem(get_backend().generate_key(1024))
+        reset_key_fixtures()
+        self.assertEqual(self._pem(get_backend().generate_key(1024)), first)
+
+    def test_factories(self):
+        ca = create_ca(key_length='1024')
+        cert = create_cert(ca, common_name='device.example.com', key_length='1024')
+        self.assertEqual(Ca.objects.get().common_name, 'ca.example.com')
+        self.assertEqual(cert.x509.get_subject().commonName, 'device.example.com')
+        self.assertEqual(cert.x509.get_pubkey().bits(), 1024)
+        cert._verify_ca()
+        self.assertNotEqual(force_text(cert.private_key), force_text(ca.private_key))
+        create_cert(key_length='1024')
+        self.assertEqual(Ca.objects.count(), 2)
+        self.assertEqual(Cert.objects.count(), 2)
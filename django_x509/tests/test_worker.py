@@ -0,0 +1,150 @@
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from .. import settings as app_settings
+from ..batch import issue_certs
+from ..models import Ca, Cert, Job
+
+
+class TestWorker(TestCase):
+    """
+    tests for asynchronous issuance and the x509_worker command
+    """
+    def setUp(self):
+        setattr(app_settings, 'ASYNC_ISSUANCE', True)
+
+    def tearDown(self):
+        setattr(app_settings, 'ASYNC_ISSUANCE', False)
+        setattr(app_settings, 'JOB_MAX_ATTEMPTS', 5)
+
+    def _create_ca(self):
+        ca = Ca(name='ca', key_length='1024', common_name='ca')
+        ca.save()
+        return ca
+
+    def _create_cert(self, ca):
+        cert = Cert(name='cert', ca=ca, key_length='1024', common_name='cert')
+        cert.save()
+        return cert
+
+    def _work(self):
+        out = StringIO()
+        call_command('x509_worker', once=True, stdout=out)
+        return out.getvalue()
+
+    def test_pending(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        for instance in (ca, cert):
+            self.assertEqual(instance.status, 'pending')
+            self.assertEqual(instance.certificate, '')
+        # serial numbers are allocated when the jobs are queued
+        self.assertEqual([ca.serial_number, cert.serial_number], [1, 2])
+        self.assertEqual(Job.objects.filter(state='queued').count(), 2)
+        self.assertIn('2 jobs processed', self._work())
+        self.assertEqual(Job.objects.filter(state='done').count(), 2)
+        ca = Ca.objects.get(pk=ca.pk)
+        cert = Cert.objects.get(pk=cert.pk)
+        self.assertEqual(ca.status, 'issued')
+        self.assertEqual(cert.status, 'issued')
+        self.assertEqual(int(cert.x509.get_serial_number()), cert.serial_number)
+        self.assertEqual(ca.chain, ca.certificate)
+        cert._verify_ca()
+
+    def test_disabled(self):
+        setattr(app_settings, 'ASYNC_ISSUANCE', False)
+        cert = self._create_cert(self._create_ca())
+        self.assertEqual(cert.status, 'issued')
+        self.assertFalse(Job.objects.exists())
+
+    def test_pending_issuer(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca)
+        job = Job.objects.get(model='cert')
+        Job.objects.filter(pk=job.pk).update(state='running')
+        job.run()
+        self.assertEqual(job.state, 'queued')
+        self.assertIn('not issued yet', job.error)
+        job = Job.objects.get(pk=job.pk)
+        self.assertGreater(job.available_at, timezone.now())
+        self.assertEqual(Cert.objects.get(pk=cert.pk).status, 'pending')
+
+    def test_claim(self):
+        self._create_ca()
+        jobs = Job.objects.claim(worker='a')
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0].state, 'running')
+        self.assertEqual(jobs[0].worker, 'a')
+        self.assertEqual(jobs[0].attempts, 1)
+        self.assertEqual(Job.objects.claim(worker='b'), [])
+        # the lease of worker "a" expires (eg: it crashed)
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        jobs = Job.objects.claim(worker='b')
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0].worker, 'b')
+        self.assertEqual(jobs[0].attempts, 2)
+
+    def test_failure(self):
+        ca = self._create_ca()
+        Ca.objects.filter(pk=ca.pk).update(key_length='wrong')
+        job = Job.objects.claim()[0]
+        job.run()
+        self.assertEqual(job.state, 'queued')
+        self.assertIn('Error', job.error)
+        setattr(app_settings, 'JOB_MAX_ATTEMPTS', 2)
+        Job.objects.update(available_at=timezone.now())
+        job = Job.objects.claim()[0]
+        job.run()
+        self.assertEqual(job.state, 'failed')
+        self.assertEqual(Ca.objects.get(pk=ca.pk).status, 'failed')
+
+    def test_deleted(self):
+        ca = self._create_ca()
+        ca.delete()
+        self._work()
+        self.assertEqual(Job.objects.get().state, 'done')
+
+    def test_concurrent_change(self):
+        ca = self._create_ca()
+        self._work()
+        cert = self._create_cert(Ca.objects.get(pk=ca.pk))
+        job = Job.objects.claim()[0]
+        instance = job.get_instance()
+        job.get_instance = lambda: instance
+        # changed after the instance has been loaded by the worker
+        Cert.objects.filter(pk=cert.pk).update(revoked=True)
+        job.run()
+        cert = Cert.objects.get(pk=cert.pk)
+        self.assertEqual(cert.status, 'issued')
+        self.assertTrue(cert.certificate)
+        self.assertTrue(cert.revoked)
+
+    def test_revoke_stale(self):
+        ca = self._create_ca()
+        self._work()
+        stale = self._create_cert(Ca.objects.get(pk=ca.pk))
+        # pending certificates can't be revoked
+        with self.assertRaises(ValueError):
+            stale.revoke()
+        self._work()
+        # the instance loaded before the certificate was issued
+        # doesn't overwrite the data written by the worker
+        stale.revoke()
+        cert = Cert.objects.get(pk=stale.pk)
+        self.assertEqual(cert.status, 'issued')
+        self.assertTrue(cert.certificate)
+        self.assertTrue(cert.revoked)
+        self.assertEqual(Job.objects.filter(state='done').count(), 2)
+
+    def test_batch(self):
+        ca = self._create_ca()
+        self._work()
+        results = issue_certs(Ca.objects.get(pk=ca.pk), [{'common_name': 'device1', 'key_length': '1024'}])
+        self.assertEqual(results[0]['status'], 'pending')
+        self.assertEqual(results[0]['certificate'], '')
+        self._work()
+        self.assertEqual(Cert.objects.get(pk=results[0]['id']).status, 'issued')
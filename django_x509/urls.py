@@ -4,4 +4,10 @@ from . import views
 
 urlpatterns = [
     url(r'^x509/ca/(?P<pk>[^/]+).crl$', views.crl, name='crl'),
+    url(r'^x509/ca/(?P<pk>[^/]+).bloom$', views.revoked_filter, name='revoked_filter'),
+    url(r'^x509/ca/(?P<pk>[^/]+)/issue$', views.issue, name='issue'),
+    url(r'^x509/ca/(?P<pk>[^/]+)/revoke$', views.revoke, name='revoke'),
+    url(r'^x509/changes/(?P<model>ca|cert)$', views.changes, name='changes'),
+    url(r'^x509/metrics$', views.metrics_view, name='metrics'),
+    url(r'^x509/rate-limits$', views.rate_limits, name='rate_limits'),
 ]
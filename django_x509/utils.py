@@ -1,6 +1,15 @@
 import sys
+import threading
+import time
+from collections import OrderedDict
+from importlib import import_module
 
 import six
+from django.utils.functional import SimpleLazyObject
+
+# OpenSSL.crypto is imported on first use in order to
+# keep it out of processes that never deal with certificates
+crypto = SimpleLazyObject(lambda: import_module('OpenSSL.crypto'))
 
 
 def bytes_compat(string, encoding='utf8'):
@@ -10,3 +19,47 @@ def bytes_compat(string, encoding='utf8'):
         return bytes(string, encoding)
     else:
         return bytes(string)
+
+
+class LRUCache(object):
+    """
+    thread safe in-process cache which holds up to ``maxsize``
+    items, each of which expires after ``ttl`` seconds
+    """
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.time():
+                del self._data[key]
+                return default
+            # move to the end (most recently used)
+            del self._data[key]
+            self._data[key] = item
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + self.ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
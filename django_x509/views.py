@@ -1,19 +1,168 @@
-from django.http import HttpResponse
+import json
+import math
+from timeit import default_timer
+
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext_lazy as _
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
+from . import metrics
 from . import settings as app_settings
-from .models import Ca
+from .batch import issue_certs, revoke_certs
+from .feed import get_changes
+from .models import Ca, Job
+from .ratelimit import RateLimitExceeded, get_stats
+from .routers import replica_view
 
 
+@replica_view
 def crl(request, pk):
     """
     returns CRL of a CA
     """
+    start = default_timer()
+    ca = None
+    if app_settings.CRL_PROTECTED and not request.user.is_authenticated():
+        response = HttpResponse(_('Forbidden'),
+                                status=403,
+                                content_type='text/plain')
+    else:
+        try:
+            ca = Ca.objects.get_cached(pk)
+        except (Ca.DoesNotExist, ValueError):
+            response = HttpResponse(_('Not found'),
+                                    status=404,
+                                    content_type='text/plain')
+        else:
+            try:
+                response = HttpResponse(ca.get_cached_crl(),
+                                        status=200,
+                                        content_type='application/x-pem-file')
+            except RateLimitExceeded as e:
+                response = HttpResponse(str(e), status=429, content_type='text/plain')
+                response['Retry-After'] = int(math.ceil(e.retry_after))
+    # requests which don't resolve a CA share one label, hence
+    # clients can't create new metric series with arbitrary pks
+    label = ca.pk if ca else 'unknown'
+    metrics.crl_view_seconds.observe(default_timer() - start, ca=label)
+    metrics.crl_requests_total.inc(ca=label, status=response.status_code)
+    return response
+
+
+@replica_view
+def revoked_filter(request, pk):
+    """
+    returns the bloom filter of revoked serial numbers of a CA
+    """
     if app_settings.CRL_PROTECTED and not request.user.is_authenticated():
         return HttpResponse(_('Forbidden'),
                             status=403,
                             content_type='text/plain')
-    ca = Ca.objects.get(pk=pk)
-    return HttpResponse(ca.crl,
+    ca = get_object_or_404(Ca, pk=pk)
+    return HttpResponse(ca.get_revoked_filter().to_bytes(),
+                        status=200,
+                        content_type='application/octet-stream')
+
+
+def metrics_view(request):
+    """
+    returns PKI metrics in the prometheus text format
+    """
+    if not app_settings.METRICS_ENABLED:
+        raise Http404()
+    if app_settings.METRICS_PROTECTED and not request.user.is_staff:
+        return HttpResponse(_('Forbidden'),
+                            status=403,
+                            content_type='text/plain')
+    return HttpResponse(metrics.render(),
                         status=200,
-                        content_type='application/x-pem-file')
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def changes(request, model):
+    """
+    returns the change feed of CAs or certificates
+    (see ``django_x509.feed.get_changes``)
+    """
+    if not request.user.is_staff:
+        return HttpResponse(_('Forbidden'),
+                            status=403,
+                            content_type='text/plain')
+    try:
+        results, cursor, more = get_changes(model,
+                                            cursor=request.GET.get('cursor'),
+                                            limit=request.GET.get('limit'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'results': results, 'cursor': cursor, 'more': more})
+
+
+def rate_limits(request):
+    """
+    returns the state of the rate limits of all the CAs
+    (and of the CA specified in the ``ca`` parameter)
+    and the number of pending issuance jobs
+    """
+    if not request.user.is_staff:
+        return HttpResponse(_('Forbidden'),
+                            status=403,
+                            content_type='text/plain')
+    ca = None
+    if request.GET.get('ca'):
+        ca = get_object_or_404(Ca, pk=request.GET['ca'])
+    return JsonResponse({'limits': get_stats(ca),
+                         'jobs': {'queued': Job.objects.filter(state='queued').count(),
+                                  'running': Job.objects.filter(state='running').count()}})
+
+
+def _batch(request, pk, permission, key, process):
+    """
+    passes the list found in ``key`` of the JSON
+    body of ``request`` to ``process`` along with the CA
+    """
+    if not request.user.has_perm(permission):
+        return HttpResponse(_('Forbidden'),
+                            status=403,
+                            content_type='text/plain')
+    if request.META.get('CONTENT_TYPE', '').split(';')[0] != 'application/json':
+        return JsonResponse({'error': 'content type must be application/json'}, status=415)
+    try:
+        items = json.loads(request.body.decode('utf-8'))[key]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'expected a JSON object containing "{0}"'.format(key)},
+                            status=400)
+    if not isinstance(items, list):
+        return JsonResponse({'error': '"{0}" must be a list'.format(key)}, status=400)
+    if len(items) > app_settings.BATCH_MAX_SIZE:
+        return JsonResponse({'error': 'batches are limited to {0} items'.format(
+            app_settings.BATCH_MAX_SIZE)}, status=400)
+    try:
+        ca = Ca.objects.get_cached(pk)
+    except (Ca.DoesNotExist, ValueError):
+        raise Http404()
+    return JsonResponse({'results': process(ca, items)})
+
+
+# the JSON content type can't be sent cross-origin without a CORS
+# preflight, which protects the batch views from CSRF attacks and allows
+# clients which don't use sessions to call them without a CSRF token
+@csrf_exempt
+@require_POST
+def issue(request, pk):
+    """
+    issues a batch of certificates
+    (see ``django_x509.batch.issue_certs``)
+    """
+    return _batch(request, pk, 'django_x509.add_cert', 'certificates', issue_certs)
+
+
+@csrf_exempt
+@require_POST
+def revoke(request, pk):
+    """
+    revokes a batch of certificates
+    (see ``django_x509.batch.revoke_certs``)
+    """
+    return _batch(request, pk, 'django_x509.change_cert', 'serial_numbers', revoke_certs)
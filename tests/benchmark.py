@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+"""
+django-x509 benchmark suite
+
+Measures the hot paths of the app (issuance, short-lived issuance, import,
+CA verification, CRL generation, text dumps, admin rendering and certificate
+listings)
+and prints the results
+as JSON on standard output (or in the file specified with ``--output``).
+
+Run it from the ``tests/`` directory:
+
+    ./benchmark.py
+    ./benchmark.py --key-lengths 1024,2048 --revoked 0,100,1000
+    ./benchmark.py --postgres django_x509_bench --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from timeit import default_timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """
+    registers a benchmark function
+    """
+    BENCHMARKS.append(func)
+    return func
+
+
+def measure(func, iterations, setup=None):
+    """
+    calls ``func`` ``iterations`` times and returns timing statistics (seconds);
+    if ``setup`` is given its return value is passed to ``func``
+    and its execution time is not measured
+    """
+    timings = []
+    for i in range(iterations):
+        arg = setup() if setup else None
+        start = default_timer()
+        func(arg) if setup else func()
+        timings.append(default_timer() - start)
+    timings.sort()
+    total = sum(timings)
+    return OrderedDict((
+        ('iterations', iterations),
+        ('total', total),
+        ('min', timings[0]),
+        ('max', timings[-1]),
+        ('mean', total / iterations),
+        ('median', timings[len(timings) // 2]),
+        ('p99', timings[min(int(len(timings) * 0.99), len(timings) - 1)]),
+    ))
+
+
+def _ca(key_length='2048', digest='sha256', **kwargs):
+    from django_x509.models import Ca
+    ca = Ca(name='benchmark-ca',
+            key_length=key_length,
+            digest=digest,
+            country_code='IT',
+            state='RM',
+            city='Rome',
+            organization='OpenWISP',
+            email='bench@test.com',
+            common_name='benchmark.openwisp.org',
+            **kwargs)
+    ca.save()
+    return ca
+
+
+def _cert(ca, key_length='2048', digest='sha256', **kwargs):
+    from django_x509.models import Cert
+    cert = Cert(name='benchmark-cert',
+                ca=ca,
+                key_length=key_length,
+                digest=digest,
+                country_code='IT',
+                state='RM',
+                city='Rome',
+                organization='OpenWISP',
+                email='bench@test.com',
+                common_name='cert.openwisp.org',
+                **kwargs)
+    cert.save()
+    return cert
+
+
+def _bulk_revoked(ca, count):
+    """
+    inserts ``count`` revoked certificates and their entries in the
+    revocation ledger without generating keys (the CRL only needs
+    serial numbers and revocation times)
+    """
+    from django.utils import timezone
+    from django_x509.models import Cert, Revocation
+    now = timezone.now()
+    offset = 10 ** 6 * (ca.pk or 1)
+    certs = Cert.objects.bulk_create([
+        Cert(name='revoked-{0}'.format(i),
+             ca=ca,
+             serial_number=offset + i,
+             revoked=True,
+             revoked_at=now,
+             certificate='placeholder',
+             private_key='placeholder')
+        for i in range(count)
+    ], batch_size=500)
+    for start in range(0, count, 500):
+        Revocation.record(certs[start:start + 500])
+
+
+@benchmark
+def issuance(args):
+    results = OrderedDict()
+    for key_length in args.key_lengths:
+        for digest in args.digests:
+            label = '[key_length={0},digest={1}]'.format(key_length, digest)
+            results['ca_create' + label] = measure(
+                lambda: _ca(key_length, digest), args.iterations
+            )
+            ca = _ca(key_length, digest)
+            results['cert_create' + label] = measure(
+                lambda: _cert(ca, key_length, digest), args.iterations
+            )
+            cert = _cert(ca, key_length, digest)
+            results['cert_renew' + label] = measure(lambda: cert.renew(), args.iterations)
+    return results
+
+
+@benchmark
+def ephemeral(args):
+    """
+    compares issuance of certificates and of short-lived certificates
+    (signing requests are used to leave key generation out)
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from OpenSSL import crypto
+    from django_x509.models import Cert, IssuanceLog
+    ca = _ca()
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+    request = crypto.X509Req()
+    request.get_subject().commonName = 'ephemeral.openwisp.org'
+    request.set_pubkey(key)
+    request.sign(key, 'sha256')
+    csr = crypto.dump_certificate_request(crypto.FILETYPE_PEM, request).decode()
+
+    def queries(func):
+        with CaptureQueriesContext(connection) as context:
+            for i in range(args.iterations):
+                func()
+            IssuanceLog.flush()
+        return len(context.captured_queries) / float(args.iterations)
+
+    def cert():
+        Cert(ca=ca).sign_request(csr)
+
+    def short_lived():
+        ca.issue_ephemeral(csr=csr)
+
+    results = OrderedDict((
+        ('cert_sign_request', measure(cert, args.iterations)),
+        ('issue_ephemeral', measure(short_lived, args.iterations)),
+    ))
+    results['cert_sign_request']['queries'] = queries(cert)
+    results['issue_ephemeral']['queries'] = queries(short_lived)
+    return results
+
+
+@benchmark
+def import_and_verify(args):
+    from django_x509.models import Cert
+    ca = _ca()
+    cert = _cert(ca)
+
+    def new_instance():
+        return Cert(ca=ca,
+                    certificate=cert.certificate,
+                    private_key=cert.private_key)
+
+    return OrderedDict((
+        ('import', measure(lambda c: c._import(), args.iterations, setup=new_instance)),
+        ('verify_ca', measure(lambda c: c._verify_ca(), args.iterations, setup=new_instance)),
+    ))
+
+
+@benchmark
+def crl(args):
+    from django_x509.models import Ca
+    results = OrderedDict()
+    for count in args.revoked:
+        ca = _ca()
+        _bulk_revoked(ca, count)
+        results['crl[revoked={0}]'.format(count)] = measure(
+            lambda c: c.crl, args.iterations, setup=lambda: Ca.objects.get(pk=ca.pk)
+        )
+    return results
+
+
+@benchmark
+def x509_text(args):
+    from django_x509.models import Cert
+    cert = _cert(_ca())
+    return {'x509_text': measure(lambda c: c.x509_text,
+                                 args.iterations,
+                                 setup=lambda: Cert.objects.get(pk=cert.pk))}
+
+
+@benchmark
+def admin(args):
+    from django.contrib.auth import get_user_model
+    from django.core.urlresolvers import reverse
+    from django.test import Client
+    User = get_user_model()
+    if not User.objects.filter(username='benchmark').exists():
+        User.objects.create_superuser('benchmark', 'bench@test.com', 'benchmark')
+    client = Client()
+    client.login(username='benchmark', password='benchmark')
+    ca = _ca()
+    _bulk_revoked(ca, args.changelist_rows)
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+
+    cert_url = reverse('admin:django_x509_cert_changelist')
+    ca_url = reverse('admin:django_x509_ca_changelist')
+    return OrderedDict((
+        ('admin_cert_changelist', measure(lambda: get(cert_url), args.iterations)),
+        ('admin_ca_changelist', measure(lambda: get(ca_url), args.iterations)),
+    ))
+
+
+def _peak_memory(func):
+    """
+    returns the peak of the memory allocated while running ``func``
+    (bytes, ``None`` if ``tracemalloc`` is not available)
+    """
+    try:
+        import tracemalloc
+    except ImportError:  # python 2
+        func()
+        return None
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@benchmark
+def summaries(args):
+    """
+    compares listing the certificates of a CA as model
+    instances and as ``CertSummary`` records
+    """
+    from django_x509.models import Cert
+    ca = _ca()
+    sample = _cert(ca, extensions=[{'name': 'extendedKeyUsage',
+                                    'critical': False,
+                                    'value': 'clientAuth'}])
+    rows = args.summary_rows
+    Cert.objects.bulk_create([
+        Cert(name='summary-{0}'.format(i),
+             ca=ca,
+             common_name='summary-{0}'.format(i),
+             serial_number=10 ** 6 + i,
+             extensions=sample.extensions,
+             certificate=sample.certificate,
+             private_key=sample.private_key)
+        for i in range(rows)
+    ], batch_size=500)
+    rows += 1
+
+    def instances():
+        return list(ca.cert_set.all().iterator())
+
+    def records():
+        return list(ca.iter_cert_summaries())
+
+    results = OrderedDict((
+        ('list_instances[rows={0}]'.format(rows), measure(instances, args.iterations)),
+        ('list_summaries[rows={0}]'.format(rows), measure(records, args.iterations)),
+    ))
+    for name, func in (('instances', instances), ('summaries', records)):
+        peak = _peak_memory(func)
+        results['memory_per_row[{0}]'.format(name)] = peak // rows if peak is not None else None
+    return results
+
+
+@benchmark
+def backends(args):
+    """
+    compares the crypto backends on the same operations
+    """
+    from django_x509 import settings as app_settings
+    from django_x509.models import Ca, Cert
+    results = OrderedDict()
+    original = app_settings.CRYPTO_BACKEND
+    try:
+        for path in args.backends:
+            app_settings.CRYPTO_BACKEND = path
+            label = '[backend={0}]'.format(path.rsplit('.', 1)[-1])
+            ca = _ca()
+            results['ca_create' + label] = measure(lambda: _ca(), args.iterations)
+            results['cert_create' + label] = measure(lambda: _cert(ca), args.iterations)
+            cert = _cert(ca)
+
+            def new_instance():
+                return Cert(ca=ca,
+                            certificate=cert.certificate,
+                            private_key=cert.private_key)
+
+            results['import' + label] = measure(lambda c: c._import(),
+                                                args.iterations, setup=new_instance)
+            results['verify_ca' + label] = measure(lambda c: c._verify_ca(),
+                                                   args.iterations, setup=new_instance)
+            crl_ca = _ca()
+            _bulk_revoked(crl_ca, max(args.revoked))
+            results['crl[revoked={0}]{1}'.format(max(args.revoked), label)] = measure(
+                lambda c: c.crl, args.iterations, setup=lambda: Ca.objects.get(pk=crl_ca.pk)
+            )
+            results['x509_text' + label] = measure(lambda c: c.x509_text, args.iterations,
+                                                   setup=lambda: Cert.objects.get(pk=cert.pk))
+    finally:
+        app_settings.CRYPTO_BACKEND = original
+    return results
+
+
+def _int_list(value):
+    return [int(i) for i in value.split(',') if i]
+
+
+def _str_list(value):
+    return [i for i in value.split(',') if i]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='django-x509 benchmark suite')
+    parser.add_argument('--iterations', type=int, default=10,
+                        help='iterations for each measurement (default: %(default)s)')
+    parser.add_argument('--key-lengths', type=_str_list, default=['1024', '2048', '4096'],
+                        help='comma separated key lengths (default: 1024,2048,4096)')
+    parser.add_argument('--digests', type=_str_list, default=['sha1', 'sha256', 'sha512'],
+                        help='comma separated digest algorithms (default: sha1,sha256,sha512)')
+    parser.add_argument('--revoked', type=_int_list, default=[0, 100, 1000, 10000],
+                        help='comma separated revoked certificate counts used '
+                             'for CRL benchmarks (default: 0,100,1000,10000)')
+    parser.add_argument('--changelist-rows', type=int, default=1000,
+                        help='certificates present when rendering '
+                             'the admin changelist (default: %(default)s)')
+    parser.add_argument('--summary-rows', type=int, default=10000,
+                        help='certificates listed by the "summaries" group (default: %(default)s)')
+    parser.add_argument('--backends', type=_str_list,
+                        default=['django_x509.backends.pyopenssl.PyOpenSSLBackend',
+                                 'django_x509.backends.cryptography.CryptographyBackend'],
+                        help='comma separated crypto backends compared by the "backends" group')
+    parser.add_argument('--only', type=_str_list, default=[],
+                        help='comma separated benchmark groups to run ({0})'.format(
+                            ','.join(f.__name__ for f in BENCHMARKS)))
+    parser.add_argument('--postgres', metavar='DBNAME',
+                        help='run against a local PostgreSQL database instead of SQLite '
+                             '(connection parameters are read from the PG* environment variables)')
+    parser.add_argument('--output', help='write JSON results to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    import django
+    from django.conf import settings
+    if args.postgres:
+        settings.DATABASES['default'] = {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': args.postgres,
+            'USER': os.environ.get('PGUSER', ''),
+            'PASSWORD': os.environ.get('PGPASSWORD', ''),
+            'HOST': os.environ.get('PGHOST', ''),
+            'PORT': os.environ.get('PGPORT', ''),
+        }
+    django.setup()
+    from django.db import connection
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    import OpenSSL
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases()
+    results = OrderedDict()
+    try:
+        for func in BENCHMARKS:
+            if args.only and func.__name__ not in args.only:
+                continue
+            results.update(func(args))
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+    output = OrderedDict((
+        ('meta', OrderedDict((
+            ('date', datetime.utcnow().isoformat()),
+            ('python', platform.python_version()),
+            ('django', django.get_version()),
+            ('pyopenssl', OpenSSL.__version__),
+            ('database', connection.vendor),
+            ('iterations', args.iterations),
+        ))),
+        ('results', results),
+    ))
+    data = json.dumps(output, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data)
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
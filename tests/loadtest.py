@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+"""
+django-x509 load test
+
+Spawns ``--processes`` processes running ``--threads`` threads each,
+which issue certificates, revoke certificates and download the CRL
+of the same CA concurrently for ``--duration`` seconds, then prints
+throughput, latency percentiles and error counts of each operation
+as JSON on standard output (or in the file specified with ``--output``).
+
+Run it from the ``tests/`` directory:
+
+    ./loadtest.py
+    ./loadtest.py --processes 8 --threads 4 --duration 30 --mix issue=2,revoke=1,crl=5
+    ./loadtest.py --postgres django_x509_load --output results.json
+
+By default a new SQLite database is created in a temporary directory and
+removed at the end; when ``--postgres`` is used the operations only
+touch a new CA, hence existing data is left untouched.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import traceback
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from timeit import default_timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+OPERATIONS = ('issue', 'revoke', 'crl')
+
+
+def configure(database):
+    """
+    points the default database to ``database`` and sets up django
+    (called by the main process and by each worker process)
+    """
+    import django
+    from django.conf import settings
+    settings.DATABASES['default'] = database
+    # host used by django.test.Client
+    settings.ALLOWED_HOSTS = ['testserver']
+    django.setup()
+
+
+def _issue(state):
+    from django_x509.models import Cert
+    cert = Cert(name='load-{0}'.format(state['prefix']),
+                ca_id=state['ca'],
+                key_length=state['key_length'],
+                digest='sha256',
+                common_name='load.openwisp.org')
+    cert.save()
+    state['certs'].append(cert.pk)
+
+
+def _revoke(state):
+    from django_x509.models import Cert
+    if not state['certs']:
+        raise LookupError('no certificates left to revoke')
+    index = state['random'].randrange(len(state['certs']))
+    state['certs'][index], state['certs'][-1] = state['certs'][-1], state['certs'][index]
+    Cert.objects.select_related('ca').get(pk=state['certs'].pop()).revoke()
+
+
+def _crl(state):
+    response = state['client'].get(state['crl_url'])
+    if response.status_code != 200:
+        raise RuntimeError('HTTP {0}'.format(response.status_code))
+
+
+def _thread(args, ca_pk, certs, seed, deadline, samples):
+    from django.core.urlresolvers import reverse
+    from django.db import connection
+    from django.test import Client
+    operations = {'issue': _issue, 'revoke': _revoke, 'crl': _crl}
+    names = [name for name in OPERATIONS for i in range(args.mix.get(name, 0))]
+    state = {
+        'ca': ca_pk,
+        'certs': certs,
+        'client': Client(),
+        'crl_url': reverse('x509:crl', args=[ca_pk]),
+        'key_length': args.key_length,
+        'prefix': seed,
+        'random': random.Random(seed),
+    }
+    try:
+        while default_timer() < deadline:
+            name = state['random'].choice(names)
+            start = default_timer()
+            try:
+                operations[name](state)
+                error = None
+            except Exception as e:
+                error = type(e).__name__
+                if args.verbose:
+                    traceback.print_exc()
+            samples.append((name, default_timer() - start, error))
+    finally:
+        connection.close()
+
+
+def _process(args, database, ca_pk, certs, index, queue):
+    configure(database)
+    deadline = default_timer() + args.duration
+    samples = []
+    threads = []
+    for i in range(args.threads):
+        seed = args.seed * 10000 + index * 100 + i
+        # each thread revokes its own share of the initial certificates
+        share = certs[index * args.threads + i::args.processes * args.threads]
+        thread = threading.Thread(target=_thread,
+                                  args=(args, ca_pk, list(share), seed, deadline, samples))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    queue.put(samples)
+
+
+def _percentile(timings, percent):
+    return timings[min(int(len(timings) * percent), len(timings) - 1)]
+
+
+def report(samples, elapsed):
+    """
+    returns throughput, latency and error statistics of each operation
+    """
+    grouped = defaultdict(list)
+    for sample in samples:
+        grouped[sample[0]].append(sample)
+    results = OrderedDict()
+    for name in OPERATIONS:
+        if name not in grouped:
+            continue
+        timings = sorted(timing for op, timing, error in grouped[name] if error is None)
+        errors = defaultdict(int)
+        for op, timing, error in grouped[name]:
+            if error is not None:
+                errors[error] += 1
+        result = OrderedDict((
+            ('operations', len(grouped[name])),
+            ('successful', len(timings)),
+            ('throughput', len(timings) / elapsed),
+            ('errors', OrderedDict(sorted(errors.items()))),
+        ))
+        if timings:
+            result.update((
+                ('mean', sum(timings) / len(timings)),
+                ('p50', _percentile(timings, 0.5)),
+                ('p99', _percentile(timings, 0.99)),
+                ('max', timings[-1]),
+            ))
+        results[name] = result
+    return results
+
+
+def _mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, weight = item.split('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError('unknown operation: {0}'.format(name))
+        mix[name] = int(weight)
+    return mix
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='django-x509 load test')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='worker processes (default: %(default)s)')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='threads of each worker process (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds of load (default: %(default)s)')
+    parser.add_argument('--mix', type=_mix, default={'issue': 2, 'revoke': 1, 'crl': 2},
+                        help='comma separated weights of the operations '
+                             '(default: issue=2,revoke=1,crl=2)')
+    parser.add_argument('--initial-certs', type=int, default=1000,
+                        help='certificates created before the load starts, which '
+                             'can be revoked by the workers (default: %(default)s)')
+    parser.add_argument('--key-length', default='1024',
+                        help='key length of issued certificates (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='seed of the random choices of the workers (default: %(default)s)')
+    parser.add_argument('--sqlite-timeout', type=float, default=5,
+                        help='seconds SQLite waits for locks (default: %(default)s)')
+    parser.add_argument('--postgres', metavar='DBNAME',
+                        help='run against a local PostgreSQL database instead of SQLite '
+                             '(connection parameters are read from the PG* environment variables)')
+    parser.add_argument('--verbose', action='store_true', help='print the traceback of errors')
+    parser.add_argument('--output', help='write JSON results to this file')
+    return parser.parse_args(argv)
+
+
+def _create_certs(ca, count):
+    """
+    inserts ``count`` certificates without generating keys
+    (revocations and CRLs only need serial numbers)
+    """
+    from django_x509.models import Cert
+    offset = 10 ** 6 * ca.pk
+    Cert.objects.bulk_create([
+        Cert(name='initial-{0}'.format(i),
+             ca=ca,
+             serial_number=offset + i,
+             certificate='placeholder',
+             private_key='placeholder')
+        for i in range(count)
+    ], batch_size=500)
+    return list(Cert.objects.filter(ca=ca).order_by('pk').values_list('pk', flat=True))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tmpdir = None
+    if args.postgres:
+        database = {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': args.postgres,
+            'USER': os.environ.get('PGUSER', ''),
+            'PASSWORD': os.environ.get('PGPASSWORD', ''),
+            'HOST': os.environ.get('PGHOST', ''),
+            'PORT': os.environ.get('PGPORT', ''),
+        }
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='django-x509-load-')
+        database = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(tmpdir, 'load.db'),
+            'OPTIONS': {'timeout': args.sqlite_timeout},
+        }
+    configure(database)
+    import django
+    import OpenSSL
+    from django.core.management import call_command
+    from django.db import connection, connections
+    from django_x509.models import Ca
+    try:
+        call_command('migrate', verbosity=0, interactive=False)
+        ca = Ca(name='load-{0}'.format(datetime.utcnow().isoformat()),
+                key_length=args.key_length,
+                common_name='load.openwisp.org')
+        ca.save()
+        certs = _create_certs(ca, args.initial_certs)
+        vendor = connection.vendor
+        # connections must not be shared with the worker processes
+        connections.close_all()
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_process,
+                                             args=(args, database, ca.pk, certs, i, queue))
+                     for i in range(args.processes)]
+        start = default_timer()
+        for process in processes:
+            process.start()
+        samples = []
+        for process in processes:
+            samples += queue.get()
+        for process in processes:
+            process.join()
+        elapsed = default_timer() - start
+    finally:
+        connections.close_all()
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+    output = OrderedDict((
+        ('meta', OrderedDict((
+            ('date', datetime.utcnow().isoformat()),
+            ('python', platform.python_version()),
+            ('django', django.get_version()),
+            ('pyopenssl', OpenSSL.__version__),
+            ('database', vendor),
+            ('processes', args.processes),
+            ('threads', args.threads),
+            ('duration', elapsed),
+            ('mix', args.mix),
+            ('seed', args.seed),
+        ))),
+        ('results', report(samples, elapsed)),
+    ))
+    data = json.dumps(output, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data)
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
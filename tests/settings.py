@@ -10,6 +10,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': 'djangox509.db',
+    },
+    # not replicated, used by the tests of django_x509.routers
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'djangox509-replica.db',
     }
 }
 
@@ -61,6 +66,10 @@ TEMPLATES = [
     },
 ]
 
+# the test suite reads keys from fixtures (see django_x509.testing),
+# benchmarks and load tests generate them
+TEST_RUNNER = 'django_x509.testing.KeyFixturesTestRunner'
+
 # local settings must be imported before test runner otherwise they'll be ignored
 try:
     from local_settings import *